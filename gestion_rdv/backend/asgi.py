@@ -3,6 +3,10 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The real-time waiting-room feed (``rdv.views.file_attente_flux``, Server-Sent
+Events) keeps connections open and must be served through this application
+(e.g. ``uvicorn backend.asgi:application``) rather than WSGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -64,11 +64,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'rdv.metriques.MetriquesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'rdv.principal.PrincipalMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -113,6 +115,22 @@ DATABASES = {
     }
 }
 
+# Cache Django : versions des disponibilités et grille horaire (rdv/cache_creneaux.py, rdv/horaires.py),
+# marqueurs des réponses 304 (rdv/marqueurs.py), versions du principal en session (rdv/principal.py).
+# Il doit être partagé par tous les processus : avec plusieurs workers (gunicorn, uvicorn --workers),
+# un cache LocMem laisse chaque worker servir ses propres versions périmées. REDIS_URL est donc
+# obligatoire en production, sauf site servi par un seul processus (RDV_PROCESSUS_UNIQUE=1, implicite
+# en DEBUG) ; la vérification rdv.W001 (rdv/checks.py) avertit sinon à chaque commande.
+REDIS_URL = os.environ.get('REDIS_URL', '').strip()
+if REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+RDV_PROCESSUS_UNIQUE = os.environ.get('RDV_PROCESSUS_UNIQUE', '1' if DEBUG else '0') == '1'
+
+# Un seul backend : email (index Utilisateur.email_normalise) ou username, un hachage par tentative
+AUTHENTICATION_BACKENDS = ['rdv.backends.EmailBackend']
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -160,8 +178,42 @@ LOGIN_REDIRECT_URL = '/extranet/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# « Mes rendez-vous » : pagination par clé (taille par défaut, plafond pour ?taille=)
+RDV_LIST_PAGE_SIZE = int(os.environ.get('RDV_LIST_PAGE_SIZE', 50))
+RDV_LIST_PAGE_SIZE_MAX = int(os.environ.get('RDV_LIST_PAGE_SIZE_MAX', 200))
+
+# File d'attente en temps réel (SSE, rdv/temps_reel.py) : seulement si le site est servi par un
+# serveur ASGI (uvicorn backend.asgi:application). Sinon, et sous WSGI / runserver, les écrans
+# interrogent l'état de la file toutes les RDV_SONDAGE_FILE_SECONDES secondes.
+RDV_FLUX_TEMPS_REEL = os.environ.get('RDV_FLUX_TEMPS_REEL', '0') == '1'
+RDV_SONDAGE_FILE_SECONDES = int(os.environ.get('RDV_SONDAGE_FILE_SECONDES', 15))
+
+# Rôle et noms de l'utilisateur (rdv/principal.py) gardés en session entre deux requêtes
+RDV_PRINCIPAL_EN_SESSION = os.environ.get('RDV_PRINCIPAL_EN_SESSION', '1') == '1'
+
+# Grille des créneaux (rdv/horaires.py) : un début de RDV toutes les N minutes, pause comprise
+RDV_PAS_CRENEAU_MINUTES = int(os.environ.get('RDV_PAS_CRENEAU_MINUTES', 50))
+RDV_BATTEMENT_MINUTES = int(os.environ.get('RDV_BATTEMENT_MINUTES', 5))
+# RDV simultanés par créneau (nombre de fauteuils / praticiens) ; Service.capacite peut limiter en plus
+RDV_CAPACITE_CRENEAU = int(os.environ.get('RDV_CAPACITE_CRENEAU', 1))
+
+# Métriques Prometheus (rdv/metriques.py, /metrics) : staff, ou adresses listées ici. Derrière
+# Nginx toutes les requêtes viennent de 127.0.0.1 : en production, ne lister que l'IP du
+# collecteur qui interroge directement le serveur d'application.
+RDV_METRIQUES = os.environ.get('RDV_METRIQUES', '1') == '1'
+RDV_METRIQUES_IPS = [
+    ip.strip() for ip in os.environ.get('RDV_METRIQUES_IPS', '127.0.0.1,::1' if DEBUG else '').split(',') if ip.strip()
+]
+
 # Default from email
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
+# Emails affichés dans la console en développement, envoyés par SMTP sinon
+EMAIL_BACKEND = os.environ.get(
+    'DJANGO_EMAIL_BACKEND',
+    'django.core.mail.backends.console.EmailBackend' if DEBUG else 'django.core.mail.backends.smtp.EmailBackend',
+)
+# Adresse publique du site, pour les liens envoyés par email (invitations de rdv.provisionnement)
+RDV_URL_SITE = os.environ.get('RDV_URL_SITE', 'http://127.0.0.1:8000')
 
 # Production : HTTPS et durcissement
 if not DEBUG:
@@ -0,0 +1,20 @@
+"""
+Réglages des mesures de charge (rdv/benchmarks.py) : ceux du projet, sur SQLite.
+
+Usage (depuis le dossier où se trouve manage.py):
+  python manage.py test rdv.benchmarks --settings=backend.settings_benchmark
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        # En mémoire : `manage.py test` y crée sa base de test, aucun fichier laissé dans le dépôt
+        'NAME': ':memory:',
+    }
+}
+# Quatre fauteuils : de quoi placer des dizaines de milliers de RDV sur un horizon réaliste
+RDV_CAPACITE_CRENEAU = 4
+RDV_METRIQUES = False
+# Mesures dans le seul processus de `manage.py test` : le cache LocMem suffit
+RDV_PROCESSUS_UNIQUE = True
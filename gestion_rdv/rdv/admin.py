@@ -1,44 +1,60 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.translation import gettext_lazy as _
 from .models import (
     Rendez_vous, Utilisateur, Service, CreneauHoraire,
-    Patient, Compte, FileAttente, JourFermeture, HoraireCabinet
+    Patient, Compte, FileAttente, JourFermeture, HoraireCabinet,
+    update_rendez_vous,
 )
 
 
+def _signaler_refuses(modeladmin, request, refuses):
+	"""RDV annulés laissés tels quels : leur créneau n'a plus de poste libre."""
+	if refuses:
+		modeladmin.message_user(
+			request,
+			_('%(nombre)d rendez-vous annulés non réactivés, créneau complet : %(ids)s')
+			% {'nombre': len(refuses), 'ids': ', '.join(map(str, refuses))},
+			level=messages.WARNING,
+		)
+
+
 def make_confirmed(modeladmin, request, queryset):
-	updated = queryset.update(status='confirmed')
+	refuses = []
+	updated = update_rendez_vous(queryset, refuses=refuses, status='confirmed')
 	modeladmin.message_user(request, _('%d rendez-vous marqués comme "confirmed"') % updated)
+	_signaler_refuses(modeladmin, request, refuses)
 
 
 def make_done(modeladmin, request, queryset):
-	updated = queryset.update(status='done')
+	refuses = []
+	updated = update_rendez_vous(queryset, refuses=refuses, status='done')
 	modeladmin.message_user(request, _('%d rendez-vous marqués comme "done"') % updated)
+	_signaler_refuses(modeladmin, request, refuses)
 
 
 def make_cancelled(modeladmin, request, queryset):
-	updated = queryset.update(status='cancelled')
+	updated = update_rendez_vous(queryset, status='cancelled')
 	modeladmin.message_user(request, _('%d rendez-vous marqués comme "cancelled"') % updated)
 
 
 def set_priority_urgent(modeladmin, request, queryset):
-	updated = queryset.update(priority='urgent')
+	updated = update_rendez_vous(queryset, priority='urgent')
 	modeladmin.message_user(request, _('%d rendez-vous passés en priorité "urgent"') % updated)
 
 
 def set_priority_normal(modeladmin, request, queryset):
-	updated = queryset.update(priority='normal')
+	updated = update_rendez_vous(queryset, priority='normal')
 	modeladmin.message_user(request, _('%d rendez-vous passés en priorité "normal"') % updated)
 
 
 def assign_to_me(modeladmin, request, queryset):
-	updated = queryset.update(utilisateur=request.user)
+	updated = update_rendez_vous(queryset, utilisateur=request.user)
 	modeladmin.message_user(request, _('%d rendez-vous assignés à vous') % updated)
 
 
 @admin.register(Service)
 class ServiceAdmin(admin.ModelAdmin):
-	list_display = ('nom', 'duree_minutes', 'description', 'image_url')
+	list_display = ('nom', 'duree_minutes', 'capacite', 'description', 'image_url')
 	search_fields = ('nom',)
 
 
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RdvConfig(AppConfig):
     name = 'rdv'
+
+    def ready(self):
+        from . import checks  # noqa: F401  (enregistre les vérifications système)
@@ -0,0 +1,39 @@
+"""
+Authentification par email (ou nom d'utilisateur), en un seul calcul de hachage par tentative.
+
+L'utilisateur est trouvé par l'index `Utilisateur.email_normalise` (auth_user.email n'est pas
+indexé), sinon par `username` (unique). Email inconnu : on hache quand même le mot de passe
+une fois, pour qu'une tentative échouée coûte le même temps qu'un compte existant.
+"""
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+
+from .models import normaliser_email
+
+
+class EmailBackend(ModelBackend):
+    """Remplace ModelBackend (permissions comprises) : `authenticate(email=...)` ou `username=...`."""
+
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        identifiant = email or username
+        if not identifiant or password is None:
+            return None
+        user = self.utilisateur_pour(identifiant)
+        if user is None:
+            # Même coût qu'une vérification réelle (pas d'énumération des comptes par le temps)
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def utilisateur_pour(self, identifiant):
+        """User dont l'email (normalisé) ou, à défaut, le username vaut `identifiant` (requêtes indexées)."""
+        user = (
+            User.objects.filter(profile__email_normalise=normaliser_email(identifiant))
+            .order_by('pk')
+            .first()
+        )
+        if user is None:
+            user = User.objects.filter(username=identifiant).first()
+        return user
@@ -0,0 +1,144 @@
+"""
+Mesures de charge des chemins chauds (créneaux, file d'attente, tableau agent, « Mes rendez-vous »,
+rapport) à plusieurs volumes du jeu synthétique (rdv.jeu_de_donnees), sur SQLite.
+
+Pour chaque cas : nombre de requêtes SQL et meilleur temps sur REPETITIONS passages à froid
+(cache vidé avant chaque passage). Le test échoue si le nombre de requêtes dépasse la référence
+enregistrée dans benchmarks.json, ou si le temps dépasse référence × RDV_BENCHMARK_TOLERANCE.
+Les temps dépendent de la machine : réenregistrer les références sur celle qui fait foi.
+
+Hors de la suite par défaut (le module ne s'appelle pas test*.py). Usage (depuis le dossier où
+se trouve manage.py) :
+  python manage.py test rdv.benchmarks --settings=backend.settings_benchmark
+  RDV_BENCHMARK_TAILLES=petit,moyen python manage.py test rdv.benchmarks --settings=backend.settings_benchmark
+  RDV_BENCHMARK_ENREGISTRER=1 python manage.py test rdv.benchmarks --settings=backend.settings_benchmark
+"""
+import json
+import os
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .forms import cabinet_local_today, get_creneaux_table_semaine
+from .jeu_de_donnees import Volumes, generer
+from .models import Statistique
+from .provisionnement import provisionner_comptes
+from .views import _queue_ordered
+
+REFERENCES = Path(__file__).with_name('benchmarks.json')
+TOLERANCE = float(os.environ.get('RDV_BENCHMARK_TOLERANCE', 2.0))
+MARGE_SECONDES = 0.005  # bruit de mesure sur les cas de quelques millisecondes
+REPETITIONS = 5
+ENREGISTRER = os.environ.get('RDV_BENCHMARK_ENREGISTRER') == '1'
+
+TAILLES = {
+    'petit': Volumes(utilisateurs=100, services=4, fermetures=4, rdv=1000, jours_passes=180, jours_futurs=60),
+    'moyen': Volumes(utilisateurs=500, services=6, fermetures=8, rdv=5000, jours_passes=450, jours_futurs=90),
+    'grand': Volumes(utilisateurs=2000, services=8, fermetures=12, rdv=20000, jours_passes=900, jours_futurs=120),
+}
+_CHOISIES = set(filter(None, os.environ.get('RDV_BENCHMARK_TAILLES', ','.join(TAILLES)).split(',')))
+
+_mesures = {}  # {taille: {cas: {'requetes': n, 'secondes': s}}}
+
+
+def _lire_references():
+    if not REFERENCES.exists():
+        return {}
+    return json.loads(REFERENCES.read_text(encoding='utf-8'))
+
+
+def tearDownModule():
+    if ENREGISTRER and _mesures:
+        references = _lire_references()
+        references.update(_mesures)
+        REFERENCES.write_text(json.dumps(references, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+
+
+class _Benchmark:
+    """Cas mesurés ; une sous-classe TestCase par taille (données créées une fois par classe)."""
+    taille = None
+
+    @classmethod
+    def setUpTestData(cls):
+        generer(TAILLES[cls.taille])
+        provisionner_comptes([{'username': 'agent-charge', 'role': 'agent'}])
+        cls.agent = User.objects.get(username='agent-charge')
+        # Patient le plus chargé : le premier des poids décroissants du générateur
+        cls.patient = User.objects.filter(username__startswith='charge').order_by('pk').first()
+
+    def setUp(self):
+        self.client_agent = Client()
+        self.client_agent.force_login(self.agent)
+        self.client.force_login(self.patient)
+
+    def _vue(self, client, nom):
+        def appeler():
+            reponse = client.get(reverse(nom))
+            self.assertEqual(reponse.status_code, 200)
+        return appeler
+
+    def _cas(self):
+        today = cabinet_local_today()
+        return {
+            'get_creneaux_table_semaine': get_creneaux_table_semaine,
+            '_queue_ordered': lambda: list(_queue_ordered()),
+            'agent_dashboard': self._vue(self.client_agent, 'agent_dashboard'),
+            'rdv_list': self._vue(self.client, 'rdv_list'),
+            'generer_rapport': Statistique.generer_rapport,
+            'generer_rapport_annee': lambda: Statistique.generer_rapport(today - timedelta(days=365), today),
+        }
+
+    def _mesurer(self, fonction):
+        requetes, meilleur = None, None
+        for _ in range(REPETITIONS):
+            cache.clear()
+            with CaptureQueriesContext(connection) as capture:
+                debut = time.perf_counter()
+                fonction()
+                duree = time.perf_counter() - debut
+            requetes = len(capture) if requetes is None else requetes
+            meilleur = duree if meilleur is None else min(meilleur, duree)
+        return {'requetes': requetes, 'secondes': round(meilleur, 4)}
+
+    def test_chemins_chauds(self):
+        references = _lire_references().get(self.taille, {})
+        mesures = _mesures[self.taille] = {}
+        for nom, fonction in self._cas().items():
+            mesure = mesures[nom] = self._mesurer(fonction)
+            reference = references.get(nom)
+            sys.stderr.write(
+                f"\n[{self.taille}] {nom:<28} {mesure['requetes']:>3} requêtes {mesure['secondes'] * 1000:>9.1f} ms"
+                + (f"  (réf. {reference['requetes']} / {reference['secondes'] * 1000:.1f} ms)" if reference else '')
+            )
+            if ENREGISTRER or reference is None:
+                continue
+            with self.subTest(cas=nom):
+                self.assertLessEqual(mesure['requetes'], reference['requetes'], 'plus de requêtes SQL que la référence')
+                self.assertLessEqual(
+                    mesure['secondes'], reference['secondes'] * TOLERANCE + MARGE_SECONDES,
+                    f"plus de {TOLERANCE:g} × le temps de référence",
+                )
+
+
+@skipUnless('petit' in _CHOISIES, 'taille non demandée (RDV_BENCHMARK_TAILLES)')
+class BenchmarkPetit(_Benchmark, TestCase):
+    taille = 'petit'
+
+
+@skipUnless('moyen' in _CHOISIES, 'taille non demandée (RDV_BENCHMARK_TAILLES)')
+class BenchmarkMoyen(_Benchmark, TestCase):
+    taille = 'moyen'
+
+
+@skipUnless('grand' in _CHOISIES, 'taille non demandée (RDV_BENCHMARK_TAILLES)')
+class BenchmarkGrand(_Benchmark, TestCase):
+    taille = 'grand'
@@ -0,0 +1,174 @@
+"""
+Cache versionné des disponibilités (par jour cabinet + tableau semaine).
+
+Chaque jour local cabinet a son compteur de version ; une réservation, une annulation ou
+un jour de fermeture n’incrémente que les jours touchés. Les données en cache sont rangées
+sous la version courante : une invalidation rend simplement les anciennes clés inaccessibles.
+Le backend est celui de Django (`CACHES`) : Redis partagé par tous les processus en production
+(REDIS_URL), LocMem seulement pour un processus unique (vérification rdv.W001, rdv/checks.py).
+"""
+import hashlib
+import time as _time
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+_TZ_CABINET = ZoneInfo(str(settings.TIME_ZONE))
+
+# Durée de vie des données (les versions, elles, n’expirent pas)
+CRENEAUX_CACHE_TIMEOUT = getattr(settings, 'CRENEAUX_CACHE_TIMEOUT', 3600)
+
+_PREFIXE = 'rdv:creneaux'
+_CLE_VERSION_GLOBALE = f'{_PREFIXE}:v'
+_CLE_VERSION_HORAIRES = f'{_PREFIXE}:v:horaires'
+_CLE_MODIFICATION = f'{_PREFIXE}:modifie'
+
+
+def _cle_version_jour(dte):
+    return f'{_PREFIXE}:v:{dte.isoformat()}'
+
+
+def _cle_jour(dte, version, version_grille):
+    return f'{_PREFIXE}:jour:{dte.isoformat()}:{version}:{version_grille}'
+
+
+def _version_initiale():
+    # Horodatage : après une éviction, on ne retombe jamais sur une ancienne version.
+    return _time.time_ns() // 1000
+
+
+def jour_cabinet(dt):
+    """Date locale cabinet d’un instant (datetime aware) ; une date est renvoyée telle quelle."""
+    if hasattr(dt, 'hour'):
+        return timezone.localtime(dt, _TZ_CABINET).date()
+    return dt
+
+
+def bornes_jour(dte):
+    """Début (inclus) et fin (exclue) du jour cabinet `dte`, en datetimes aware."""
+    start = datetime.combine(dte, time.min, tzinfo=_TZ_CABINET)
+    return start, datetime.combine(dte + timedelta(days=1), time.min, tzinfo=_TZ_CABINET)
+
+
+def _incrementer(cle):
+    try:
+        return cache.incr(cle)
+    except ValueError:
+        v = _version_initiale()
+        cache.set(cle, v, None)
+        return v
+
+
+def _lire_version(cle):
+    v = cache.get(cle)
+    if v is None:
+        v = _version_initiale()
+        if not cache.add(cle, v, None):
+            v = cache.get(cle, v)
+    return v
+
+
+def version_globale():
+    """Version de l’ensemble des disponibilités (change à chaque invalidation)."""
+    return _lire_version(_CLE_VERSION_GLOBALE)
+
+
+def version_horaires():
+    """Version des horaires cabinet et des durées de service (change à chaque enregistrement)."""
+    return _lire_version(_CLE_VERSION_HORAIRES)
+
+
+def versions_jours(dates):
+    """{date: version} pour une liste de dates (une seule lecture groupée)."""
+    cles = {_cle_version_jour(d): d for d in dates}
+    trouvees = cache.get_many(list(cles))
+    out = {}
+    manquantes = {}
+    for cle, dte in cles.items():
+        if cle in trouvees:
+            out[dte] = trouvees[cle]
+        else:
+            manquantes[cle] = _version_initiale()
+    if manquantes:
+        for cle, v in manquantes.items():
+            if not cache.add(cle, v, None):
+                v = cache.get(cle, v)
+            out[cles[cle]] = v
+    return out
+
+
+def lire_jours(versions, version_grille):
+    """
+    {date: données} des jours présents en cache pour les versions données. `version_grille`
+    (version_horaires, lue avant le chargement) périme aussi les jours quand horaires ou durées
+    des services changent.
+    """
+    cles = {_cle_jour(d, v, version_grille): d for d, v in versions.items()}
+    return {cles[k]: val for k, val in cache.get_many(list(cles)).items()}
+
+
+def ecrire_jours(donnees, versions, version_grille):
+    cache.set_many(
+        {_cle_jour(d, versions[d], version_grille): val for d, val in donnees.items()},
+        CRENEAUX_CACHE_TIMEOUT,
+    )
+
+
+def empreinte(versions, *parties):
+    """Empreinte (md5 hex) des versions de jours et des paramètres : change dès qu’un jour change."""
+    jours = ','.join(f'{d.isoformat()}@{v}' for d, v in sorted(versions.items()))
+    extra = ':'.join(str(p) for p in parties)
+    return hashlib.md5(f'{jours}|{extra}'.encode(), usedforsecurity=False).hexdigest()
+
+
+def cle_table(versions, *parties):
+    """Clé du tableau semaine : dépend des versions de chacun de ses jours."""
+    return f'{_PREFIXE}:table:{empreinte(versions, *parties)}'
+
+
+def lire_table(cle):
+    return cache.get(cle)
+
+
+def ecrire_table(cle, table):
+    cache.set(cle, table, CRENEAUX_CACHE_TIMEOUT)
+
+
+def derniere_modification():
+    """Horodatage (secondes) de la dernière invalidation connue, pour Last-Modified."""
+    ts = cache.get(_CLE_MODIFICATION)
+    if ts is None:
+        ts = _time.time()
+        if not cache.add(_CLE_MODIFICATION, ts, None):
+            ts = cache.get(_CLE_MODIFICATION, ts)
+    return ts
+
+
+def _invalider_maintenant(dates):
+    for dte in dates:
+        _incrementer(_cle_version_jour(dte))
+    _incrementer(_CLE_VERSION_GLOBALE)
+    cache.set(_CLE_MODIFICATION, _time.time(), None)
+
+
+def invalider_jours(valeurs):
+    """
+    Invalide les jours touchés (dates ou datetimes aware), après le commit de la transaction
+    en cours : un lecteur ne peut pas remettre en cache un état non encore validé.
+    """
+    dates = {jour_cabinet(v) for v in valeurs if v is not None}
+    if dates:
+        transaction.on_commit(lambda: _invalider_maintenant(dates))
+
+
+def invalider_horaires():
+    """Horaires ou services modifiés : grille compilée, jours et tableaux en cache deviennent obsolètes."""
+    def _invalider():
+        _incrementer(_CLE_VERSION_HORAIRES)
+        _invalider_maintenant(())
+
+    transaction.on_commit(_invalider)
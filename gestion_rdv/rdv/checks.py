@@ -0,0 +1,30 @@
+"""
+Vérifications système (`manage.py check`, runserver, migrate, `check --deploy`).
+
+rdv.W001 : les versions des disponibilités, les marqueurs 304 et les versions du principal
+vivent dans le cache Django. Un cache propre au processus (LocMemCache) n'est correct qu'avec
+un seul processus : il faut un cache partagé (REDIS_URL) ou RDV_PROCESSUS_UNIQUE (vrai par défaut
+en DEBUG, lu dans les réglages car le lanceur de tests force DEBUG à False). Avertissement
+seulement : le site démarre, un serveur mono-processus non déclaré reste correct.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches)
+def verifier_cache_partage(app_configs, **kwargs):
+    if getattr(settings, 'RDV_PROCESSUS_UNIQUE', False):
+        return []
+    if not isinstance(caches['default'], LocMemCache):
+        return []
+    return [
+        Warning(
+            "Le cache 'default' est propre au processus (LocMemCache) : avec plusieurs workers, "
+            "chacun servirait des disponibilités, des réponses 304 et des rôles périmés.",
+            hint="Définir REDIS_URL (cache partagé), ou RDV_PROCESSUS_UNIQUE=1 si le site "
+                 "est servi par un seul processus.",
+            id='rdv.W001',
+        )
+    ]
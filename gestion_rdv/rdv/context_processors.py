@@ -1,23 +1,20 @@
 """Context processor: nom d'affichage pour l'espace patient (pas l'email)."""
+from django.conf import settings
+
+from .principal import get_principal
+from .temps_reel import flux_disponible
 
 
 def user_display_name(request):
-    """Ajoute user_display_name: prénom/nom ou partie avant @, jamais l'email brut."""
-    out = {}
-    if request.user.is_authenticated:
-        nom = None
-        try:
-            nom = (getattr(request.user.patient_profile, 'nom', None) or '').strip() or nom
-        except Exception:
-            pass
-        try:
-            nom = (getattr(request.user.profile, 'nom', None) or '').strip() or nom
-        except Exception:
-            pass
-        if not nom and (request.user.first_name or request.user.last_name):
-            nom = (request.user.get_full_name() or '').strip() or None
-        # Ne jamais afficher l'email ni la partie avant @ (ex. mahmour@gmail.com)
-        out['user_display_name'] = nom or ''
-    else:
-        out['user_display_name'] = ''
-    return out
+    """
+    Ajoute user_display_name (nom patient, sinon du profil, sinon prénom/nom ; jamais l'email)
+    et `principal` (rôle) pour les gabarits, lus sur le principal de la requête ; indique aussi
+    aux écrans de file d'attente s'ils peuvent ouvrir le flux SSE ou doivent interroger l'état.
+    """
+    principal = get_principal(request)
+    return {
+        'user_display_name': principal.nom_affichage,
+        'principal': principal,
+        'flux_temps_reel': flux_disponible(request),
+        'sondage_file_secondes': getattr(settings, 'RDV_SONDAGE_FILE_SECONDES', 15),
+    }
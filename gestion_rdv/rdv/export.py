@@ -0,0 +1,80 @@
+"""
+Export des rendez-vous (CSV ou JSONL) en flux : lecture par lots de TAILLE_LOT tuples, paginés
+par clé (pk > dernier pk lu, ordre des pk) plutôt que par iterator(), que le pilote MySQL
+charge en entier côté client. La mémoire est bornée par un lot quel que soit le volume, et
+chaque lot est une requête courte sur la clé primaire (pas de curseur tenu ouvert).
+"""
+import csv
+import json
+
+from django.utils import timezone
+
+from .cache_creneaux import bornes_jour
+from .models import Rendez_vous
+
+COLONNES = ['id', 'date', 'titre', 'status', 'priority', 'service', 'patient', 'utilisateur', 'created_at']
+FORMATS = ('csv', 'jsonl')
+TAILLE_LOT = 2000
+
+
+def rdv_a_exporter(debut=None, fin=None, status=None):
+    """
+    Tuples (COLONNES) dans l'ordre des pk, lus par lots de TAILLE_LOT (une requête par lot).
+    `debut` / `fin` sont des jours cabinet inclus : filtres par plage sur `date` et par `status`.
+    """
+    qs = Rendez_vous.objects.all()
+    if debut:
+        qs = qs.filter(date__gte=bornes_jour(debut)[0])
+    if fin:
+        qs = qs.filter(date__lt=bornes_jour(fin)[1])
+    if status:
+        qs = qs.filter(status__in=status) if isinstance(status, (list, tuple)) else qs.filter(status=status)
+    qs = (
+        qs.annotate(patient=Rendez_vous.objects.patient_name_expression())
+        .order_by('pk')
+        .values_list(
+            'pk', 'date', 'titre', 'status', 'priority', 'service__nom', 'patient',
+            'utilisateur__username', 'created_at',
+        )
+    )
+    dernier = 0
+    while True:
+        lot = list(qs.filter(pk__gt=dernier)[:TAILLE_LOT])
+        yield from lot
+        if len(lot) < TAILLE_LOT:
+            return
+        dernier = lot[-1][0]
+
+
+def _valeurs(ligne):
+    pk, date, titre, status, priority, service, patient, username, created_at = ligne
+    return [
+        pk,
+        timezone.localtime(date).isoformat(),
+        titre,
+        status,
+        priority,
+        service or '',
+        patient,
+        username,
+        timezone.localtime(created_at).isoformat(),
+    ]
+
+
+class _Echo:
+    """Pseudo-fichier pour csv.writer : renvoie la ligne au lieu de l'écrire."""
+
+    def write(self, value):
+        return value
+
+
+def lignes_export(lignes, format='csv'):
+    """Générateur de lignes texte (en-tête compris pour le CSV)."""
+    if format == 'jsonl':
+        for ligne in lignes:
+            yield json.dumps(dict(zip(COLONNES, _valeurs(ligne))), ensure_ascii=False) + '\n'
+        return
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLONNES)
+    for ligne in lignes:
+        yield writer.writerow(_valeurs(ligne))
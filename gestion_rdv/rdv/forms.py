@@ -1,11 +1,20 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from itertools import chain, islice
 from datetime import datetime, timedelta, time
 from zoneinfo import ZoneInfo
 
 from django import forms
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.forms.boundfield import BoundField
+from django.db import IntegrityError, transaction
+from django.db.models import Count
 from django.utils import timezone
-from .models import Rendez_vous, JourFermeture
+from django.utils.functional import cached_property
+from .models import Rendez_vous, JourFermeture, capacite_creneau
+from . import cache_creneaux, horaires
+from .metriques import chronometre
 
 _TZ_CABINET = ZoneInfo(str(settings.TIME_ZONE))
 
@@ -46,48 +55,26 @@ def patient_peut_modifier_ou_annuler(rdv):
 
 JOURS_NOMS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
 
-# Horaires de RDV (~50 min) — matin puis après-midi
-CRENEAUX_MATIN = [
-    time(8, 0),
-    time(8, 50),
-    time(9, 40),
-    time(10, 30),
-    time(11, 20),
-    time(12, 10),
-]
-CRENEAUX_APRES = [
-    time(14, 0),
-    time(14, 50),
-    time(15, 40),
-    time(16, 30),
-    time(17, 20),
-]
-# Lundi → jeudi + mercredi : journée 8h → ~17h50 (dernier RDV 17h20)
-CRENEAUX_JOUR_COMPLET = CRENEAUX_MATIN + CRENEAUX_APRES
-# Vendredi : matin seulement (8h → 12h10)
-
-
-def heures_pour_jour_semaine(weekday):
-    """
-    Lun, mar, mer, jeu : journée complète (matin + après-midi). Ven : matin seulement. Sam–dim : fermé.
-    """
-    if weekday in (5, 6):
-        return []
-    if weekday == 4:
-        return list(CRENEAUX_MATIN)
-    return list(CRENEAUX_JOUR_COMPLET)
+def heures_pour_jour_semaine(weekday, pas=None):
+    """Heures de début des créneaux du jour de semaine `weekday` (grille compilée des horaires cabinet)."""
+    return list(horaires.semaine_type(pas)[weekday])
 
 
 def _time_key(t):
     return (t.hour, t.minute)
 
 
-def _cinq_prochains_jours_ouvres(depuis):
-    """5 prochains jours lun–ven à partir de `depuis` (inclus si jour ouvré)."""
+def _jours_ouvres_semaine(semaine):
+    """Jours de semaine ayant au moins un créneau (lun–ven si aucun horaire n’est configuré)."""
+    return {wd for wd in range(7) if semaine[wd]} or {0, 1, 2, 3, 4}
+
+
+def _cinq_prochains_jours_ouvres(depuis, ouvres=frozenset({0, 1, 2, 3, 4})):
+    """5 prochains jours ouvrés à partir de `depuis` (inclus si jour ouvré)."""
     out = []
     d = depuis
     for _ in range(21):
-        if d.weekday() < 5:
+        if d.weekday() in ouvres:
             out.append(d)
             if len(out) >= 5:
                 break
@@ -100,36 +87,215 @@ def est_creneau_horaire_officiel(dt):
     local = timezone.localtime(dt)
     dte = local.date()
     t = time(local.hour, local.minute)
-    return t in heures_pour_jour_semaine(dte.weekday())
+    return t in horaires.semaine_type()[dte.weekday()]
 
 
-def _rdv_occupe_slot(slot_dt, exclude_pk=None):
-    qs = Rendez_vous.objects.filter(date=slot_dt).exclude(status='cancelled')
-    if exclude_pk:
-        qs = qs.exclude(pk=exclude_pk)
-    return qs.exists()
+# Horizon de réservation proposé aux patients (jours calendaires, aujourd’hui inclus)
+HORIZON_RESERVATION_JOURS = 28
+
+
+@chronometre('creneaux.charger_jours')
+def _charger_jours(debut, fin):
+    """
+    {date: (fermé, ((instant, service_id, durée en minutes, nombre), ...))} pour chaque jour
+    de [debut, fin].
+
+    Lu depuis le cache versionné ; les jours absents sont rechargés ensemble (fermetures +
+    un GROUP BY créneau/service des RDV non annulés sur la plage manquante : 2 requêtes)
+    puis remis en cache.
+    """
+    dates = [debut + timedelta(days=i) for i in range((fin - debut).days + 1)]
+    versions = cache_creneaux.versions_jours(dates)
+    version_grille = cache_creneaux.version_horaires()
+    jours = cache_creneaux.lire_jours(versions, version_grille)
+    manquants = [d for d in dates if d not in jours]
+    if not manquants:
+        return jours
+    d0, d1 = manquants[0], manquants[-1]
+    fermes = set(
+        JourFermeture.objects.filter(date__gte=d0, date__lte=d1).values_list('date', flat=True)
+    )
+    start, _ = cabinet_day_datetime_bounds(d0)
+    _, end = cabinet_day_datetime_bounds(d1)
+    comptes = {d: [] for d in manquants}
+    qs = (
+        Rendez_vous.objects.filter(date__gte=start, date__lt=end)
+        .exclude(status='cancelled')
+        .values_list('date', 'service_id', 'service__duree_minutes')
+        .annotate(nombre=Count('pk'))
+        .order_by()
+    )
+    duree_defaut = horaires.duree_pour_service(None)
+    for instant, service_id, duree, nombre in qs:
+        dte = cache_creneaux.jour_cabinet(instant)
+        if dte in comptes:
+            comptes[dte].append((instant, service_id, duree or duree_defaut, nombre))
+    nouveaux = {d: (d in fermes, tuple(comptes[d])) for d in manquants}
+    cache_creneaux.ecrire_jours(nouveaux, versions, version_grille)
+    jours.update(nouveaux)
+    return jours
+
+
+class IntervallesOccupes:
+    """
+    RDV vus comme des intervalles [début, fin), rangés dans deux listes triées (débuts, fins)
+    construites en un seul tri à partir des (début, fin, nombre).
+
+    Le nombre de RDV qui chevauchent [t, t + durée) se lit par deux bisections, en O(log n) :
+    ceux qui commencent avant la fin demandée, moins ceux déjà terminés au début demandé.
+    """
+
+    def __init__(self, intervalles=()):
+        self.debuts = []
+        self.fins = []
+        for debut, fin, nombre in intervalles:
+            self.debuts.extend([debut] * nombre)
+            self.fins.extend([fin] * nombre)
+        self.debuts.sort()
+        self.fins.sort()
+
+    def retirer(self, debut, fin):
+        i, j = bisect_left(self.debuts, debut), bisect_left(self.fins, fin)
+        if i < len(self.debuts) and self.debuts[i] == debut and j < len(self.fins) and self.fins[j] == fin:
+            del self.debuts[i]
+            del self.fins[j]
+
+    def chevauchements(self, debut, fin):
+        return bisect_left(self.debuts, fin) - bisect_right(self.fins, debut)
+
+
+class OccupationCabinet:
+    """
+    Occupation du cabinet sur un horizon de jours [debut, fin] (dates locales cabinet).
+
+    Au plus deux requêtes par plage, quelle que soit la longueur de l’horizon : jours de
+    fermeture et nombre de RDV non annulés par créneau et service, aucune si les jours sont
+    en cache (une de plus pour retirer le RDV `exclude_rdv_pk` en cours de modification).
+    Chaque RDV occupe [date, date + durée de son service) : un créneau est libre tant que
+    moins de `capacite_creneau()` RDV chevauchent [t, t + durée du service demandé), et moins
+    de `service.capacite` du même service s’il est limité. Le décompte des chevauchements est
+    prudent (deux RDV successifs qui touchent tous deux l’intervalle comptent pour deux).
+    """
+
+    def __init__(self, debut, fin, exclude_rdv_pk=None, now=None, service=None):
+        self.debut = debut
+        self.fin = fin
+        self.now = now or _maintenant_utc()
+        self.semaine = horaires.semaine_type()
+        self.capacite = capacite_creneau()
+        self.duree = timedelta(minutes=horaires.duree_pour_service(service))
+        self.service_id = service.pk if service is not None else None
+        self.capacite_service = service.capacite if service is not None else None
+        jours = _charger_jours(debut, fin)
+        self.fermes = {dte for dte, (ferme, _) in jours.items() if ferme}
+        intervalles = defaultdict(list)  # {service_id: [(début, fin, nombre)]}
+        for _, comptes in jours.values():
+            for instant, service_id, duree, nombre in comptes:
+                intervalles[service_id].append((instant, instant + timedelta(minutes=duree), nombre))
+        self.tous = IntervallesOccupes(chain.from_iterable(intervalles.values()))
+        self.par_service = defaultdict(
+            IntervallesOccupes, {s: IntervallesOccupes(liste) for s, liste in intervalles.items()}
+        )
+        if exclude_rdv_pk is not None:
+            exclu = (
+                Rendez_vous.objects.filter(pk=exclude_rdv_pk)
+                .exclude(status='cancelled')
+                .select_related('service')
+                .first()
+            )
+            if exclu is not None:
+                fin_rdv = exclu.date + timedelta(minutes=horaires.duree_pour_service(exclu.service))
+                self.tous.retirer(exclu.date, fin_rdv)
+                self.par_service[exclu.service_id].retirer(exclu.date, fin_rdv)
+
+    def est_ferme(self, dte):
+        return dte in self.fermes
+
+    def places_restantes(self, slot_dt):
+        """Nombre de RDV encore possibles sur [slot_dt, slot_dt + durée) (service choisi s’il est limité)."""
+        fin = slot_dt + self.duree
+        restantes = self.capacite - self.tous.chevauchements(slot_dt, fin)
+        if self.capacite_service:
+            restantes = min(
+                restantes, self.capacite_service - self.par_service[self.service_id].chevauchements(slot_dt, fin)
+            )
+        return max(restantes, 0)
+
+    def est_occupe(self, slot_dt):
+        return self.places_restantes(slot_dt) <= 0
+
+    def est_passe(self, slot_dt):
+        return slot_dt <= self.now
+
+    def creneaux_libres(self, dte):
+        """Heures (time, datetime aware) libres et futures du jour `dte`."""
+        if self.est_ferme(dte):
+            return []
+        out = []
+        for t in self.semaine[dte.weekday()]:
+            slot_dt = _instant_creneau(dte, t)
+            if self.est_passe(slot_dt) or self.est_occupe(slot_dt):
+                continue
+            out.append((t, slot_dt))
+        return out
 
 
 def get_creneaux_disponibles(exclude_rdv_pk=None):
     """Liste (value iso, label) — créneaux fixes, pas déjà pris (sauf RDV exclude_rdv_pk)."""
-    start_date = timezone.localtime(_maintenant_utc(), _TZ_CABINET).date()
-    now = _maintenant_utc()
+    start_date = cabinet_local_today()
+    end_date = start_date + timedelta(days=HORIZON_RESERVATION_JOURS - 1)
+    occupation = OccupationCabinet(start_date, end_date, exclude_rdv_pk)
     choices = []
-    for d in range(28):
+    for d in range(HORIZON_RESERVATION_JOURS):
         dte = start_date + timedelta(days=d)
-        if JourFermeture.objects.filter(date=dte).exists():
-            continue
         ws = dte.weekday()
-        for t in heures_pour_jour_semaine(ws):
-            slot_dt = _instant_creneau(dte, t)
-            if slot_dt <= now:
-                continue
-            if not _rdv_occupe_slot(slot_dt, exclude_rdv_pk):
-                label = f"{JOURS_NOMS[ws]} {dte:%d/%m/%Y} à {t:%H:%M}"
-                choices.append((slot_dt.isoformat(), label))
+        for t, slot_dt in occupation.creneaux_libres(dte):
+            label = f"{JOURS_NOMS[ws]} {dte:%d/%m/%Y} à {t:%H:%M}"
+            choices.append((slot_dt.isoformat(), label))
     return choices[:200]
 
 
+def iter_creneaux_libres(service=None, apres=None, exclude_rdv_pk=None, pas_jours=7):
+    """
+    Générateur des créneaux libres (time, datetime aware) postérieurs à `apres` (défaut :
+    maintenant), dans l’ordre, jusqu’à la fin de l’horizon de réservation.
+
+    L’horizon est parcouru paresseusement par tranches de `pas_jours` : une OccupationCabinet
+    (au plus 2 requêtes sur une plage indexée) par tranche, seulement quand on en a besoin.
+    Jours de fermeture, grille hebdomadaire, durée et capacité du `service` sont respectés.
+    """
+    now = _maintenant_utc()
+    apres = max(apres, now) if apres else now
+    debut = max(timezone.localtime(apres, _TZ_CABINET).date(), cabinet_local_today())
+    limite = cabinet_local_today() + timedelta(days=HORIZON_RESERVATION_JOURS - 1)
+    while debut <= limite:
+        fin = min(debut + timedelta(days=pas_jours - 1), limite)
+        occupation = OccupationCabinet(debut, fin, exclude_rdv_pk, now=apres, service=service)
+        dte = debut
+        while dte <= fin:
+            yield from occupation.creneaux_libres(dte)
+            dte += timedelta(days=1)
+        debut = fin + timedelta(days=1)
+
+
+@chronometre('creneaux.prochains')
+def next_free_slots(service=None, after=None, n=1, exclude_rdv_pk=None):
+    """Les `n` premiers créneaux libres après `after`, [(time, datetime aware)] ; s’arrête dès qu’ils sont trouvés."""
+    return list(islice(iter_creneaux_libres(service, after, exclude_rdv_pk), n))
+
+
+def premier_creneau_disponible(exclude_rdv_pk=None):
+    """
+    Premier créneau libre (value iso, label) de l’horizon, ou None.
+
+    En pratique une seule tranche de l’horizon est sondée (2 requêtes au plus).
+    """
+    for t, slot_dt in next_free_slots(n=1, exclude_rdv_pk=exclude_rdv_pk):
+        dte = slot_dt.date()
+        return slot_dt.isoformat(), f"{JOURS_NOMS[dte.weekday()]} {dte:%d/%m/%Y} à {t:%H:%M}"
+    return None
+
+
 def get_creneaux_par_jour():
     flat = get_creneaux_disponibles()
     from collections import OrderedDict
@@ -152,35 +318,55 @@ def get_creneaux_par_jour():
     return [by_day[k] for k in sorted(by_day.keys())]
 
 
+@chronometre('creneaux.table_semaine')
 def get_creneaux_table_semaine(exclude_rdv_pk=None, extra_dates=None):
     """Jours ouvrés : 5 prochains + dates supplémentaires (ex. date du RDV modifié)."""
     now = _maintenant_utc()
     today = timezone.localtime(now, _TZ_CABINET).date()
-    if today.weekday() >= 5:
-        anchor = today + timedelta(days=7 - today.weekday())
-    else:
-        anchor = today
-    day_set = set(_cinq_prochains_jours_ouvres(anchor))
+    semaine = horaires.semaine_type()
+    ouvres = _jours_ouvres_semaine(semaine)
+    day_set = set(_cinq_prochains_jours_ouvres(today, ouvres))
     if extra_dates:
         for ed in extra_dates:
             if isinstance(ed, datetime):
                 ed = ed.date()
-            if ed.weekday() < 5 and ed >= today:
+            if ed.weekday() in ouvres and ed >= today:
                 day_set.add(ed)
     day_list = sorted(day_set)
 
-    all_times_ordered = sorted(CRENEAUX_JOUR_COMPLET, key=_time_key)
+    # Le tableau ne dépend de `now` que via le premier créneau encore à venir
+    prochain = next(
+        (
+            slot_dt
+            for dte in day_list
+            for slot_dt in (_instant_creneau(dte, t) for t in semaine[dte.weekday()])
+            if slot_dt > now
+        ),
+        None,
+    )
+    cle = cache_creneaux.cle_table(
+        cache_creneaux.versions_jours(day_list),
+        cache_creneaux.version_horaires(),
+        exclude_rdv_pk or '',
+        prochain.isoformat() if prochain else '',
+    )
+    table = cache_creneaux.lire_table(cle)
+    if table is not None:
+        return table
+    occupation = OccupationCabinet(day_list[0], day_list[-1], exclude_rdv_pk, now=now)
+
+    all_times_ordered = sorted(set().union(*(semaine[dte.weekday()] for dte in day_list)), key=_time_key)
     days = []
     allowed_per_col = []
     for dte in day_list:
-        ferme = JourFermeture.objects.filter(date=dte).exists()
+        ferme = occupation.est_ferme(dte)
         days.append({
             'label': JOURS_NOMS[dte.weekday()],
             'date': dte.strftime('%d/%m/%Y'),
             'date_iso': dte.isoformat(),
             'ferme': ferme,
         })
-        allowed_per_col.append(set(heures_pour_jour_semaine(dte.weekday())))
+        allowed_per_col.append(set(semaine[dte.weekday()]))
 
     rows = []
     for t in all_times_ordered:
@@ -192,15 +378,74 @@ def get_creneaux_table_semaine(exclude_rdv_pk=None, extra_dates=None):
                 cells.append(None)
                 continue
             slot_dt = _instant_creneau(dte, t)
-            if slot_dt <= now:
+            if occupation.est_passe(slot_dt):
                 cells.append(None)
                 continue
-            taken = Rendez_vous.objects.filter(date=slot_dt).exclude(status='cancelled').exists()
-            cells.append({'value': slot_dt.isoformat(), 'available': not taken})
+            restantes = occupation.places_restantes(slot_dt)
+            cells.append({'value': slot_dt.isoformat(), 'available': restantes > 0, 'restantes': restantes})
         h, m = t.hour, t.minute
         time_display = time_str + ' (après-midi)' if (h, m) >= (14, 0) else time_str
         rows.append({'time': time_str, 'time_display': time_display, 'cells': cells})
-    return {'days': days, 'rows': rows}
+    table = {'days': days, 'rows': rows, 'capacite': occupation.capacite}
+    cache_creneaux.ecrire_table(cle, table)
+    return table
+
+
+# Nombre max de jours par requête de disponibilités groupées
+DISPONIBILITES_MAX_JOURS = 42
+
+
+def repere_disponibilites(dates, service=None, now=None):
+    """
+    (etag, last_modified) des disponibilités de `dates`, sans requête SQL : versions des jours
+    et des horaires en cache, plus le dernier créneau déjà passé (qui change aussi la réponse).
+    """
+    now = now or _maintenant_utc()
+    semaine = horaires.semaine_type()
+    dernier_passe = max(
+        (
+            slot_dt
+            for dte in dates
+            for slot_dt in (_instant_creneau(dte, t) for t in semaine[dte.weekday()])
+            if slot_dt <= now
+        ),
+        default=None,
+    )
+    etag = cache_creneaux.empreinte(
+        cache_creneaux.versions_jours(dates),
+        cache_creneaux.version_horaires(),
+        capacite_creneau(),
+        service.pk if service else '',
+        dernier_passe.isoformat() if dernier_passe else '',
+    )
+    last_modified = cache_creneaux.derniere_modification()
+    if dernier_passe:
+        last_modified = max(last_modified, dernier_passe.timestamp())
+    return etag, last_modified
+
+
+@chronometre('creneaux.disponibilites')
+def disponibilites_dates(dates, service=None, now=None):
+    """
+    Disponibilités de plusieurs jours en une passe (une OccupationCabinet sur la plage, donc
+    au plus 2 requêtes). Réponse compacte : `grille` = heures 'HH:MM' (union des jours demandés)
+    et, par jour ISO, deux masques de bits [ouverts, libres] où le bit i correspond à grille[i].
+    """
+    dates = sorted(set(dates))
+    occupation = OccupationCabinet(dates[0], dates[-1], now=now, service=service)
+    semaine = occupation.semaine
+    grille = sorted(set().union(*(semaine[dte.weekday()] for dte in dates)), key=_time_key)
+    index = {t: i for i, t in enumerate(grille)}
+    jours = {}
+    for dte in dates:
+        ouverts = libres = 0
+        if not occupation.est_ferme(dte):
+            for t in semaine[dte.weekday()]:
+                ouverts |= 1 << index[t]
+            for t, _ in occupation.creneaux_libres(dte):
+                libres |= 1 << index[t]
+        jours[dte.isoformat()] = [ouverts, libres]
+    return {'grille': [t.strftime('%H:%M') for t in grille], 'jours': jours}
 
 
 def get_creneaux_disponibles_par_semaine():
@@ -230,23 +475,47 @@ def get_creneaux_disponibles_par_semaine():
     return choices
 
 
+@chronometre('creneaux.jour')
 def get_creneaux_for_date(dte, exclude_rdv_pk=None):
     if isinstance(dte, str):
         dte = datetime.strptime(dte, '%Y-%m-%d').date()
-    now = _maintenant_utc()
-    today_cabinet = timezone.localtime(now, _TZ_CABINET).date()
-    if dte < today_cabinet:
+    if dte < cabinet_local_today():
         return []
-    if JourFermeture.objects.filter(date=dte).exists():
-        return []
-    out = []
-    for t in heures_pour_jour_semaine(dte.weekday()):
-        slot_dt = _instant_creneau(dte, t)
-        if slot_dt <= now:
-            continue
-        if not _rdv_occupe_slot(slot_dt, exclude_rdv_pk):
-            out.append({'value': slot_dt.isoformat(), 'label': t.strftime('%H:%M')})
-    return out
+    occupation = OccupationCabinet(dte, dte, exclude_rdv_pk)
+    return [
+        {'value': slot_dt.isoformat(), 'label': t.strftime('%H:%M')}
+        for t, slot_dt in occupation.creneaux_libres(dte)
+    ]
+
+
+class _BoundFieldAideALaDemande(BoundField):
+    """
+    help_text calculé par `field.aide()` à sa première lecture (gabarit, API) : BoundField.__init__
+    lit help_text à chaque accès au champ, validation comprise, un texte paresseux y serait évalué.
+    """
+
+    @property
+    def help_text(self):
+        if self.field.aide is None:
+            return self.field.help_text or ''
+        if self._aide is None:
+            self._aide = self.field.aide()
+        return self._aide
+
+    @help_text.setter
+    def help_text(self, valeur):
+        self._aide = None
+
+
+class ChampCreneau(forms.CharField):
+    """Créneau choisi (ISO 8601) ; `aide` : callable du help_text, appelé seulement s'il est affiché."""
+
+    def __init__(self, *args, aide=None, **kwargs):
+        self.aide = aide
+        super().__init__(*args, **kwargs)
+
+    def get_bound_field(self, form, field_name):
+        return _BoundFieldAideALaDemande(form, self, field_name)
 
 
 class RendezVousForm(forms.ModelForm):
@@ -265,14 +534,28 @@ class RendezVousForm(forms.ModelForm):
         self.fields['service'].required = False
         self.fields['priority'].label = 'Type de cas'
         self.fields['priority'].widget.attrs['class'] = 'form-control'
-        creneaux_flat = get_creneaux_disponibles(self.exclude_rdv_pk)
-        self.fields['date'] = forms.CharField(
+        self.fields['date'] = ChampCreneau(
             required=True,
             label='Créneau (date et heure)',
             widget=forms.HiddenInput(attrs={'id': 'id_date'}),
+            # Évalué seulement si le help_text est affiché (sonde « au moins un créneau libre »)
+            aide=None if self.instance and self.instance.pk else self._help_text_date,
         )
-        if not creneaux_flat and not (self.instance and self.instance.pk):
-            self.fields['date'].help_text = 'Aucun créneau disponible. Vérifiez les jours de fermeture.'
+
+    def _help_text_date(self):
+        if self.a_creneau_disponible:
+            return ''
+        return 'Aucun créneau disponible. Vérifiez les jours de fermeture.'
+
+    @cached_property
+    def a_creneau_disponible(self):
+        """True s’il reste au moins un créneau libre sur l’horizon (sonde courte)."""
+        return premier_creneau_disponible(self.exclude_rdv_pk) is not None
+
+    @cached_property
+    def creneaux_disponibles(self):
+        """Liste complète (value iso, label) — calculée seulement à la demande."""
+        return get_creneaux_disponibles(self.exclude_rdv_pk)
 
     def clean_date(self):
         date_val = self.cleaned_data.get('date')
@@ -286,13 +569,45 @@ class RendezVousForm(forms.ModelForm):
             dt = timezone.make_aware(dt)
         if not est_creneau_horaire_officiel(dt):
             raise ValidationError('Cet horaire n’est pas un créneau autorisé.')
-        if JourFermeture.objects.filter(date=timezone.localtime(dt).date()).exists():
-            raise ValidationError('Ce jour est fermé.')
-        if dt <= _maintenant_utc():
-            raise ValidationError('Impossible de réserver un créneau déjà passé.')
-        qs = Rendez_vous.objects.filter(date=dt).exclude(status='cancelled')
-        if self.exclude_rdv_pk:
-            qs = qs.exclude(pk=self.exclude_rdv_pk)
-        if qs.exists():
-            raise ValidationError('Ce créneau n’est plus disponible.')
         return dt
+
+    def clean(self):
+        """Jour fermé, créneau passé ou chevauchant d’autres RDV (selon la durée du service choisi)."""
+        cleaned_data = super().clean()
+        dt = cleaned_data.get('date')
+        if not isinstance(dt, datetime):
+            return cleaned_data
+        dte = timezone.localtime(dt, _TZ_CABINET).date()
+        occupation = OccupationCabinet(dte, dte, self.exclude_rdv_pk, service=cleaned_data.get('service'))
+        if occupation.est_ferme(dte):
+            self.add_error('date', 'Ce jour est fermé.')
+        elif occupation.est_passe(dt):
+            self.add_error('date', 'Impossible de réserver un créneau déjà passé.')
+        elif occupation.est_occupe(dt):
+            # Course sur le même instant : tranchée par les index uniques dans save_reservation()
+            self.add_error('date', 'Ce créneau n’est plus disponible.')
+        else:
+            # Déjà vérifié ici : Rendez_vous.clean() ne refait pas la requête
+            service = cleaned_data.get('service')
+            self.instance._creneau_verifie = (dt, service.pk if service else None)
+        return cleaned_data
+
+    def save_reservation(self, tentatives=3, **attrs):
+        """
+        Enregistre le RDV dans une transaction, sur le premier poste libre du créneau. Si un
+        autre patient prend ce poste au même moment (index uniques), on réessaie sur le suivant ;
+        créneau complet : ajoute l’erreur sur `date` et renvoie None.
+        """
+        rdv = self.save(commit=False)
+        for name, value in attrs.items():
+            setattr(rdv, name, value)
+        for _ in range(tentatives):
+            try:
+                with transaction.atomic():
+                    rdv.save()
+                    self.save_m2m()
+                return rdv
+            except IntegrityError:
+                continue
+        self.add_error('date', 'Ce créneau n’est plus disponible.')
+        return None
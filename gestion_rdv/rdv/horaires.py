@@ -0,0 +1,79 @@
+"""
+Grille des créneaux compilée à partir des horaires cabinet (HoraireCabinet, éditable en admin).
+
+Les plages actives sont lues une fois, puis découpées en heures de début de RDV : un créneau
+commence toutes les `pas` minutes et doit se terminer (consultation = pas − battement) avant
+la fermeture. Ex. 8h00–12h55, pas 50, battement 5 → 8h00, 8h50, … 12h10.
+
+La semaine type compilée est gardée en mémoire du processus, sous la version des horaires
+(`cache_creneaux.version_horaires`, dans le cache partagé) : enregistrer un horaire la fait
+recompiler dans tous les processus.
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+
+from . import cache_creneaux
+
+# Écart entre deux débuts de créneau, et pause comprise dans cet écart (minutes)
+PAS_CRENEAU_MINUTES = getattr(settings, 'RDV_PAS_CRENEAU_MINUTES', 50)
+BATTEMENT_MINUTES = getattr(settings, 'RDV_BATTEMENT_MINUTES', 5)
+
+_plages = {}  # {version: plages}
+_semaines = {}  # {(version, pas): semaine}
+
+
+def pas_pour_service(service):
+    """Pas de la grille pour un service : sa durée + battement (pas par défaut sans service)."""
+    if service is None or not service.duree_minutes:
+        return PAS_CRENEAU_MINUTES
+    return service.duree_minutes + BATTEMENT_MINUTES
+
+
+def duree_pour_service(service):
+    """Durée occupée par un RDV (minutes) : celle du service, sinon un créneau de la grille hors battement."""
+    if service is None or not service.duree_minutes:
+        return PAS_CRENEAU_MINUTES - BATTEMENT_MINUTES
+    return service.duree_minutes
+
+
+def _plages_actives():
+    """((jour, ouverture, fermeture), ...) — HoraireCabinet, sinon l'ancienne table CreneauHoraire."""
+    from .models import CreneauHoraire, HoraireCabinet
+
+    plages = tuple(
+        HoraireCabinet.objects.filter(actif=True).values_list('jour', 'heure_ouverture', 'heure_fermeture')
+    )
+    if not plages and not HoraireCabinet.objects.exists():
+        plages = tuple(
+            CreneauHoraire.objects.filter(actif=True).values_list('jour', 'heure_debut', 'heure_fin')
+        )
+    return plages
+
+
+def compiler_semaine(plages, pas=PAS_CRENEAU_MINUTES):
+    """Tuple de 7 tuples (lundi → dimanche) d'heures de début triées."""
+    duree = timedelta(minutes=max(pas - BATTEMENT_MINUTES, 1))
+    jours = [set() for _ in range(7)]
+    for jour, ouverture, fermeture in plages:
+        debut = datetime.combine(date.min, ouverture)
+        fin = datetime.combine(date.min, fermeture)
+        while debut + duree <= fin:
+            jours[jour].add(time(debut.hour, debut.minute))
+            debut += timedelta(minutes=pas)
+    return tuple(tuple(sorted(heures)) for heures in jours)
+
+
+def semaine_type(pas=None):
+    """Semaine type compilée pour la version courante des horaires (aucune requête si déjà compilée)."""
+    pas = pas or PAS_CRENEAU_MINUTES
+    version = cache_creneaux.version_horaires()
+    semaine = _semaines.get((version, pas))
+    if semaine is None:
+        plages = _plages.get(version)
+        if plages is None:
+            _plages.clear()
+            _semaines.clear()
+            plages = _plages[version] = _plages_actives()
+        semaine = _semaines[(version, pas)] = compiler_semaine(plages, pas)
+    return semaine
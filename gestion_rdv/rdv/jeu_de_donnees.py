@@ -0,0 +1,148 @@
+"""
+Jeu de données synthétique pour les mesures de charge (`manage.py seed_load`, rdv/benchmarks.py).
+
+Tout est inséré par lots (bulk_create, comptes via rdv.provisionnement) avec des
+distributions proches d'un vrai cabinet :
+  - quelques patients fidèles concentrent beaucoup de RDV (poids ~ 1 / rang^0.8) ;
+  - les jours proches sont plus chargés que l'horizon lointain ; les RDV passés sont surtout
+    « done », les futurs surtout « pending » / « confirmed », ~10 % annulés ;
+  - ~10 % d'urgences et de contrôles, ~10 % de RDV sans service ;
+  - les créneaux respectent la grille (horaires.semaine_type), les jours de fermeture et la
+    capacité (postes / rangs attribués en mémoire comme dans import_rdv).
+Une même `graine` donne le même jeu.
+"""
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from django.db import transaction
+
+from . import marqueurs
+from .cache_creneaux import bornes_jour, invalider_horaires
+from .forms import _TZ_CABINET, cabinet_local_today
+from .horaires import semaine_type
+from .models import (
+    JourFermeture, Rendez_vous, Service, Utilisateur, premier_poste_libre, recalculer_statistiques,
+)
+from .provisionnement import provisionner_comptes
+
+PRENOMS = ('Amina', 'Karim', 'Fatou', 'Yanis', 'Chloé', 'Lucas', 'Inès', 'Hugo', 'Aïcha', 'Léo', 'Sofia', 'Mamadou')
+NOMS = ('Diallo', 'Martin', 'Benali', 'Bernard', 'Traoré', 'Petit', 'Haddad', 'Moreau', 'Ndiaye', 'Laurent')
+SERVICES = (
+    ('Consultation', 45), ('Contrôle', 15), ('Radiologie', 30), ('Vaccination', 15),
+    ('Bilan sanguin', 15), ('Échographie', 30), ('Kinésithérapie', 45), ('Dermatologie', 30),
+)
+
+STATUTS_PASSES = (('done', 70), ('confirmed', 15), ('cancelled', 15))
+STATUTS_FUTURS = (('pending', 60), ('confirmed', 30), ('cancelled', 10))
+PRIORITES = (('normal', 80), ('urgent', 10), ('control', 10))
+TENTATIVES = 5
+
+
+@dataclass
+class Volumes:
+    utilisateurs: int = 500
+    services: int = 6
+    fermetures: int = 8
+    rdv: int = 5000
+    jours_passes: int = 90
+    jours_futurs: int = 60
+
+
+def _tirage(rng, choix):
+    valeurs, poids = zip(*choix)
+    return rng.choices(valeurs, poids)[0]
+
+
+def generer(volumes, graine=42, prefixe='charge', lot=1000):
+    """Crée le jeu décrit par `volumes` ; renvoie {'utilisateurs', 'services', 'fermetures', 'rdv', 'refuses'}."""
+    rng = random.Random(graine)
+    today = cabinet_local_today()
+    premier = today - timedelta(days=volumes.jours_passes)
+    jours = [premier + timedelta(days=i) for i in range(volumes.jours_passes + volumes.jours_futurs + 1)]
+
+    bilan = provisionner_comptes((
+        {
+            'username': f'{prefixe}{i}',
+            'email': f'{prefixe}{i}@example.com',
+            'first_name': rng.choice(PRENOMS),
+            'last_name': rng.choice(NOMS),
+        }
+        for i in range(volumes.utilisateurs)
+    ), lot=lot, inviter=False)
+    user_ids = list(
+        Utilisateur.objects.filter(role='user', user__username__startswith=prefixe)
+        .order_by('user_id').values_list('user_id', flat=True)
+    )
+
+    existants = set(Service.objects.values_list('nom', flat=True))
+    Service.objects.bulk_create([
+        Service(nom=nom, duree_minutes=duree) for nom, duree in SERVICES[:volumes.services] if nom not in existants
+    ])
+    services = list(Service.objects.filter(nom__in=[nom for nom, _ in SERVICES[:volumes.services]]))
+
+    fermes = set(JourFermeture.objects.filter(date__gte=jours[0], date__lte=jours[-1]).values_list('date', flat=True))
+    nouveaux = {d for d in rng.sample(jours, min(volumes.fermetures, len(jours))) if d not in fermes}
+    JourFermeture.objects.bulk_create([JourFermeture(date=d, motif='Fermeture (jeu de charge)') for d in sorted(nouveaux)])
+    fermes |= nouveaux
+
+    semaine = semaine_type()
+    ouverts = [d for d in jours if semaine[d.weekday()] and d not in fermes]
+    rdvs, refuses = [], 0
+    if user_ids and ouverts:
+        # Jours proches d'aujourd'hui plus demandés, patients fidèles plus présents
+        cumul_jours = list(accumulate(1 / (1 + abs((d - today).days) / 30) for d in ouverts))
+        cumul_users = list(accumulate(1 / (rang + 1) ** 0.8 for rang in range(len(user_ids))))
+        capacites = {s.pk: s.capacite for s in services}
+        pris = {}  # {instant: [(poste, service_id, rang_service)]}, RDV déjà en base compris
+        for instant, *place in Rendez_vous.objects.filter(
+            creneau_actif__gte=bornes_jour(jours[0])[0], creneau_actif__lt=bornes_jour(jours[-1])[1]
+        ).values_list('creneau_actif', 'poste', 'service_id', 'rang_service'):
+            pris.setdefault(instant, []).append(tuple(place))
+        for _ in range(volumes.rdv):
+            # Créneau complet : on retente ailleurs, comme un patient qui choisit une autre heure
+            for _ in range(TENTATIVES):
+                rdv = _tirer_rdv(rng, ouverts, cumul_jours, semaine, user_ids, cumul_users, services, today)
+                if rdv.status == 'cancelled':
+                    break
+                places = pris.setdefault(rdv.date, [])
+                place = premier_poste_libre(places, rdv.service_id, capacites.get(rdv.service_id))
+                if place is not None:
+                    rdv.poste, rdv.rang_service = place
+                    places.append((place[0], rdv.service_id, place[1]))
+                    break
+            else:
+                refuses += 1
+                continue
+            rdvs.append(rdv)
+        with transaction.atomic():
+            Rendez_vous.objects.bulk_create(rdvs, batch_size=lot)
+    recalculer_statistiques(jours[0], jours[-1])
+    invalider_horaires()
+    marqueurs.toucher(marqueurs.RDV, marqueurs.SERVICES, marqueurs.FERMETURES, marqueurs.PATIENTS)
+    return {
+        'utilisateurs': bilan.crees,
+        'services': len(services),
+        'fermetures': len(nouveaux),
+        'rdv': len(rdvs),
+        'refuses': refuses,
+    }
+
+
+def _tirer_rdv(rng, ouverts, cumul_jours, semaine, user_ids, cumul_users, services, today):
+    jour = rng.choices(ouverts, cum_weights=cumul_jours)[0]
+    heure = rng.choice(semaine[jour.weekday()])
+    date = datetime.combine(jour, heure, tzinfo=_TZ_CABINET)
+    status = _tirage(rng, STATUTS_PASSES if jour < today else STATUTS_FUTURS)
+    service = rng.choice(services) if services and rng.random() >= 0.1 else None
+    return Rendez_vous(
+        titre=service.nom if service else 'Rendez-vous',
+        description='',
+        date=date,
+        utilisateur_id=rng.choices(user_ids, cum_weights=cumul_users)[0],
+        service=service,
+        status=status,
+        priority=_tirage(rng, PRIORITES),
+        annule_le=date - timedelta(hours=rng.randint(1, 240)) if status == 'cancelled' else None,
+    )
@@ -0,0 +1,37 @@
+"""
+Commande: exporte les rendez-vous (avec nom du patient et service) en CSV ou JSONL,
+ligne par ligne, par lots de rdv.export.TAILLE_LOT (jamais la table entière en mémoire).
+
+Usage (depuis le dossier où se trouve manage.py):
+  python manage.py exporter_rdv --format csv --output rdv.csv
+  python manage.py exporter_rdv --format jsonl --debut 2026-01-01 --fin 2026-03-31 --status done
+"""
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from rdv.export import FORMATS, lignes_export, rdv_a_exporter
+
+
+class Command(BaseCommand):
+    help = "Exporte les rendez-vous en CSV ou JSONL (flux, par lots)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--debut', type=date.fromisoformat, help='Premier jour (AAAA-MM-JJ), inclus.')
+        parser.add_argument('--fin', type=date.fromisoformat, help='Dernier jour (AAAA-MM-JJ), inclus.')
+        parser.add_argument('--status', action='append', help='Statut à exporter (répétable).')
+        parser.add_argument('--output', help='Fichier de sortie (défaut : sortie standard).')
+
+    def handle(self, *args, **options):
+        lignes = rdv_a_exporter(options['debut'], options['fin'], options['status'])
+        sortie = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            n = -1 if options['format'] == 'csv' else 0
+            for texte in lignes_export(lignes, options['format']):
+                sortie.write(texte)
+                n += 1
+        finally:
+            if options['output']:
+                sortie.close()
+        self.stderr.write(self.style.SUCCESS(f"Terminé. {n} rendez-vous exporté(s)."))
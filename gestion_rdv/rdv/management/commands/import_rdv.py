@@ -0,0 +1,247 @@
+"""
+Commande: importe des rendez-vous depuis un fichier CSV ou JSONL (ex. agenda d'un autre cabinet).
+
+Le fichier est lu par lots ; utilisateurs, patients et services sont résolus via des tables
+en mémoire, les créneaux sont vérifiés en bloc (grille officielle, jours de fermeture, créneaux
+complets, postes attribués en mémoire) puis insérés avec bulk_create, un lot par transaction. Les lignes refusées sont
+écrites dans un rapport de conflits (CSV).
+
+Colonnes reconnues (mêmes noms que `exporter_rdv`) :
+  date (ISO 8601, obligatoire), titre, description, utilisateur (username ou email),
+  patient (nom, si pas d'utilisateur), service (nom), priority, status
+
+Usage (depuis le dossier où se trouve manage.py):
+  python manage.py import_rdv agenda.csv --rapport conflits.csv
+  python manage.py import_rdv agenda.jsonl --hors-grille --dry-run
+"""
+import csv
+import json
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from rdv import marqueurs
+from rdv.cache_creneaux import invalider_jours, jour_cabinet
+from rdv.forms import est_creneau_horaire_officiel
+from rdv.models import JourFermeture, Patient, Rendez_vous, Service, StatistiqueJour, premier_poste_libre
+from rdv.temps_reel import notifier_file_attente
+
+STATUTS = {code for code, _ in Rendez_vous.STATUS_CHOICES}
+PRIORITES = {code for code, _ in Rendez_vous.PRIORITY_CHOICES}
+
+
+class Command(BaseCommand):
+    help = "Importe des rendez-vous (CSV / JSONL) par lots, avec rapport des conflits."
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='Par défaut : extension du fichier.')
+        parser.add_argument('--lot', type=int, default=1000, help='Lignes par lot / transaction.')
+        parser.add_argument('--rapport', help='Fichier CSV des lignes refusées (défaut : sortie standard).')
+        parser.add_argument('--hors-grille', action='store_true', help='Accepter des horaires hors grille officielle.')
+        parser.add_argument('--dry-run', action='store_true', help='Tout vérifier sans rien écrire.')
+
+    def handle(self, *args, **options):
+        format = options['format'] or ('jsonl' if options['fichier'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.options = options
+        services = list(Service.objects.all())
+        self.services = {s.nom.strip().lower(): s.pk for s in services}
+        self.capacites = {s.pk: s.capacite for s in services}
+        self.utilisateurs = {}
+        self.patients = {}
+        self.places = {}  # {instant: [(poste, service_id, rang_service)]} attribuées depuis le fichier
+        self.conflits = []
+        importes = 0
+        try:
+            fichier = open(options['fichier'], encoding='utf-8', newline='')
+        except OSError as exc:
+            raise CommandError(str(exc))
+        with fichier:
+            lignes = self._lire(fichier, format)
+            while True:
+                lot = list(islice(lignes, options['lot']))
+                if not lot:
+                    break
+                importes += self._importer_lot(lot)
+        self._ecrire_rapport()
+        verbe = 'à importer' if options['dry_run'] else 'importé(s)'
+        self.stdout.write(self.style.SUCCESS(
+            f"Terminé. {importes} rendez-vous {verbe}, {len(self.conflits)} ligne(s) refusée(s)."
+        ))
+
+    def _lire(self, fichier, format):
+        if format == 'csv':
+            for numero, ligne in enumerate(csv.DictReader(fichier), 2):
+                yield numero, ligne
+            return
+        for numero, texte in enumerate(fichier, 1):
+            if texte.strip():
+                try:
+                    yield numero, json.loads(texte)
+                except ValueError:
+                    yield numero, {'_erreur': 'JSON invalide'}
+
+    def _refuser(self, numero, ligne, motif):
+        self.conflits.append((numero, ligne.get('date', ''), ligne.get('utilisateur') or ligne.get('patient', ''), motif))
+
+    def _charger_personnes(self, lot):
+        """Complète les tables utilisateurs / patients pour les identifiants du lot (2 requêtes max)."""
+        ids = {(l.get('utilisateur') or '').strip() for _, l in lot} - {''} - set(self.utilisateurs)
+        if ids:
+            for pk, username, email in User.objects.filter(Q(username__in=ids) | Q(email__in=ids)).values_list(
+                'pk', 'username', 'email'
+            ):
+                self.utilisateurs[username] = pk
+                if email:
+                    self.utilisateurs.setdefault(email, pk)
+            for i in ids:
+                self.utilisateurs.setdefault(i, None)
+        noms = {(l.get('patient') or '').strip().lower() for _, l in lot if not l.get('utilisateur')} - {''}
+        noms -= set(self.patients)
+        if noms:
+            trouves = Counter()
+            for nom, user_id in Patient.objects.filter(nom__in={n for n in noms}).values_list('nom', 'user_id'):
+                cle = nom.strip().lower()
+                trouves[cle] += 1
+                self.patients[cle] = user_id if trouves[cle] == 1 else 'ambigu'
+            for nom in noms:
+                self.patients.setdefault(nom, None)
+
+    def _preparer(self, numero, ligne):
+        """Rendez_vous non enregistré, ou motif de refus (str)."""
+        if '_erreur' in ligne:
+            return ligne['_erreur']
+        try:
+            dt = datetime.fromisoformat((ligne.get('date') or '').replace('Z', '+00:00'))
+        except ValueError:
+            return 'date invalide'
+        if timezone.is_naive(dt):
+            dt = timezone.make_aware(dt)
+        identifiant = (ligne.get('utilisateur') or '').strip()
+        if identifiant:
+            user_id = self.utilisateurs.get(identifiant)
+        else:
+            user_id = self.patients.get((ligne.get('patient') or '').strip().lower())
+            if user_id == 'ambigu':
+                return 'patient ambigu (plusieurs patients portent ce nom)'
+        if not user_id:
+            return 'utilisateur / patient inconnu'
+        service_id = None
+        if ligne.get('service'):
+            service_id = self.services.get(ligne['service'].strip().lower())
+            if service_id is None:
+                return 'service inconnu'
+        status = ligne.get('status') or 'pending'
+        priority = ligne.get('priority') or 'normal'
+        if status not in STATUTS:
+            return 'statut invalide'
+        if priority not in PRIORITES:
+            return 'priorité invalide'
+        if not self.options['hors_grille'] and not est_creneau_horaire_officiel(dt):
+            return 'hors grille officielle'
+        return Rendez_vous(
+            titre=(ligne.get('titre') or 'Rendez-vous')[:200],
+            description=ligne.get('description') or '',
+            date=dt,
+            utilisateur_id=user_id,
+            service_id=service_id,
+            status=status,
+            priority=priority,
+        )
+
+    def _importer_lot(self, lot):
+        self._charger_personnes(lot)
+        candidats = []
+        for numero, ligne in lot:
+            rdv = self._preparer(numero, ligne)
+            if isinstance(rdv, str):
+                self._refuser(numero, ligne, rdv)
+            else:
+                candidats.append((numero, ligne, rdv))
+        if not candidats:
+            return 0
+
+        # Vérification en bloc : jours de fermeture et postes déjà occupés (2 requêtes par lot)
+        jours = [jour_cabinet(rdv.date) for _, _, rdv in candidats]
+        fermes = set(JourFermeture.objects.filter(date__gte=min(jours), date__lte=max(jours)).values_list('date', flat=True))
+        actifs = [rdv.date for _, _, rdv in candidats if rdv.status != 'cancelled']
+        pris = {}
+        if actifs:
+            for instant, *place in Rendez_vous.objects.filter(creneau_actif__in=actifs).values_list(
+                'creneau_actif', 'poste', 'service_id', 'rang_service'
+            ):
+                pris.setdefault(instant, []).append(place)
+        a_inserer = []
+        attribuees = []  # (instant, place) ajoutées à self.places par ce lot
+        for (numero, ligne, rdv), jour in zip(candidats, jours):
+            if rdv.status != 'cancelled':
+                if jour in fermes:
+                    self._refuser(numero, ligne, 'jour de fermeture')
+                    continue
+                places = self.places.setdefault(rdv.date, [])
+                place = premier_poste_libre(
+                    pris.get(rdv.date, []) + places, rdv.service_id, self.capacites.get(rdv.service_id)
+                )
+                if place is None:
+                    self._refuser(numero, ligne, 'créneau complet')
+                    continue
+                rdv.poste, rdv.rang_service = place
+                places.append((place[0], rdv.service_id, place[1]))
+                attribuees.append((rdv.date, places[-1]))
+            a_inserer.append((numero, ligne, rdv))
+        if self.options['dry_run'] or not a_inserer:
+            return len(a_inserer)
+
+        try:
+            with transaction.atomic():
+                inseres = [rdv for _, _, rdv in a_inserer]
+                Rendez_vous.objects.bulk_create(inseres)
+                self._apres_insertion(inseres)
+        except IntegrityError:
+            # Poste pris entre la vérification et l'insertion : on repasse ligne par ligne par
+            # save(), qui choisit un poste libre et tient compteurs, cache et file à jour
+            inseres = []
+            for numero, ligne, rdv in a_inserer:
+                rdv.pk = None
+                rdv._state.adding = True
+                try:
+                    with transaction.atomic():
+                        rdv.save()
+                    inseres.append(rdv)
+                except IntegrityError:
+                    self._refuser(numero, ligne, 'créneau complet')
+            # Places du lot refaites d'après les lignes réellement insérées (postes choisis par save())
+            for instant, place in attribuees:
+                self.places[instant].remove(place)
+            for rdv in inseres:
+                if rdv.status != 'cancelled':
+                    self.places.setdefault(rdv.date, []).append((rdv.poste, rdv.service_id, rdv.rang_service))
+        return len(inseres)
+
+    def _apres_insertion(self, rdvs):
+        """bulk_create ne passe pas par save() : compteurs, cache, file d'attente et marqueurs à la main."""
+        StatistiqueJour.ajuster(Counter(
+            (jour_cabinet(r.date), r.status, r.priority, r.service_id) for r in rdvs
+        ))
+        invalider_jours([r.date for r in rdvs if r.status != 'cancelled'])
+        transaction.on_commit(notifier_file_attente)
+        marqueurs.toucher(marqueurs.RDV)
+
+    def _ecrire_rapport(self):
+        if not self.conflits:
+            return
+        chemin = self.options['rapport']
+        sortie = open(chemin, 'w', encoding='utf-8', newline='') if chemin else self.stdout
+        try:
+            writer = csv.writer(sortie)
+            writer.writerow(['ligne', 'date', 'patient', 'motif'])
+            writer.writerows(self.conflits)
+        finally:
+            if chemin:
+                sortie.close()
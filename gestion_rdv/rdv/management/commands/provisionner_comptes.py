@@ -0,0 +1,65 @@
+"""
+Commande: crée en masse des comptes (User + Utilisateur, et Patient + Compte pour le rôle user)
+depuis un fichier CSV ou JSONL, par lots insérés avec bulk_create (voir rdv.provisionnement).
+
+Colonnes reconnues : username, email (l'un des deux obligatoire), password, first_name,
+last_name, nom, role (user par défaut). Par défaut, les comptes sans password reçoivent par
+email une invitation à choisir leur mot de passe (RDV_URL_SITE pour le lien). Un mot de
+passe fourni (colonne password ou --mot-de-passe) est haché compte par compte (lent sur
+des milliers de comptes) et devra être changé à la première connexion.
+
+Usage (depuis le dossier où se trouve manage.py):
+  python manage.py provisionner_comptes patients.csv
+  python manage.py provisionner_comptes patients.jsonl --lot 2000 --sans-invitation
+  python manage.py provisionner_comptes agents.csv --mot-de-passe 'Bienvenue-2026'
+"""
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rdv.provisionnement import provisionner_comptes
+
+
+class Command(BaseCommand):
+    help = "Crée en masse des comptes patients / agents (CSV / JSONL) par lots."
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='Par défaut : extension du fichier.')
+        parser.add_argument('--lot', type=int, default=1000, help='Comptes par lot / transaction.')
+        parser.add_argument(
+            '--mot-de-passe', help='Mot de passe initial des lignes sans colonne password (à changer à la connexion).'
+        )
+        parser.add_argument(
+            '--sans-invitation', action='store_true', help="N'envoie pas d'email aux comptes sans mot de passe."
+        )
+
+    def handle(self, *args, **options):
+        format = options['format'] or ('jsonl' if options['fichier'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        try:
+            fichier = open(options['fichier'], encoding='utf-8', newline='')
+        except OSError as exc:
+            raise CommandError(str(exc))
+        with fichier:
+            bilan = provisionner_comptes(
+                self._lire(fichier, format), options['lot'], options['mot_de_passe'],
+                inviter=not options['sans_invitation'],
+            )
+        for identifiant, motif in bilan.ignores:
+            self.stdout.write(f"Ignoré {identifiant or '(vide)'} : {motif}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Terminé. {bilan.crees} compte(s) créé(s), {len(bilan.ignores)} ignoré(s), "
+            f"{bilan.invites} invitation(s) envoyée(s)."
+        ))
+
+    def _lire(self, fichier, format):
+        if format == 'csv':
+            yield from csv.DictReader(fichier)
+            return
+        for numero, texte in enumerate(fichier, 1):
+            if texte.strip():
+                try:
+                    yield json.loads(texte)
+                except ValueError:
+                    raise CommandError(f'Ligne {numero} : JSON invalide')
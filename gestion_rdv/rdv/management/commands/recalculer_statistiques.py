@@ -0,0 +1,24 @@
+"""
+Commande: reconstruit les compteurs journaliers (StatistiqueJour) à partir des rendez-vous.
+À lancer après une reprise de données, ou pour vérifier / corriger les compteurs.
+
+Usage (depuis le dossier où se trouve manage.py):
+  python manage.py recalculer_statistiques
+  python manage.py recalculer_statistiques --debut 2026-01-01 --fin 2026-12-31
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from rdv.models import recalculer_statistiques
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs journaliers des rendez-vous (tableau de bord admin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', type=date.fromisoformat, help='Premier jour (AAAA-MM-JJ), inclus.')
+        parser.add_argument('--fin', type=date.fromisoformat, help='Dernier jour (AAAA-MM-JJ), inclus.')
+
+    def handle(self, *args, **options):
+        n = recalculer_statistiques(options['debut'], options['fin'])
+        self.stdout.write(self.style.SUCCESS(f"Terminé. {n} ligne(s) de compteurs recalculée(s)."))
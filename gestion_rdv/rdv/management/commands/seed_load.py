@@ -0,0 +1,44 @@
+"""
+Commande: remplit la base avec un jeu de données synthétique réaliste (voir rdv.jeu_de_donnees),
+pour mesurer les vues et fonctions chaudes à volume réel. À réserver aux bases de développement.
+
+Usage (depuis le dossier où se trouve manage.py):
+  python manage.py seed_load
+  python manage.py seed_load --utilisateurs 5000 --rdv 50000 --jours-passes 720 --graine 7
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rdv.jeu_de_donnees import Volumes, generer
+
+
+class Command(BaseCommand):
+    help = "Crée utilisateurs, services, fermetures et rendez-vous synthétiques par lots."
+
+    def add_arguments(self, parser):
+        defaut = Volumes()
+        parser.add_argument('--utilisateurs', type=int, default=defaut.utilisateurs)
+        parser.add_argument('--services', type=int, default=defaut.services, help='8 au plus.')
+        parser.add_argument('--fermetures', type=int, default=defaut.fermetures)
+        parser.add_argument('--rdv', type=int, default=defaut.rdv)
+        parser.add_argument('--jours-passes', type=int, default=defaut.jours_passes)
+        parser.add_argument('--jours-futurs', type=int, default=defaut.jours_futurs)
+        parser.add_argument('--graine', type=int, default=42, help='Même graine, même jeu.')
+        parser.add_argument('--prefixe', default='charge', help='Préfixe des usernames créés.')
+        parser.add_argument('--lot', type=int, default=1000, help='Lignes par INSERT groupé.')
+
+    def handle(self, *args, **options):
+        volumes = Volumes(**{
+            champ: options[champ]
+            for champ in ('utilisateurs', 'services', 'fermetures', 'rdv', 'jours_passes', 'jours_futurs')
+        })
+        if min(vars(volumes).values()) < 0:
+            raise CommandError('Les volumes doivent être positifs.')
+        debut = time.perf_counter()
+        bilan = generer(volumes, options['graine'], options['prefixe'], options['lot'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Terminé en {time.perf_counter() - debut:.1f} s : {bilan['utilisateurs']} utilisateur(s), "
+            f"{bilan['services']} service(s), {bilan['fermetures']} fermeture(s), {bilan['rdv']} RDV "
+            f"({bilan['refuses']} non placé(s), créneaux complets)."
+        ))
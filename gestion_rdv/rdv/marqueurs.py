@@ -0,0 +1,94 @@
+"""
+Marqueurs de changement pour les GET conditionnels (ETag / Last-Modified → 304).
+
+Chaque marqueur (RDV, services, fermetures, patients) est un couple (version, horodatage)
+rangé dans le cache Django (partagé entre processus, voir rdv/checks.py) et renouvelé
+après commit par les signaux. Savoir si une page a changé ne coûte qu'une lecture groupée
+du cache : ni requête SQL, ni rendu de gabarit.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+RDV = 'rdv'
+SERVICES = 'services'
+FERMETURES = 'fermetures'
+PATIENTS = 'patients'
+
+_PREFIXE = 'rdv:marqueur'
+
+
+def _cle(nom):
+    return f'{_PREFIXE}:{nom}'
+
+
+def _nouveau():
+    return time.time_ns(), time.time()
+
+
+def lire(*noms):
+    """(empreinte des versions, horodatage du dernier changement) des marqueurs `noms`."""
+    cles = [_cle(nom) for nom in noms]
+    valeurs = cache.get_many(cles)
+    for cle in cles:
+        if cle not in valeurs:
+            valeur = _nouveau()
+            if not cache.add(cle, valeur, None):
+                valeur = cache.get(cle, valeur)
+            valeurs[cle] = valeur
+    empreinte = ':'.join(str(valeurs[cle][0]) for cle in cles)
+    return empreinte, max(valeurs[cle][1] for cle in cles)
+
+
+def toucher(*noms):
+    """Renouvelle les marqueurs après le commit de la transaction en cours."""
+    transaction.on_commit(lambda: cache.set_many({_cle(nom): _nouveau() for nom in noms}, None))
+
+
+def reponse_conditionnelle(request, repere, rendu, prive=False):
+    """
+    304 si le client a déjà la version décrite par `repere` = (etag, last_modified en secondes),
+    sinon la réponse de `rendu()`. L'ETag tient aussi compte de l'utilisateur et du jeton CSRF :
+    une page rendue pour quelqu'un d'autre n'est jamais resservie. Pas de 304 tant qu'un
+    message flash attend d'être affiché.
+
+    Toujours `no-cache` + `Vary: Cookie` (revalidation à chaque affichage) ; `prive` ajoute
+    `private` pour les pages propres à l'utilisateur, qu'un cache partagé ne doit pas garder.
+    """
+    if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+        return rendu()
+    etag, last_modified = repere
+    etag = quote_etag(hashlib.md5(
+        f'{etag}|{request.user.pk or ""}|{request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")}'.encode(),
+        usedforsecurity=False,
+    ).hexdigest())
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if response is None:
+        response = rendu()
+        if response.status_code != 200:
+            return response
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    if prive:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def conditionnel(*noms, prive=False):
+    """Décorateur de vue : GET conditionnel sur les marqueurs `noms` (`prive` : page propre à l'utilisateur)."""
+    def decorateur(vue):
+        @wraps(vue)
+        def wrapper(request, *args, **kwargs):
+            return reponse_conditionnelle(request, lire(*noms), lambda: vue(request, *args, **kwargs), prive)
+        return wrapper
+    return decorateur
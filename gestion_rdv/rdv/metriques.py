@@ -0,0 +1,169 @@
+"""
+Métriques en mémoire du processus, exposées au format texte Prometheus (vue `metriques`, /metrics).
+
+MetriquesMiddleware mesure chaque requête par nom d'URL résolu : durée (histogramme), nombre
+de requêtes SQL (histogramme), temps SQL et taille des réponses (compteurs). `chronometre`
+mesure les chemins chauds (moteur de créneaux dans forms.py, file d'attente dans
+RendezVousManager) sous `rdv_operation_duration_seconds{operation=...}`.
+
+Les compteurs vivent dans chaque processus (un jeu par worker gunicorn / uWSGI) et repartent
+de zéro au redémarrage : Prometheus calcule les taux avec rate(), qui gère les remises à zéro.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+_verrou = threading.Lock()
+
+DUREES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+NOMBRES_REQUETES = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Famille:
+    """Une métrique Prometheus et ses séries, indexées par le tuple des valeurs d'étiquettes."""
+
+    def __init__(self, nom, aide, type, etiquettes, seuils=None):
+        self.nom = nom
+        self.aide = aide
+        self.type = type
+        self.etiquettes = etiquettes
+        self.seuils = seuils
+        self.series = {}
+
+    def ajouter(self, valeurs, montant=1):
+        with _verrou:
+            self.series[valeurs] = self.series.get(valeurs, 0) + montant
+
+    def observer(self, valeurs, mesure):
+        with _verrou:
+            serie = self.series.get(valeurs)
+            if serie is None:
+                # [compte par seuil (non cumulé), somme, total]
+                serie = self.series[valeurs] = [[0] * len(self.seuils), 0.0, 0]
+            i = bisect_left(self.seuils, mesure)
+            if i < len(self.seuils):
+                serie[0][i] += 1
+            serie[1] += mesure
+            serie[2] += 1
+
+    def _etiquettes(self, valeurs, *extra):
+        paires = list(zip(self.etiquettes, valeurs)) + list(extra)
+        if not paires:
+            return ''
+        return '{' + ','.join(f'{k}="{_echapper(v)}"' for k, v in paires) + '}'
+
+    def exposer(self):
+        lignes = [f'# HELP {self.nom} {self.aide}', f'# TYPE {self.nom} {self.type}']
+        with _verrou:
+            series = sorted((v, s if self.type == 'counter' else (list(s[0]), s[1], s[2])) for v, s in self.series.items())
+        for valeurs, serie in series:
+            if self.type == 'counter':
+                lignes.append(f'{self.nom}{self._etiquettes(valeurs)} {_nombre(serie)}')
+                continue
+            comptes, somme, total = serie
+            cumul = 0
+            for seuil, compte in zip(self.seuils, comptes):
+                cumul += compte
+                lignes.append(f'{self.nom}_bucket{self._etiquettes(valeurs, ("le", _nombre(seuil)))} {cumul}')
+            lignes.append(f'{self.nom}_bucket{self._etiquettes(valeurs, ("le", "+Inf"))} {total}')
+            lignes.append(f'{self.nom}_sum{self._etiquettes(valeurs)} {_nombre(somme)}')
+            lignes.append(f'{self.nom}_count{self._etiquettes(valeurs)} {total}')
+        return lignes
+
+
+def _echapper(valeur):
+    return str(valeur).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _nombre(valeur):
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+REQUETES = Famille('rdv_http_requests_total', 'Requêtes HTTP par vue, méthode et statut.', 'counter', ('vue', 'methode', 'statut'))
+DUREE_REQUETES = Famille('rdv_http_request_duration_seconds', 'Durée des requêtes HTTP par vue.', 'histogram', ('vue',), DUREES)
+TAILLE_REPONSES = Famille('rdv_http_response_bytes_total', 'Octets de réponse par vue (hors flux).', 'counter', ('vue',))
+REQUETES_SQL = Famille('rdv_db_queries', 'Requêtes SQL par requête HTTP, par vue.', 'histogram', ('vue',), NOMBRES_REQUETES)
+DUREE_SQL = Famille('rdv_db_duration_seconds_total', 'Temps passé en base par vue.', 'counter', ('vue',))
+OPERATIONS = Famille('rdv_operation_duration_seconds', 'Durée des opérations internes (créneaux, file).', 'histogram', ('operation',), DUREES)
+
+FAMILLES = (REQUETES, DUREE_REQUETES, TAILLE_REPONSES, REQUETES_SQL, DUREE_SQL, OPERATIONS)
+
+
+def exposer():
+    """Toutes les métriques au format texte Prometheus 0.0.4."""
+    lignes = []
+    for famille in FAMILLES:
+        lignes.extend(famille.exposer())
+    return '\n'.join(lignes) + '\n'
+
+
+def reinitialiser():
+    """Vide toutes les séries (tests)."""
+    with _verrou:
+        for famille in FAMILLES:
+            famille.series.clear()
+
+
+class chronometre(ContextDecorator):
+    """Mesure un bloc ou une fonction : `with chronometre('file.appeler'):` ou `@chronometre(...)`."""
+
+    def __init__(self, operation):
+        self.operation = (operation,)
+        self._debuts = threading.local()
+
+    def __enter__(self):
+        pile = getattr(self._debuts, 'pile', None)
+        if pile is None:
+            pile = self._debuts.pile = []
+        pile.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        OPERATIONS.observer(self.operation, time.perf_counter() - self._debuts.pile.pop())
+        return False
+
+
+class _CompteurSQL:
+    """execute_wrapper : nombre et durée des requêtes SQL de la requête HTTP en cours."""
+
+    def __init__(self):
+        self.nombre = 0
+        self.duree = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duree += time.perf_counter() - debut
+            self.nombre += 1
+
+
+class MetriquesMiddleware:
+    """Mesure chaque requête sous le nom de sa route (`rdv_list`, `admin:index`…). Désactivable : RDV_METRIQUES."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'RDV_METRIQUES', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sql = _CompteurSQL()
+        debut = time.perf_counter()
+        with connection.execute_wrapper(sql):
+            response = self.get_response(request)
+        duree = time.perf_counter() - debut
+        match = getattr(request, 'resolver_match', None)
+        vue = (match.view_name if match else None) or 'non_resolue'
+        REQUETES.ajouter((vue, request.method, str(response.status_code)))
+        DUREE_REQUETES.observer((vue,), duree)
+        REQUETES_SQL.observer((vue,), sql.nombre)
+        DUREE_SQL.ajouter((vue,), sql.duree)
+        if not response.streaming:
+            TAILLE_REPONSES.ajouter((vue,), len(response.content))
+        return response
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:22
+
+from django.db import migrations, models
+from django.db.models import Count
+
+DOUBLONS_AFFICHES = 50
+
+
+def verifier_doublons(apps, schema_editor):
+    """
+    Refuse de poser l'index unique tant que deux RDV actifs partagent un créneau : sur MySQL
+    (DDL non transactionnel), l'index échouerait sur une migration à moitié appliquée. Aucun
+    RDV n'est modifié ici : le cabinet choisit lequel annuler ou déplacer (`manage.py dbshell`,
+    l'admin suppose le schéma à jour), puis relance `migrate`.
+    """
+    Rendez_vous = apps.get_model('rdv', 'Rendez_vous')
+    actifs = Rendez_vous.objects.exclude(status='cancelled')
+    dates = list(
+        actifs.values('date').annotate(nombre=Count('pk')).filter(nombre__gt=1).order_by('date').values_list('date', flat=True)
+    )
+    if not dates:
+        return
+    pks = {}
+    for date, pk in actifs.filter(date__in=dates[:DOUBLONS_AFFICHES]).order_by('date', 'pk').values_list('date', 'pk'):
+        pks.setdefault(date, []).append(str(pk))
+    lignes = [f"  {date:%Y-%m-%d %H:%M} : RDV {', '.join(ids)}" for date, ids in pks.items()]
+    if len(dates) > DOUBLONS_AFFICHES:
+        lignes.append(f'  … et {len(dates) - DOUBLONS_AFFICHES} autres créneaux')
+    raise RuntimeError(
+        f'{len(dates)} créneau(x) portent plusieurs rendez-vous actifs. Annuler ou déplacer les '
+        "doublons (manage.py dbshell : UPDATE rdv_rendez_vous SET status = 'cancelled' WHERE id IN (…)), "
+        'puis relancer migrate :\n' + '\n'.join(lignes)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdv', '0009_set_horaires_cabinet'),
+    ]
+
+    operations = [
+        migrations.RunPython(verifier_doublons, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='rendez_vous',
+            name='creneau_actif',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(('status', 'cancelled'), _negated=True), then=models.F('date')), default=None), output_field=models.DateTimeField(null=True)),
+        ),
+        migrations.AddConstraint(
+            model_name='rendez_vous',
+            constraint=models.UniqueConstraint(fields=('creneau_actif',), name='rdv_creneau_actif_unique'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdv', '0010_rendez_vous_creneau_actif_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rendez_vous',
+            index=models.Index(fields=['status', 'date'], name='rdv_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rendez_vous',
+            index=models.Index(fields=['date', 'status'], name='rdv_date_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rendez_vous',
+            index=models.Index(fields=['utilisateur', 'date'], name='rdv_utilisateur_date_idx'),
+        ),
+    ]
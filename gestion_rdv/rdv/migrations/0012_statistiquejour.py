@@ -0,0 +1,56 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:29
+
+from collections import Counter
+from zoneinfo import ZoneInfo
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def remplir_statistiques(apps, schema_editor):
+    """Compteurs initiaux à partir des RDV existants (même calcul que recalculer_statistiques)."""
+    Rendez_vous = apps.get_model('rdv', 'Rendez_vous')
+    StatistiqueJour = apps.get_model('rdv', 'StatistiqueJour')
+    tz = ZoneInfo(str(settings.TIME_ZONE))
+    compteurs = Counter(
+        (timezone.localtime(date, tz).date(), status, priority, service_id)
+        for date, status, priority, service_id in Rendez_vous.objects.values_list(
+            'date', 'status', 'priority', 'service_id'
+        ).iterator(chunk_size=5000)
+    )
+    StatistiqueJour.objects.bulk_create(
+        [
+            StatistiqueJour(jour=jour, status=status, priority=priority, service_id=service_id, nombre=n)
+            for (jour, status, priority, service_id), n in compteurs.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdv', '0011_rendez_vous_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiqueJour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('status', models.CharField(max_length=10)),
+                ('priority', models.CharField(max_length=10)),
+                ('nombre', models.IntegerField(default=0)),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='rdv.service')),
+            ],
+            options={
+                'verbose_name': 'Statistique journalière',
+                'verbose_name_plural': 'Statistiques journalières',
+                'indexes': [models.Index(fields=['jour', 'status', 'priority'], name='rdv_stat_jour_idx')],
+            },
+        ),
+        migrations.RunPython(remplir_statistiques, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdv', '0012_statistiquejour'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rendez_vous',
+            name='annule_le',
+            field=models.DateTimeField(blank=True, editable=False, help_text="Date de l'annulation", null=True),
+        ),
+    ]
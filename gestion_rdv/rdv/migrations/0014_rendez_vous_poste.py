@@ -0,0 +1,41 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdv', '0013_rendez_vous_annule_le'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rendez_vous',
+            name='poste',
+            field=models.PositiveSmallIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='rendez_vous',
+            name='rang_service',
+            field=models.PositiveSmallIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='capacite',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='RDV simultanés max pour ce service sur un créneau (vide = seulement la capacité du cabinet)', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='rendez_vous',
+            constraint=models.UniqueConstraint(fields=('creneau_actif', 'poste'), name='rdv_creneau_poste_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='rendez_vous',
+            constraint=models.UniqueConstraint(fields=('creneau_actif', 'service', 'rang_service'), name='rdv_creneau_service_rang_unique'),
+        ),
+        # Retirée après la création des nouvelles : le créneau reste protégé pendant la migration
+        migrations.RemoveConstraint(
+            model_name='rendez_vous',
+            name='rdv_creneau_actif_unique',
+        ),
+    ]
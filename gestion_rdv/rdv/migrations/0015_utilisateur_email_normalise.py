@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:48
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Lower, Trim
+
+
+def remplir_emails(apps, schema_editor):
+    """Copie User.email (minuscules, sans espaces) dans les profils existants."""
+    User = apps.get_model('auth', 'User')
+    Utilisateur = apps.get_model('rdv', 'Utilisateur')
+    email = User.objects.filter(pk=OuterRef('user_id')).values('email')[:1]
+    Utilisateur.objects.update(email_normalise=Lower(Trim(Subquery(email))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('rdv', '0014_rendez_vous_poste'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='utilisateur',
+            name='email_normalise',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=254),
+        ),
+        migrations.RunPython(remplir_emails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdv', '0015_utilisateur_email_normalise'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fileattente',
+            name='priorite',
+            field=models.CharField(choices=[('normal', 'Normal'), ('urgent', 'Urgent'), ('control', 'Contrôle')], default='normal', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='rendez_vous',
+            name='priority',
+            field=models.CharField(choices=[('normal', 'Cas ordinaire'), ('urgent', 'Urgent'), ('control', 'Contrôle')], default='normal', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdv', '0016_alter_priority_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='utilisateur',
+            name='mot_de_passe_a_changer',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,12 +1,19 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from decimal import Decimal
 
+from .metriques import chronometre
+
 
 class Service(models.Model):
 	"""Service proposé (ex: Consultation, Radiologie)."""
 	nom = models.CharField(max_length=150)
 	duree_minutes = models.PositiveIntegerField(default=30, help_text='Durée en minutes')
+	capacite = models.PositiveSmallIntegerField(
+		null=True, blank=True,
+		help_text='RDV simultanés max pour ce service sur un créneau (vide = seulement la capacité du cabinet)',
+	)
 	description = models.TextField(blank=True)
 	image_url = models.URLField(blank=True, help_text='URL image pour la carte "Notre travail"')
 
@@ -68,14 +75,101 @@ class CreneauHoraire(models.Model):
 		return f"{self.get_jour_display()} {self.heure_debut} - {self.heure_fin}"
 
 
+class FileDisputee(Exception):
+    """appeler_prochain : chaque candidat a été pris par un autre agent, réessayer."""
+
+
 class RendezVousManager(models.Manager):
+    def _queue_rank(self):
+        return models.Case(models.When(priority='urgent', then=0), default=1)
+
     def _queue_order(self, qs):
-        return qs.order_by(
-            models.Case(models.When(priority='urgent', then=0), default=1),
-            'date',
-            'created_at',
+        return qs.order_by(self._queue_rank(), 'date', 'created_at', 'pk')
+
+    def with_queue_position(self):
+        """File d'attente (RDV pending, dans l'ordre) annotée de `position_file` via ROW_NUMBER() et `patient_nom`."""
+        from django.db.models.functions import RowNumber
+
+        position = models.Window(
+            RowNumber(),
+            order_by=[self._queue_rank().asc(), models.F('date').asc(), models.F('created_at').asc(), models.F('pk').asc()],
+        )
+        qs = self.with_patient_name().filter(status='pending').annotate(position_file=position)
+        return self._queue_order(qs)
+
+    def with_position_file(self, qs):
+        """
+        `qs` annoté de `position_file` (None hors pending) par sous-requête corrélée, même règle
+        que queue_position_of : pour une page de RDV, sans numéroter toute la file.
+        """
+        from django.db.models import Count, OuterRef, Q, Subquery
+        from django.db.models.functions import Coalesce
+
+        devant = (
+            Q(date__lt=OuterRef('date'))
+            | Q(date=OuterRef('date'), created_at__lt=OuterRef('created_at'))
+            | Q(date=OuterRef('date'), created_at=OuterRef('created_at'), pk__lt=OuterRef('pk'))
+        )
+        nombre = (
+            self.filter(status='pending')
+            .annotate(rang=self._queue_rank())
+            .filter(Q(rang__lt=OuterRef('rang_file')) | Q(rang=OuterRef('rang_file')) & devant)
+            .order_by()
+            .values('status')
+            .annotate(nombre=Count('pk'))
+            .values('nombre')
         )
+        return qs.annotate(rang_file=self._queue_rank()).annotate(
+            position_file=models.Case(
+                models.When(status='pending', then=Coalesce(Subquery(nombre), 0) + 1),
+                default=None,
+                output_field=models.IntegerField(),
+            )
+        )
+
+    @chronometre('file.position')
+    def queue_position_of(self, rdv):
+        """Position 1-based de `rdv` dans la file : COUNT des RDV pending placés devant lui."""
+        if rdv.status != 'pending':
+            return None
+        Q = models.Q
+        devant = (
+            Q(date__lt=rdv.date)
+            | Q(date=rdv.date, created_at__lt=rdv.created_at)
+            | Q(date=rdv.date, created_at=rdv.created_at, pk__lt=rdv.pk)
+        )
+        qs = self.filter(status='pending')
+        if rdv.priority == 'urgent':
+            qs = qs.filter(Q(priority='urgent') & devant)
+        else:
+            qs = qs.filter(Q(priority='urgent') | devant)
+        return qs.count() + 1
+
+    def patient_name_expression(self):
+        """
+        Expression SQL du nom d'affichage du patient : Patient.nom, sinon Utilisateur.nom,
+        sinon prénom + nom, sinon 'Patient'.
+        """
+        from django.db.models.functions import Concat, NullIf, Trim
+
+        def non_vide(expr):
+            return NullIf(Trim(expr), models.Value(''))
+
+        return Coalesce(
+            non_vide(models.F('utilisateur__patient_profile__nom')),
+            non_vide(models.F('utilisateur__profile__nom')),
+            non_vide(Concat('utilisateur__first_name', models.Value(' '), 'utilisateur__last_name')),
+            models.Value('Patient'),
+            output_field=models.CharField(),
+        )
+
+    def with_patient_name(self):
+        """RDV avec utilisateur, profils et service joints, annotés de `patient_nom` (calculé en SQL)."""
+        return self.select_related(
+            'utilisateur', 'utilisateur__patient_profile', 'utilisateur__profile', 'service'
+        ).annotate(patient_nom=self.patient_name_expression())
 
+    @chronometre('file.prochain')
     def next_in_queue(self, user=None):
         """Return the next Rendez_vous object for the queue."""
         qs = self.filter(status='pending')
@@ -85,8 +179,8 @@ class RendezVousManager(models.Manager):
                 qs = qs.filter(utilisateur=user)
         return self._queue_order(qs).first()
 
-    def next_in_queue_agent_global(self):
-        """Prochain pending : d’abord les RDV dont la date est « aujourd’hui » au cabinet, sinon file globale."""
+    def _agent_queue_order(self, qs):
+        """Ordre « agent » : d’abord les RDV du jour au cabinet, puis la file globale (une seule requête)."""
         from datetime import datetime, time, timedelta
         from django.conf import settings as dj_settings
         from django.utils import timezone as dj_tz
@@ -96,11 +190,32 @@ class RendezVousManager(models.Manager):
         today = dj_tz.localtime(dj_tz.now(), tz).date()
         start = datetime.combine(today, time.min, tzinfo=tz)
         end = datetime.combine(today + timedelta(days=1), time.min, tzinfo=tz)
-        qs = self.filter(status='pending')
-        hit = self._queue_order(qs.filter(date__gte=start, date__lt=end)).first()
-        if hit:
-            return hit
-        return self._queue_order(qs).first()
+        du_jour = models.Case(models.When(date__gte=start, date__lt=end, then=0), default=1)
+        return qs.order_by(du_jour, self._queue_rank(), 'date', 'created_at', 'pk')
+
+    @chronometre('file.prochain_agent')
+    def next_in_queue_agent_global(self):
+        """Prochain pending : d’abord les RDV dont la date est « aujourd’hui » au cabinet, sinon file globale."""
+        return self._agent_queue_order(self.with_patient_name().filter(status='pending')).first()
+
+    @chronometre('file.appeler')
+    def appeler_prochain(self, tentatives=5):
+        """
+        Réserve le prochain RDV pending (ordre de next_in_queue_agent_global) et le passe en
+        'confirmed'. Le candidat est lu sans verrou (sur MySQL, un ORDER BY CASE … FOR UPDATE
+        trie et verrouille toutes les lignes parcourues) ; l'exclusivité vient de l'UPDATE
+        conditionnel pending → confirmed : si un autre agent a pris ce patient entre-temps, on
+        passe au suivant. Renvoie le RDV appelé, None si la file est vide ; FileDisputee si les
+        `tentatives` candidats ont tous été pris par d'autres agents.
+        """
+        for _ in range(tentatives):
+            candidat = self._agent_queue_order(self.filter(status='pending')).first()
+            if candidat is None:
+                return None
+            if update_rendez_vous(self.filter(pk=candidat.pk, status='pending'), status='confirmed'):
+                candidat.status = 'confirmed'
+                return candidat
+        raise FileDisputee(f'{tentatives} patients appelés par d’autres agents pendant la tentative.')
 
 
 class Rendez_vous(models.Model):
@@ -128,23 +243,133 @@ class Rendez_vous(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='normal')
     service = models.ForeignKey(Service, on_delete=models.SET_NULL, null=True, blank=True, related_name='rendez_vous')
+    annule_le = models.DateTimeField(null=True, blank=True, editable=False, help_text="Date de l'annulation")
+    # Fauteuil occupé sur le créneau (1..RDV_CAPACITE_CRENEAU) et rang parmi les RDV du même
+    # service (1..Service.capacite) : attribués à l'enregistrement, garantis par les index uniques.
+    poste = models.PositiveSmallIntegerField(default=1, editable=False)
+    rang_service = models.PositiveSmallIntegerField(default=1, editable=False)
+    # Instant du créneau tant que le RDV n'est pas annulé, NULL sinon : les index uniques
+    # ne portent que sur les RDV actifs (MySQL ignore les contraintes conditionnelles).
+    creneau_actif = models.GeneratedField(
+        expression=models.Case(
+            models.When(~models.Q(status='cancelled'), then=models.F('date')),
+            default=None,
+        ),
+        output_field=models.DateTimeField(null=True),
+        db_persist=True,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-priority', 'date', 'created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['creneau_actif', 'poste'], name='rdv_creneau_poste_unique'),
+            models.UniqueConstraint(
+                fields=['creneau_actif', 'service', 'rang_service'], name='rdv_creneau_service_rang_unique'
+            ),
+        ]
+        indexes = [
+            # File d'attente : status='pending' + tri/plage sur date
+            models.Index(fields=['status', 'date'], name='rdv_status_date_idx'),
+            # Plages de jours (tableau agent, créneaux, admin) avec filtre sur le statut
+            models.Index(fields=['date', 'status'], name='rdv_date_status_idx'),
+            # « Mes rendez-vous » : RDV d'un patient triés par date
+            models.Index(fields=['utilisateur', 'date'], name='rdv_utilisateur_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.titre} ({self.date:%Y-%m-%d %H:%M})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Date lue en base : permet d'invalider aussi l'ancien jour quand le RDV est déplacé
+        instance._date_chargee = instance.__dict__.get('date')
+        instance._cle_stat_chargee = _cle_statistique(instance)
+        instance._creneau_charge = _creneau_occupe(instance)
+        return instance
+
+    def _place_libre(self, chevauchements=False):
+        """
+        (poste, rang_service) libres pour ce RDV, ou None. Par défaut seuls les RDV actifs du
+        même instant comptent (ce que garantissent les index uniques) ; avec `chevauchements`,
+        tous ceux du jour dont [date, date + durée du service) recoupe l'intervalle de ce RDV.
+        """
+        from datetime import timedelta
+        from .cache_creneaux import bornes_jour
+        from .horaires import duree_pour_service
+
+        service = self.service if self.service_id else None
+        qs = Rendez_vous.objects.exclude(pk=self.pk)
+        if chevauchements:
+            debut = self.date
+            fin = debut + timedelta(minutes=duree_pour_service(service))
+            duree_defaut = duree_pour_service(None)
+            jour = bornes_jour(jour_cabinet(debut))
+            pris = [
+                (poste, service_id, rang)
+                for date, duree, poste, service_id, rang in qs.filter(
+                    date__gte=jour[0], date__lt=jour[1]
+                ).exclude(status='cancelled').values_list(
+                    'date', 'service__duree_minutes', 'poste', 'service_id', 'rang_service'
+                )
+                if date < fin and debut < date + timedelta(minutes=duree or duree_defaut)
+            ]
+        else:
+            pris = qs.filter(creneau_actif=self.date).values_list('poste', 'service_id', 'rang_service')
+        return premier_poste_libre(pris, self.service_id, service.capacite if service else None)
+
+    def _attribuer_poste(self):
+        """Premier poste libre du créneau (et rang libre dans le service) ; IntegrityError si complet."""
+        from django.db import IntegrityError
+
+        place = self._place_libre()
+        if place is None:
+            raise IntegrityError('Créneau complet.')
+        self.poste, self.rang_service = place
+
+    def clean(self):
+        """Formulaires (admin compris) : refuse un RDV qui chevauche des RDV occupant tous les postes."""
+        from django.core.exceptions import ValidationError
+
+        creneau = _creneau_occupe(self)
+        if creneau[0] is None or creneau in (getattr(self, '_creneau_charge', None), getattr(self, '_creneau_verifie', None)):
+            return
+        if self._place_libre(chevauchements=True) is None:
+            raise ValidationError({'date': 'Ce créneau chevauche des rendez-vous existants (cabinet complet).'})
+
+    def save(self, *args, **kwargs):
+        from django.utils import timezone as dj_tz
+
+        annule_le = self.annule_le
+        if self.status != 'cancelled':
+            self.annule_le = None
+        elif self.annule_le is None:
+            self.annule_le = dj_tz.now()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.annule_le != annule_le:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'annule_le'}
+        # Le RDV et ses compteurs journaliers (StatistiqueJour) sont écrits ensemble
+        with transaction.atomic():
+            creneau = _creneau_occupe(self)
+            if creneau[0] is not None and (self._state.adding or creneau != getattr(self, '_creneau_charge', None)):
+                self._attribuer_poste()
+                if update_fields is not None:
+                    kwargs['update_fields'] = {*update_fields, 'poste', 'rang_service'}
+            super().save(*args, **kwargs)
+            self._creneau_charge = creneau
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
     @property
     def queue_position(self):
-        """Compute 1-based position in the pending queue (by priority desc then date asc)."""
-        qs = Rendez_vous.objects.filter(status='pending')
-        # map priority to numeric for ordering: urgent first
-        ordered = sorted(qs, key=lambda r: (0 if r.priority == 'urgent' else 1, r.date, r.created_at))
-        try:
-            return ordered.index(self) + 1
-        except ValueError:
-            return None
+        """Compute 1-based position in the pending queue (urgent first, then date, created_at)."""
+        if hasattr(self, 'position_file'):
+            # déjà calculée en SQL par RendezVousManager.with_queue_position()
+            return self.position_file
+        return Rendez_vous.objects.queue_position_of(self)
 
 
 class Utilisateur(models.Model):
@@ -158,6 +383,10 @@ class Utilisateur(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     nom = models.CharField(max_length=150, blank=True)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='user')
+    # Copie indexée et en minuscules de User.email (auth_user.email n'a pas d'index) : connexion et inscription
+    email_normalise = models.CharField(max_length=254, blank=True, db_index=True, editable=False)
+    # Mot de passe initial fixé par le cabinet (provisionnement) : à changer à la prochaine connexion
+    mot_de_passe_a_changer = models.BooleanField(default=False)
 
     def __str__(self):
         return f"{self.user.username} ({self.role})"
@@ -225,27 +454,350 @@ class JourFermeture(models.Model):
     def __str__(self):
         return f"{self.date} — {self.motif or 'Fermé'}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Date lue en base : une fermeture déplacée rouvre aussi l'ancien jour
+        instance._date_chargee = instance.__dict__.get('date')
+        return instance
+
+
+class StatistiqueJour(models.Model):
+    """
+    Compteurs journaliers des RDV (jour cabinet × statut × priorité × service), tenus à jour
+    à chaque écriture de Rendez_vous. Statistique.generer_rapport() les additionne au lieu de
+    parcourir toute la table des RDV. Recalcul complet : `manage.py recalculer_statistiques`.
+    """
+    jour = models.DateField()
+    status = models.CharField(max_length=10)
+    priority = models.CharField(max_length=10)
+    service = models.ForeignKey(Service, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    nombre = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Statistique journalière'
+        verbose_name_plural = 'Statistiques journalières'
+        indexes = [
+            models.Index(fields=['jour', 'status', 'priority'], name='rdv_stat_jour_idx'),
+        ]
 
-from django.db.models.signals import post_save
+    def __str__(self):
+        return f"{self.jour} {self.status}/{self.priority} : {self.nombre}"
+
+    @classmethod
+    def ajuster(cls, deltas):
+        """
+        Applique {(jour, status, priority, service_id): delta}. Pas de contrainte d'unicité :
+        deux lignes pour la même clé (création concurrente) restent justes une fois sommées.
+        """
+        for (jour, status, priority, service_id), delta in deltas.items():
+            if not delta:
+                continue
+            qs = cls.objects.filter(jour=jour, status=status, priority=priority, service_id=service_id)
+            pk = qs.values_list('pk', flat=True).first()
+            if pk:
+                cls.objects.filter(pk=pk).update(nombre=models.F('nombre') + delta)
+            else:
+                cls.objects.create(jour=jour, status=status, priority=priority, service_id=service_id, nombre=delta)
+
+
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
+from .cache_creneaux import invalider_horaires, invalider_jours, jour_cabinet
+from .temps_reel import notifier_file_attente
+from . import marqueurs
+from .principal import CLE_MOT_DE_PASSE_A_CHANGER, invalider_principal
+from django.contrib.auth.signals import user_logged_in
+
+
+def normaliser_email(email):
+    """Forme de comparaison d'un email (Utilisateur.email_normalise, connexion, inscription)."""
+    return (email or '').strip().lower()
 
 
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
+def create_or_update_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Crée le profil d'un nouvel utilisateur, tient email_normalise à jour ensuite. Un save()
+    limité à des champs sans rapport (last_login à chaque connexion, mot de passe…) ne coûte
+    aucune requête.
+    """
+    if not created and update_fields is not None and 'email' not in update_fields:
+        return
+    email = normaliser_email(instance.email)
     if created:
-        Utilisateur.objects.create(user=instance, nom=instance.get_full_name() or instance.username)
+        Utilisateur.objects.create(
+            user=instance, nom=instance.get_full_name() or instance.username, email_normalise=email
+        )
     else:
-        Utilisateur.objects.get_or_create(user=instance)
+        profil, _ = Utilisateur.objects.get_or_create(user=instance, defaults={'email_normalise': email})
+        if profil.email_normalise != email:
+            Utilisateur.objects.filter(pk=profil.pk).update(email_normalise=email)
+
+
+@receiver(user_logged_in)
+def imposer_changement_mot_de_passe(sender, request, user, **kwargs):
+    """Mot de passe initial fixé par le cabinet : noté en session, PrincipalMiddleware redirige."""
+    if Utilisateur.objects.filter(user=user, mot_de_passe_a_changer=True).exists():
+        request.session[CLE_MOT_DE_PASSE_A_CHANGER] = True
 
 
 @receiver(post_save, sender=Utilisateur)
-def create_patient_for_user_role(sender, instance, **kwargs):
-    """Crée Patient + Compte quand Utilisateur a rôle user."""
-    if instance.role == 'user' and not Patient.objects.filter(user=instance.user).exists():
+def create_patient_for_user_role(sender, instance, update_fields=None, **kwargs):
+    """Crée Patient + Compte quand Utilisateur a rôle user (rien à faire si le rôle n'est pas enregistré)."""
+    if update_fields is not None and 'role' not in update_fields:
+        return
+    if instance.role == 'user' and not Patient.objects.filter(user=instance.user_id).exists():
         patient = Patient.objects.create(user=instance.user, nom=instance.nom or instance.user.username)
         Compte.objects.create(patient=patient, solde=Decimal('0.00'))
 
 
+@receiver(post_save, sender=Rendez_vous)
+@receiver(post_delete, sender=Rendez_vous)
+def invalider_creneaux_rdv(sender, instance, **kwargs):
+    """Invalide le cache des disponibilités pour le jour du RDV (et l'ancien jour s'il a bougé)."""
+    invalider_jours([instance.date, getattr(instance, '_date_chargee', None)])
+    instance._date_chargee = instance.date
+
+
+@receiver(post_save, sender=Rendez_vous)
+@receiver(post_delete, sender=Rendez_vous)
+def pousser_file_attente(sender, instance, **kwargs):
+    """Pousse le diff de la file aux écrans connectés, une fois le changement validé."""
+    transaction.on_commit(notifier_file_attente)
+    marqueurs.toucher(marqueurs.RDV)
+
+
+def update_rendez_vous(queryset, refuses=None, **fields):
+    """
+    queryset.update() sans post_save : met à jour les compteurs StatistiqueJour dans la même
+    transaction, invalide le cache des créneaux (si le statut change) et pousse la file
+    d'attente après commit. Renvoie le nombre de lignes modifiées.
+
+    Un RDV annulé qui redevient actif reprend un poste libre de son créneau ; s'il n'y en a
+    plus, il reste annulé et son pk est ajouté à `refuses` (liste fournie par l'appelant).
+    """
+    if 'status' in fields:
+        from django.utils import timezone as dj_tz
+        if fields['status'] == 'cancelled':
+            fields['annule_le'] = Coalesce('annule_le', models.Value(dj_tz.now()))
+        else:
+            fields['annule_le'] = None
+    with transaction.atomic():
+        lignes = list(queryset.select_for_update().values_list('pk', 'date', 'status', 'priority', 'service_id'))
+        places = {}
+        if fields.get('status', 'cancelled') != 'cancelled':
+            places = _places_reactivation([ligne for ligne in lignes if ligne[2] == 'cancelled'], fields)
+            exclus = [pk for pk, place in places.items() if place is None]
+            if refuses is not None:
+                refuses.extend(exclus)
+            lignes = [ligne for ligne in lignes if ligne[0] not in exclus]
+        updated = queryset.filter(pk__in=[ligne[0] for ligne in lignes if ligne[0] not in places]).update(**fields)
+        for pk, place in places.items():
+            if place is not None:
+                updated += Rendez_vous.objects.filter(pk=pk).update(poste=place[0], rang_service=place[1], **fields)
+        if not updated:
+            return 0
+        deltas = {}
+        for _, date, status, priority, service_id in lignes:
+            avant = (jour_cabinet(date), status, priority, service_id)
+            apres = (
+                avant[0],
+                fields.get('status', status),
+                fields.get('priority', priority),
+                getattr(fields.get('service'), 'pk', service_id) if 'service' in fields else service_id,
+            )
+            if avant != apres:
+                deltas[avant] = deltas.get(avant, 0) - 1
+                deltas[apres] = deltas.get(apres, 0) + 1
+        StatistiqueJour.ajuster(deltas)
+    if 'status' in fields:
+        invalider_jours([ligne[1] for ligne in lignes])
+    transaction.on_commit(notifier_file_attente)
+    marqueurs.toucher(marqueurs.RDV)
+    return updated
+
+
+def _places_reactivation(lignes, fields):
+    """
+    {pk: (poste, rang_service) ou None} pour des RDV annulés qui redeviennent actifs, attribués
+    comme premier_poste_libre le ferait à la réservation (None : créneau ou service complet).
+    Les RDV actifs des créneaux concernés sont verrouillés jusqu'à la fin de la transaction.
+    """
+    if not lignes:
+        return {}
+    pris = {}
+    for instant, *place in Rendez_vous.objects.select_for_update().filter(
+        creneau_actif__in={ligne[1] for ligne in lignes}
+    ).values_list('creneau_actif', 'poste', 'service_id', 'rang_service'):
+        pris.setdefault(instant, []).append(tuple(place))
+    if 'service' in fields:
+        service_ids = {ligne[0]: getattr(fields['service'], 'pk', None) for ligne in lignes}
+    else:
+        service_ids = {ligne[0]: ligne[4] for ligne in lignes}
+    capacites = dict(Service.objects.filter(pk__in=set(service_ids.values()) - {None}).values_list('pk', 'capacite'))
+    places = {}
+    for pk, date, *_ in sorted(lignes, key=lambda ligne: (ligne[1], ligne[0])):
+        service_id = service_ids[pk]
+        place = places[pk] = premier_poste_libre(pris.get(date, []), service_id, capacites.get(service_id))
+        if place is not None:
+            pris.setdefault(date, []).append((place[0], service_id, place[1]))
+    return places
+
+
+def recalculer_statistiques(debut=None, fin=None):
+    """
+    Reconstruit StatistiqueJour pour les jours [debut, fin] (toute la table si non précisés)
+    à partir des RDV, lus par lots. Renvoie le nombre de lignes de compteurs créées.
+    """
+    from collections import Counter
+    from .cache_creneaux import bornes_jour
+
+    rdvs = Rendez_vous.objects.all()
+    stats = StatistiqueJour.objects.all()
+    if debut:
+        rdvs = rdvs.filter(date__gte=bornes_jour(debut)[0])
+        stats = stats.filter(jour__gte=debut)
+    if fin:
+        rdvs = rdvs.filter(date__lt=bornes_jour(fin)[1])
+        stats = stats.filter(jour__lte=fin)
+    compteurs = Counter(
+        (jour_cabinet(date), status, priority, service_id)
+        for date, status, priority, service_id in rdvs.values_list(
+            'date', 'status', 'priority', 'service_id'
+        ).iterator(chunk_size=5000)
+    )
+    with transaction.atomic():
+        stats.delete()
+        StatistiqueJour.objects.bulk_create(
+            [
+                StatistiqueJour(jour=jour, status=status, priority=priority, service_id=service_id, nombre=n)
+                for (jour, status, priority, service_id), n in compteurs.items()
+            ],
+            batch_size=1000,
+        )
+    return len(compteurs)
+
+
+def capacite_creneau():
+    """Nombre de RDV simultanés sur un créneau (fauteuils / praticiens)."""
+    from django.conf import settings
+
+    return getattr(settings, 'RDV_CAPACITE_CRENEAU', 1)
+
+
+def premier_poste_libre(pris, service_id=None, capacite_service=None):
+    """
+    (poste, rang_service) libres pour un nouveau RDV, d'après les (poste, service_id, rang_service)
+    des RDV actifs du créneau ; None si le cabinet ou le service est complet sur ce créneau.
+    """
+    pris = list(pris)
+    postes = {p for p, _, _ in pris}
+    poste = next((p for p in range(1, capacite_creneau() + 1) if p not in postes), None)
+    if poste is None:
+        return None
+    if not (service_id and capacite_service):
+        # Service sans limite propre : le poste, unique sur le créneau, sert de rang
+        return poste, poste
+    rangs = {r for _, s, r in pris if s == service_id}
+    rang = next((r for r in range(1, capacite_service + 1) if r not in rangs), None)
+    return None if rang is None else (poste, rang)
+
+
+def _creneau_occupe(rdv):
+    """(instant, service_id) occupé par le RDV, instant None s'il est annulé."""
+    actif = rdv.__dict__.get('status') != 'cancelled'
+    return (rdv.__dict__.get('date') if actif else None, rdv.__dict__.get('service_id'))
+
+
+def _cle_statistique(rdv):
+    """(jour cabinet, status, priority, service_id) du RDV, ou None si un champ n'est pas chargé."""
+    valeurs = [rdv.__dict__.get(f) for f in ('date', 'status', 'priority')]
+    if None in valeurs or 'service_id' not in rdv.__dict__:
+        return None
+    return (jour_cabinet(valeurs[0]), valeurs[1], valeurs[2], rdv.service_id)
+
+
+@receiver(pre_save, sender=Rendez_vous)
+def charger_cle_statistique(sender, instance, **kwargs):
+    """RDV existant dont l'état en base est inconnu (champs différés, instance construite à la main)."""
+    if instance.pk and getattr(instance, '_cle_stat_chargee', None) is None and not instance._state.adding:
+        ancien = Rendez_vous.objects.filter(pk=instance.pk).values_list('date', 'status', 'priority', 'service_id').first()
+        if ancien:
+            instance._cle_stat_chargee = (jour_cabinet(ancien[0]),) + ancien[1:]
+
+
+@receiver(post_save, sender=Rendez_vous)
+def compter_rdv(sender, instance, created, **kwargs):
+    """Reporte le RDV dans StatistiqueJour (même transaction que le save)."""
+    avant = None if created else getattr(instance, '_cle_stat_chargee', None)
+    apres = _cle_statistique(instance)
+    if avant != apres:
+        deltas = {}
+        if avant:
+            deltas[avant] = -1
+        if apres:
+            deltas[apres] = deltas.get(apres, 0) + 1
+        StatistiqueJour.ajuster(deltas)
+    instance._cle_stat_chargee = apres
+
+
+@receiver(post_delete, sender=Rendez_vous)
+def decompter_rdv(sender, instance, **kwargs):
+    cle = getattr(instance, '_cle_stat_chargee', None) or _cle_statistique(instance)
+    if cle:
+        StatistiqueJour.ajuster({cle: -1})
+
+
+@receiver(post_save, sender=JourFermeture)
+@receiver(post_delete, sender=JourFermeture)
+def invalider_creneaux_fermeture(sender, instance, **kwargs):
+    """Invalide le jour fermé (et l'ancien jour si la fermeture a été déplacée)."""
+    invalider_jours([instance.date, getattr(instance, '_date_chargee', None)])
+    instance._date_chargee = instance.date
+    marqueurs.toucher(marqueurs.FERMETURES)
+
+
+@receiver(post_save, sender=HoraireCabinet)
+@receiver(post_delete, sender=HoraireCabinet)
+@receiver(post_save, sender=CreneauHoraire)
+@receiver(post_delete, sender=CreneauHoraire)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalider_grille_horaires(sender, **kwargs):
+    invalider_horaires()
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def toucher_services(sender, **kwargs):
+    marqueurs.toucher(marqueurs.SERVICES)
+
+
+# Champs dont dépendent le principal (rdv.principal) et les noms de la file d'attente
+_CHAMPS_PRINCIPAL = {
+    User: {'username', 'first_name', 'last_name', 'is_staff'},
+    Utilisateur: {'user', 'nom', 'role'},
+    Patient: {'user', 'nom'},
+}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Utilisateur)
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Utilisateur)
+@receiver(post_delete, sender=Patient)
+def toucher_patients(sender, instance, update_fields=None, **kwargs):
+    """
+    Rôle et noms changés : file d'attente (noms affichés) et principal en session de
+    l'utilisateur. Un save() limité à d'autres champs (last_login, password…) est ignoré.
+    """
+    if update_fields is not None and not _CHAMPS_PRINCIPAL[sender] & set(update_fields):
+        return
+    marqueurs.toucher(marqueurs.PATIENTS)
+    invalider_principal(instance.pk if sender is User else instance.user_id)
+
+
 def create_patient_for_user(user, nom=None):
     """Crée Patient et Compte pour un utilisateur (rôle user)."""
     patient, created = Patient.objects.get_or_create(user=user, defaults={'nom': nom or user.username})
@@ -265,13 +817,135 @@ class Statistique:
 
     @staticmethod
     def generer_rapport(debut=None, fin=None):
-        from django.db.models import Count
-        qs = Rendez_vous.objects.all()
+        """
+        Total, urgents et répartition par statut, à partir des compteurs journaliers
+        (coût proportionnel au nombre de jours, pas au nombre de RDV). `debut` / `fin`
+        (date ou datetime) sont ramenés au jour cabinet, bornes incluses.
+        """
+        from django.db.models import Q, Sum
+        qs = StatistiqueJour.objects.all()
         if debut:
-            qs = qs.filter(date__gte=debut)
+            qs = qs.filter(jour__gte=jour_cabinet(debut))
         if fin:
-            qs = qs.filter(date__lte=fin)
-        by_status = qs.values('status').annotate(count=Count('id'))
-        total = qs.count()
-        urgent = qs.filter(priority='urgent').count()
-        return {'total': total, 'urgent': urgent, 'by_status': list(by_status)}
+            qs = qs.filter(jour__lte=jour_cabinet(fin))
+        by_status = qs.values('status').annotate(count=Sum('nombre')).filter(count__gt=0).order_by('status')
+        totaux = qs.aggregate(total=Sum('nombre'), urgent=Sum('nombre', filter=Q(priority='urgent')))
+        return {'total': totaux['total'] or 0, 'urgent': totaux['urgent'] or 0, 'by_status': list(by_status)}
+
+    # Tranches de délai d'annulation (avant l'heure du RDV) : (libellé, borne haute exclue)
+    TRANCHES_ANNULATION = [
+        ('moins_2h', 2),
+        ('2h_24h', 24),
+        ('1j_3j', 72),
+        ('3j_7j', 168),
+        ('plus_7j', None),
+    ]
+
+    @staticmethod
+    def rapport_detaille(debut, fin):
+        """
+        Indicateurs sur les jours cabinet [debut, fin], tous calculés par agrégations SQL
+        (nombre de requêtes fixe, indépendant du volume) :
+        séries par jour et par semaine, taux d'occupation des créneaux, absences (RDV passés
+        jamais honorés), délais d'annulation et charge par service.
+        """
+        from datetime import timedelta
+        from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+        from django.db.models.functions import TruncWeek
+        from django.utils import timezone as dj_tz
+        from .cache_creneaux import bornes_jour
+        from .horaires import semaine_type
+
+        stats = StatistiqueJour.objects.filter(jour__gte=debut, jour__lte=fin)
+        actifs = ~Q(status='cancelled')
+        aujourd_hui = jour_cabinet(dj_tz.now())
+
+        par_jour = {
+            ligne['jour']: ligne
+            for ligne in stats.values('jour').annotate(
+                total=Sum('nombre'),
+                actifs=Sum('nombre', filter=actifs),
+                annules=Sum('nombre', filter=Q(status='cancelled')),
+                urgents=Sum('nombre', filter=Q(priority='urgent')),
+                absences=Sum('nombre', filter=Q(status__in=('pending', 'confirmed'), jour__lt=aujourd_hui)),
+            )
+        }
+        par_semaine = (
+            stats.annotate(semaine=TruncWeek('jour'))
+            .values('semaine')
+            .annotate(total=Sum('nombre'), actifs=Sum('nombre', filter=actifs), annules=Sum('nombre', filter=Q(status='cancelled')))
+            .order_by('semaine')
+        )
+        par_service = (
+            stats.values('service_id', 'service__nom')
+            .annotate(total=Sum('nombre'), actifs=Sum('nombre', filter=actifs))
+            .order_by('-total')
+        )
+        fermes = set(JourFermeture.objects.filter(date__gte=debut, date__lte=fin).values_list('date', flat=True))
+
+        # Capacité : créneaux de la grille officielle × RDV simultanés par créneau, jours de
+        # fermeture exclus (calcul par jour, pas par RDV)
+        serie = []
+        capacite_totale = occupes_total = 0
+        semaine = semaine_type()
+        par_creneau = capacite_creneau()
+        dte = debut
+        while dte <= fin:
+            capacite = 0 if dte in fermes else len(semaine[dte.weekday()]) * par_creneau
+            ligne = par_jour.get(dte, {})
+            occupes = ligne.get('actifs') or 0
+            capacite_totale += capacite
+            occupes_total += occupes
+            serie.append({
+                'jour': dte.isoformat(),
+                'total': ligne.get('total') or 0,
+                'actifs': occupes,
+                'annules': ligne.get('annules') or 0,
+                'urgents': ligne.get('urgents') or 0,
+                'absences': ligne.get('absences') or 0,
+                'capacite': capacite,
+                'occupation': round(occupes / capacite, 4) if capacite else None,
+            })
+            dte += timedelta(days=1)
+
+        delai = ExpressionWrapper(F('date') - F('annule_le'), output_field=DurationField())
+        tranches = {}
+        borne_basse = None
+        for libelle, heures in Statistique.TRANCHES_ANNULATION:
+            condition = Q(delai__isnull=False)
+            if borne_basse is not None:
+                condition &= Q(delai__gte=timedelta(hours=borne_basse))
+            if heures is not None:
+                condition &= Q(delai__lt=timedelta(hours=heures))
+            tranches[libelle] = Count('pk', filter=condition)
+            borne_basse = heures
+        start, _ = bornes_jour(debut)
+        _, end = bornes_jour(fin)
+        annulations = (
+            Rendez_vous.objects.filter(status='cancelled', date__gte=start, date__lt=end)
+            .annotate(delai=delai)
+            .aggregate(inconnu=Count('pk', filter=Q(annule_le__isnull=True)), **tranches)
+        )
+
+        return {
+            'debut': debut.isoformat(),
+            'fin': fin.isoformat(),
+            'par_jour': serie,
+            'par_semaine': [
+                {'semaine': ligne['semaine'].isoformat(), 'total': ligne['total'] or 0,
+                 'actifs': ligne['actifs'] or 0, 'annules': ligne['annules'] or 0}
+                for ligne in par_semaine
+            ],
+            'occupation': {
+                'capacite': capacite_totale,
+                'occupes': occupes_total,
+                'taux': round(occupes_total / capacite_totale, 4) if capacite_totale else None,
+            },
+            'absences': sum(ligne['absences'] for ligne in serie),
+            'delais_annulation': annulations,
+            'par_service': [
+                {'service_id': ligne['service_id'], 'service': ligne['service__nom'] or 'Sans service',
+                 'total': ligne['total'] or 0, 'actifs': ligne['actifs'] or 0}
+                for ligne in par_service
+            ],
+        }
@@ -0,0 +1,131 @@
+"""
+Principal de la requête : rôle et noms de l'utilisateur connecté, résolus une seule fois.
+
+Une requête jointe (User ⟕ Utilisateur ⟕ Patient) donne rôle, Utilisateur.nom et Patient.nom ;
+le résultat est gardé sur la requête (PrincipalMiddleware → `request.principal`) et, si
+RDV_PRINCIPAL_EN_SESSION est actif, copié en session sous une version par utilisateur que les
+enregistrements de profil font avancer (voir models.toucher_patients) ; cette version est lue dans
+le cache Django, qui doit être partagé entre processus (voir rdv/checks.py).
+"""
+import time
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+
+_CLE_SESSION = '_rdv_principal'
+# Posé à la connexion (models.imposer_changement_mot_de_passe), retiré au changement
+CLE_MOT_DE_PASSE_A_CHANGER = '_rdv_mot_de_passe_a_changer'
+
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: int = None
+    role: str = None  # Utilisateur.role, None sans profil
+    nom_utilisateur: str = ''
+    nom_patient: str = ''
+    nom_complet: str = ''
+    is_staff: bool = False
+
+    @property
+    def nom_affichage(self):
+        """Nom du patient, sinon du profil, sinon prénom + nom ; jamais l'email."""
+        return self.nom_patient or self.nom_utilisateur or self.nom_complet
+
+    @property
+    def est_agent(self):
+        return self.role == 'agent' or self.is_staff
+
+    @property
+    def est_admin(self):
+        return self.role == 'admin'
+
+    @property
+    def est_personnel(self):
+        """Agent ou admin : les actions patient (annuler, modifier) leur sont refusées."""
+        return self.role in ('agent', 'admin')
+
+
+ANONYME = Principal()
+
+
+def _cle_version(user_id):
+    return f'rdv:principal:v:{user_id}'
+
+
+def _nouvelle_version():
+    return time.time_ns()
+
+
+def invalider_principal(user_id):
+    """Périme la copie en session du principal de `user_id` (après commit)."""
+    transaction.on_commit(lambda: cache.set(_cle_version(user_id), _nouvelle_version(), None))
+
+
+def charger_principal(user):
+    """Principal de `user` en une requête (LEFT JOIN sur les deux profils)."""
+    if not getattr(user, 'is_authenticated', False):
+        return ANONYME
+    ligne = User.objects.filter(pk=user.pk).values_list(
+        'profile__role', 'profile__nom', 'patient_profile__nom', 'first_name', 'last_name', 'is_staff'
+    ).first()
+    if ligne is None:
+        return ANONYME
+    role, nom_utilisateur, nom_patient, prenom, nom, is_staff = ligne
+    return Principal(
+        user_id=user.pk,
+        role=role,
+        nom_utilisateur=(nom_utilisateur or '').strip(),
+        nom_patient=(nom_patient or '').strip(),
+        nom_complet=f'{prenom} {nom}'.strip(),
+        is_staff=is_staff,
+    )
+
+
+def _charger_avec_session(request):
+    user = request.user
+    if not user.is_authenticated:
+        return ANONYME
+    if not getattr(settings, 'RDV_PRINCIPAL_EN_SESSION', True) or not hasattr(request, 'session'):
+        return charger_principal(user)
+    version = cache.get(_cle_version(user.pk))
+    if version is None:
+        version = _nouvelle_version()
+        if not cache.add(_cle_version(user.pk), version, None):
+            version = cache.get(_cle_version(user.pk), version)
+    copie = request.session.get(_CLE_SESSION)
+    if copie and copie.get('version') == version and copie.get('user_id') == user.pk:
+        return Principal(**{k: v for k, v in copie.items() if k != 'version'})
+    principal = charger_principal(user)
+    request.session[_CLE_SESSION] = {**asdict(principal), 'version': version}
+    return principal
+
+
+def get_principal(request):
+    """Principal de la requête, résolu au premier appel puis mémorisé sur la requête."""
+    if not hasattr(request, '_principal'):
+        request._principal = _charger_avec_session(request)
+    return request._principal
+
+
+class PrincipalMiddleware:
+    """
+    Expose `request.principal` (paresseux : aucune requête si la vue ne s'en sert pas), et
+    renvoie vers `mot_de_passe_changer` tant que la session porte CLE_MOT_DE_PASSE_A_CHANGER.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.principal = SimpleLazyObject(lambda: get_principal(request))
+        if hasattr(request, 'session') and request.session.get(CLE_MOT_DE_PASSE_A_CHANGER):
+            permis = (reverse('mot_de_passe_changer'), reverse('logout'), settings.STATIC_URL)
+            if not request.path.startswith(permis):
+                return redirect('mot_de_passe_changer')
+        return self.get_response(request)
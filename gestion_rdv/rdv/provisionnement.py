@@ -0,0 +1,154 @@
+"""
+Création en masse de comptes : User, Utilisateur, Patient et Compte insérés par bulk_create.
+
+bulk_create ne déclenche pas post_save : les profils que créeraient les signaux
+(create_or_update_user_profile, create_patient_for_user_role) sont construits ici, lot par
+lot, en quelques INSERT groupés au lieu de ~6 requêtes par utilisateur. Les identifiants
+(username ou email) déjà présents sont ignorés.
+
+Par défaut un compte reçoit un mot de passe inutilisable et, s'il a un email, une invitation
+à choisir le sien (lien à jeton unique, vue `mot_de_passe_definir`). Un mot de passe fourni
+(colonne password ou mot de passe commun) est haché compte par compte, avec son propre sel,
+et devra être changé à la première connexion (Utilisateur.mot_de_passe_a_changer).
+Hacher coûte cher (PBKDF2, une fraction de seconde par compte) : les invitations sont
+aussi le chemin rapide.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from . import marqueurs
+from .models import Compte, Patient, Utilisateur, normaliser_email
+
+ROLES = {code for code, _ in Utilisateur.ROLE_CHOICES}
+
+
+@dataclass
+class Bilan:
+    crees: int = 0
+    ignores: list = field(default_factory=list)  # [(identifiant, motif)]
+    invites: int = 0
+
+
+def provisionner_comptes(comptes, lot=1000, mot_de_passe=None, inviter=True):
+    """
+    Crée les comptes décrits par `comptes` (itérable de dicts : username, email, password,
+    first_name, last_name, nom, role) ; un lot par transaction, 5 INSERT et au plus 3 SELECT par lot.
+    `mot_de_passe` : mot de passe commun des lignes sans password. Avec `inviter`, les comptes
+    sans mot de passe reçoivent leur invitation une fois le lot validé. Retourne un Bilan.
+    """
+    bilan = Bilan()
+    comptes = iter(comptes)
+    while True:
+        paquet = list(islice(comptes, lot))
+        if not paquet:
+            break
+        with transaction.atomic():
+            users = _provisionner_lot(paquet, mot_de_passe, bilan.ignores)
+        bilan.crees += len(users)
+        if inviter:
+            bilan.invites += envoyer_invitations([u for u in users if u.email and not u.has_usable_password()])
+    if bilan.crees:
+        marqueurs.toucher(marqueurs.PATIENTS)
+    return bilan
+
+
+def envoyer_invitations(users):
+    """Un email par compte, avec le lien pour choisir son mot de passe ; renvoie le nombre envoyé."""
+    site = settings.RDV_URL_SITE.rstrip('/')
+    emails = []
+    for user in users:
+        lien = site + reverse('mot_de_passe_definir', args=[
+            urlsafe_base64_encode(force_bytes(user.pk)), default_token_generator.make_token(user),
+        ])
+        corps = render_to_string('rdv/email_invitation.txt', {
+            'nom': user.get_full_name() or user.username, 'identifiant': user.email or user.username, 'lien': lien,
+        })
+        emails.append(EmailMessage('Votre compte au cabinet dentaire', corps, to=[user.email]))
+    if not emails:
+        return 0
+    return get_connection().send_messages(emails) or 0
+
+
+def _provisionner_lot(paquet, mot_de_passe, ignores):
+    lignes = {}
+    par_email = {}  # {email normalisé: username}
+    for compte in paquet:
+        email = (compte.get('email') or '').strip()
+        username = (compte.get('username') or email).strip()
+        role = compte.get('role') or 'user'
+        if not username:
+            ignores.append(('', 'username ou email requis'))
+        elif role not in ROLES:
+            ignores.append((username, 'rôle invalide'))
+        elif username in lignes or (email and normaliser_email(email) in par_email):
+            ignores.append((username, 'en double dans le fichier'))
+        else:
+            lignes[username] = (compte, email, role)
+            if email:
+                par_email[normaliser_email(email)] = username
+    if not lignes:
+        return []
+
+    existants = Q(username__in=list(lignes))
+    if par_email:
+        existants |= Q(profile__email_normalise__in=list(par_email))
+    for username, email_normalise in User.objects.filter(existants).values_list('username', 'profile__email_normalise'):
+        for cle in (username, par_email.get(email_normalise)):
+            if lignes.pop(cle, None):
+                ignores.append((cle, 'compte existant'))
+    if not lignes:
+        return []
+
+    users = []
+    a_changer = set()
+    for username, (compte, email, role) in lignes.items():
+        password = compte.get('password') or mot_de_passe
+        if password:
+            a_changer.add(username)
+        users.append(User(
+            username=username,
+            email=email,
+            first_name=(compte.get('first_name') or '').strip(),
+            last_name=(compte.get('last_name') or '').strip(),
+            password=make_password(password or None),  # sel propre ; inutilisable sans mot de passe
+        ))
+    User.objects.bulk_create(users)
+    # MySQL ne renvoie pas les clés de bulk_create : on les relit par username (index unique)
+    if any(u.pk is None for u in users):
+        pks = dict(User.objects.filter(username__in=list(lignes)).values_list('username', 'pk'))
+        for user in users:
+            user.pk = pks[user.username]
+
+    profils = []
+    patients = []
+    for user in users:
+        compte, email, role = lignes[user.username]
+        nom = (compte.get('nom') or '').strip() or user.get_full_name() or user.username
+        profils.append(Utilisateur(
+            user=user, nom=nom, role=role, email_normalise=normaliser_email(email),
+            mot_de_passe_a_changer=user.username in a_changer,
+        ))
+        if role == 'user':
+            patients.append(Patient(user=user, nom=nom))
+    Utilisateur.objects.bulk_create(profils)
+    Patient.objects.bulk_create(patients)
+    if patients:
+        if any(p.pk is None for p in patients):
+            ids = dict(Patient.objects.filter(user__in=[p.user_id for p in patients]).values_list('user_id', 'pk'))
+            for patient in patients:
+                patient.pk = ids[patient.user_id]
+        Compte.objects.bulk_create([Compte(patient_id=p.pk, solde=Decimal('0.00')) for p in patients])
+    return users
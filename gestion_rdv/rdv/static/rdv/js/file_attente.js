@@ -0,0 +1,90 @@
+/**
+ * File d'attente en temps réel (flux SSE `file_attente_flux`).
+ * Le serveur envoie l'état complet à la connexion puis des diffs ({maj, retires}) :
+ * la liste est redessinée côté navigateur, sans recharger la page.
+ * Sans flux (site servi en WSGI) : l'état complet est relu toutes les N secondes
+ * (`file_attente_etat`, 304 tant que la file n'a pas changé).
+ */
+(function() {
+  var racine = document.getElementById('file-attente');
+  if (!racine) return;
+
+  var modele = document.getElementById('file-entree-modele');
+  var liste = racine.querySelector('[data-file-liste]');
+  var vide = racine.querySelector('[data-file-vide]');
+  var compteur = racine.querySelector('[data-file-compteur]');
+  var moi = racine.getAttribute('data-user-id');
+  var actionModele = racine.getAttribute('data-action-modele');
+  var entrees = {};
+
+  function classePriorite(prio) {
+    return prio === 'urgent' ? 'urgent' : (prio === 'control' ? 'control' : 'normal');
+  }
+
+  function remplir(noeud, e) {
+    var estMoi = moi && String(e.uid) === moi;
+    if (estMoi && noeud.hasAttribute('data-classe-moi')) {
+      noeud.className += ' ' + noeud.getAttribute('data-classe-moi');
+    }
+    noeud.querySelectorAll('[data-si]').forEach(function(el) {
+      el.hidden = !e[el.getAttribute('data-si')];
+    });
+    noeud.querySelectorAll('[data-moi]').forEach(function(el) {
+      el.hidden = !estMoi;
+    });
+    noeud.querySelectorAll('[data-champ]').forEach(function(el) {
+      var champ = el.getAttribute('data-champ');
+      el.textContent = (champ === 'nom' && estMoi && racine.hasAttribute('data-vous')) ? 'Vous' : e[champ];
+    });
+    noeud.querySelectorAll('[data-prio]').forEach(function(el) {
+      el.className = el.className.replace(/badge-(urgent|control|normal)/, 'badge-' + classePriorite(e.prio));
+      el.textContent = e.prio_label;
+    });
+    noeud.querySelectorAll('form[data-action]').forEach(function(form) {
+      form.action = actionModele.replace('/0/', '/' + e.id + '/');
+    });
+    return noeud;
+  }
+
+  function rendu() {
+    var ordre = Object.keys(entrees).map(function(k) { return entrees[k]; });
+    ordre.sort(function(a, b) { return a.pos - b.pos; });
+    if (compteur) compteur.textContent = ordre.length;
+    if (!liste || !modele) return;
+    while (liste.firstChild) liste.removeChild(liste.firstChild);
+    ordre.forEach(function(e) {
+      liste.appendChild(remplir(modele.content.firstElementChild.cloneNode(true), e));
+    });
+    liste.hidden = !ordre.length;
+    if (vide) vide.hidden = !!ordre.length;
+  }
+
+  function appliquer(m) {
+    if (m.type === 'init') {
+      entrees = {};
+      m.entrees.forEach(function(e) { entrees[e.id] = e; });
+    } else if (m.type === 'diff') {
+      m.maj.forEach(function(e) { entrees[e.id] = e; });
+      m.retires.forEach(function(pk) { delete entrees[pk]; });
+    }
+    rendu();
+  }
+
+  var fluxUrl = racine.getAttribute('data-flux-url');
+  var sondageUrl = racine.getAttribute('data-sondage-url');
+  if (fluxUrl && window.EventSource) {
+    var source = new EventSource(fluxUrl);
+    source.onmessage = function(ev) { appliquer(JSON.parse(ev.data)); };
+  } else if (sondageUrl && window.fetch) {
+    var delai = (parseInt(racine.getAttribute('data-sondage-secondes'), 10) || 15) * 1000;
+    var sonder = function() {
+      if (document.hidden) return;  // onglet masqué : pas de requête
+      fetch(sondageUrl, {credentials: 'same-origin', cache: 'no-cache'})
+        .then(function(r) { return r.ok ? r.json() : null; })
+        .then(function(m) { if (m) appliquer(m); })
+        .catch(function() {});
+    };
+    setInterval(sonder, delai);
+    document.addEventListener('visibilitychange', sonder);
+  }
+})();
@@ -0,0 +1,139 @@
+"""
+Diffusion en temps réel de la file d'attente (écrans salle d'attente, postes agents).
+
+Un bus pub/sub en mémoire du processus : à chaque changement validé sur Rendez_vous, un seul
+instantané de la file est calculé (1 requête) puis le diff est poussé à tous les écrans abonnés
+au flux SSE (`file_attente_flux`). Sans abonné, rien n'est calculé.
+
+Le bus est propre au processus : servir le flux avec un seul worker ASGI, ou remplacer le bus
+(`set_bus`) par une implémentation partagée. Les tests peuvent y substituer un bus local.
+
+Le flux n'est utilisé que sous ASGI et si RDV_FLUX_TEMPS_REEL est actif (`flux_disponible`) :
+sous WSGI une connexion SSE bloquerait un worker pour toujours. Sinon les écrans interrogent
+`file_attente_etat` à intervalle régulier (GET conditionnel : 304 tant que rien n'a changé).
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils import timezone
+
+
+def flux_disponible(request):
+    """Vrai si le flux SSE peut servir cette requête : activé et servi par ASGI."""
+    return getattr(settings, 'RDV_FLUX_TEMPS_REEL', False) and isinstance(request, ASGIRequest)
+
+
+def _entree(rdv):
+    return {
+        'id': rdv.pk,
+        'pos': rdv.position_file,
+        'nom': rdv.patient_nom,
+        'uid': rdv.utilisateur_id,
+        'titre': rdv.titre,
+        'date': timezone.localtime(rdv.date).strftime('%d/%m/%Y à %H:%M'),
+        'prio': rdv.priority,
+        'prio_label': rdv.get_priority_display(),
+        'service': rdv.service.nom if rdv.service else '',
+    }
+
+
+def instantane_file():
+    """{pk: entrée} de la file d'attente courante (une requête)."""
+    from .models import Rendez_vous
+
+    return {rdv.pk: _entree(rdv) for rdv in Rendez_vous.objects.with_queue_position()}
+
+
+def diff_file(avant, apres):
+    """Entrées nouvelles ou modifiées + pks sortis de la file."""
+    maj = [e for pk, e in apres.items() if avant.get(pk) != e]
+    retires = [pk for pk in avant if pk not in apres]
+    return {'maj': maj, 'retires': retires}
+
+
+class FileAttenteBus:
+    """Pub/sub en mémoire : chaque abonné (une connexion SSE) a sa file asyncio."""
+
+    taille_max = 100
+
+    def __init__(self):
+        self._abonnes = {}
+        self._lock = threading.Lock()
+        self.etat = None
+        self.sequence = 0
+
+    def abonner(self):
+        q = asyncio.Queue(maxsize=self.taille_max)
+        with self._lock:
+            self._abonnes[q] = asyncio.get_running_loop()
+        return q
+
+    def desabonner(self, q):
+        with self._lock:
+            self._abonnes.pop(q, None)
+            if not self._abonnes:
+                # Plus personne n'écoute : l'instantané ne sera plus tenu à jour
+                self.etat = None
+
+    def a_des_abonnes(self):
+        return bool(self._abonnes)
+
+    def message_init(self):
+        return {'type': 'init', 'seq': self.sequence, 'entrees': list((self.etat or {}).values())}
+
+    def etat_courant(self):
+        """Instantané connu, ou recalculé s'il n'y en a pas (premier écran connecté)."""
+        with self._lock:
+            if self.etat is None:
+                self.etat = instantane_file()
+            return self.message_init()
+
+    def rafraichir(self):
+        """Recalcule la file une fois et pousse le diff à tous les abonnés."""
+        with self._lock:
+            if not self._abonnes:
+                self.etat = None
+                return
+            apres = instantane_file()
+            diff = diff_file(self.etat or {}, apres)
+            self.etat = apres
+            if not diff['maj'] and not diff['retires']:
+                return
+            self.sequence += 1
+            message = {'type': 'diff', 'seq': self.sequence, **diff}
+            abonnes = list(self._abonnes.items())
+        for q, loop in abonnes:
+            loop.call_soon_threadsafe(self._deposer, q, message)
+
+    def _deposer(self, q, message):
+        try:
+            q.put_nowait(message)
+        except asyncio.QueueFull:
+            # Écran trop lent : on vide sa file et on lui renvoie l'état complet
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait(self.message_init())
+
+
+_bus = FileAttenteBus()
+
+
+def get_bus():
+    return _bus
+
+
+def set_bus(bus):
+    """Remplace le bus (tests, ou implémentation partagée entre processus)."""
+    global _bus
+    _bus = bus
+
+
+def notifier_file_attente():
+    """À appeler après commit d'un changement de Rendez_vous."""
+    bus = get_bus()
+    if bus.a_des_abonnes():
+        bus.rafraichir()
+    else:
+        bus.etat = None
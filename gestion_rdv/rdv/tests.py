@@ -1,3 +1,1231 @@
-from django.test import TestCase
+import asyncio
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now as timezone_now
+
+from .forms import cabinet_day_datetime_bounds, cabinet_local_today
+from .horaires import semaine_type
+from .models import FileDisputee, Rendez_vous, Service, Utilisateur
+from . import temps_reel
+
+
+class RendezVousIndexTests(TestCase):
+    """Les requêtes chaudes sur Rendez_vous doivent passer par les index composites (EXPLAIN)."""
+
+    def assertUsesIndex(self, qs, index_name):
+        plan = qs.explain()
+        self.assertIn(index_name, plan, msg=plan)
+
+    def test_file_attente_du_jour(self):
+        start, end = cabinet_day_datetime_bounds(cabinet_local_today())
+        qs = Rendez_vous.objects.filter(status='pending', date__gte=start, date__lt=end)
+        self.assertUsesIndex(Rendez_vous.objects._queue_order(qs), 'rdv_status_date_idx')
+
+    def test_file_attente_globale(self):
+        qs = Rendez_vous.objects.filter(status='pending')
+        self.assertUsesIndex(Rendez_vous.objects._queue_order(qs), 'rdv_status_date_idx')
+
+    def test_rdv_du_jour_agent(self):
+        start, end = cabinet_day_datetime_bounds(cabinet_local_today())
+        qs = (
+            Rendez_vous.objects.filter(date__gte=start, date__lt=end)
+            .exclude(status='cancelled')
+            .order_by('date')
+        )
+        self.assertUsesIndex(qs, 'rdv_date_status_idx')
+
+    def test_mes_rendez_vous(self):
+        user = User.objects.create_user('patient', 'patient@example.com')
+        self.assertUsesIndex(
+            Rendez_vous.objects.filter(utilisateur=user).order_by('-date'),
+            'rdv_utilisateur_date_idx',
+        )
+
+    def test_prochains_rdv_admin(self):
+        start, _ = cabinet_day_datetime_bounds(cabinet_local_today())
+        qs = Rendez_vous.objects.filter(date__gte=start, date__lte=start + timedelta(days=7)).order_by('date')
+        self.assertUsesIndex(qs, 'rdv_date_status_idx')
+
+
+class QueuePositionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('patient', 'patient@example.com')
+        start, _ = cabinet_day_datetime_bounds(cabinet_local_today() + timedelta(days=1))
+        self.normal_tot = self._rdv(start + timedelta(hours=8))
+        self.normal_tard = self._rdv(start + timedelta(hours=10))
+        self.urgent_tard = self._rdv(start + timedelta(hours=11), priority='urgent')
+        self.annule = self._rdv(start + timedelta(hours=9), status='cancelled')
+
+    def _rdv(self, date, **kwargs):
+        return Rendez_vous.objects.create(titre='RDV', description='', date=date, utilisateur=self.user, **kwargs)
+
+    def test_with_queue_position(self):
+        with self.assertNumQueries(1):
+            rows = [(r.pk, r.position_file) for r in Rendez_vous.objects.with_queue_position()]
+        self.assertEqual(rows, [(self.urgent_tard.pk, 1), (self.normal_tot.pk, 2), (self.normal_tard.pk, 3)])
+
+    def test_queue_position_property(self):
+        self.assertEqual(self.urgent_tard.queue_position, 1)
+        self.assertEqual(self.normal_tot.queue_position, 2)
+        self.assertEqual(self.normal_tard.queue_position, 3)
+        self.assertIsNone(self.annule.queue_position)
+
+    def test_with_position_file(self):
+        qs = Rendez_vous.objects.with_position_file(Rendez_vous.objects.filter(utilisateur=self.user))
+        with self.assertNumQueries(1):
+            positions = {r.pk: r.queue_position for r in qs}
+        self.assertEqual(positions, {
+            self.urgent_tard.pk: 1, self.normal_tot.pk: 2, self.normal_tard.pk: 3, self.annule.pk: None,
+        })
+
+
+class RdvListFiltresTests(TestCase):
+    """« Mes rendez-vous » : filtres validés, une valeur inconnue est ignorée au lieu d'une erreur 500."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('patient', 'patient@example.com')
+        self.client.force_login(self.user)
+        self.service = Service.objects.create(nom='Radiologie')
+        start, _ = cabinet_day_datetime_bounds(cabinet_local_today() + timedelta(days=1))
+        self.radio = Rendez_vous.objects.create(
+            titre='A', description='', date=start + timedelta(hours=8), utilisateur=self.user, service=self.service
+        )
+        self.annule = Rendez_vous.objects.create(
+            titre='B', description='', date=start + timedelta(hours=9), utilisateur=self.user, status='cancelled'
+        )
+
+    def _ids(self, **params):
+        reponse = self.client.get(reverse('rdv_list'), {'format': 'json', **params})
+        self.assertEqual(reponse.status_code, 200)
+        return {item['id'] for item in reponse.json()['items']}
+
+    def test_filtres(self):
+        tous = {self.radio.pk, self.annule.pk}
+        self.assertEqual(self._ids(status='cancelled'), {self.annule.pk})
+        self.assertEqual(self._ids(service=str(self.service.pk)), {self.radio.pk})
+        self.assertEqual(self._ids(priority='urgent'), set())
+        for params in ({'service': 'abc'}, {'status': 'inconnu'}, {'priority': "normal' OR 1=1"}):
+            with self.subTest(**params):
+                self.assertEqual(self._ids(**params), tous)
+
+
+class PatientNameQueryCountTests(TestCase):
+    """Les vues agent / file d'attente gardent un nombre de requêtes constant quand la file grandit."""
+
+    def setUp(self):
+        self.agent = User.objects.create_user('agent', 'agent@example.com', is_staff=True)
+        self.service = Service.objects.create(nom='Consultation')
+        self.client.force_login(self.agent)
+        self.client.get(reverse('extranet'))  # rôle résolu une fois puis gardé en session
+        self.next_slot = 0
+
+    def _add_rdv(self, count):
+        start, _ = cabinet_day_datetime_bounds(cabinet_local_today())
+        for _ in range(count):
+            self.next_slot += 1
+            user = User.objects.create_user(f'p{self.next_slot}', f'p{self.next_slot}@example.com')
+            Rendez_vous.objects.create(
+                titre='RDV', description='', utilisateur=user, service=self.service,
+                date=start + timedelta(minutes=self.next_slot),
+            )
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_constant_query_count(self):
+        for name in ('agent_dashboard', 'file_attente', 'agent_file_attente'):
+            with self.subTest(view=name):
+                self._add_rdv(2)
+                small = self._count_queries(reverse(name))
+                self._add_rdv(10)
+                self.assertEqual(self._count_queries(reverse(name)), small)
+
+
+class FileAttenteBusTests(TestCase):
+    """Le flux temps réel pousse un diff par changement validé, calculé une seule fois."""
+
+    def setUp(self):
+        self.bus = temps_reel.FileAttenteBus()
+        ancien = temps_reel.get_bus()
+        temps_reel.set_bus(self.bus)
+        self.addCleanup(temps_reel.set_bus, ancien)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.user = User.objects.create_user('patient', 'patient@example.com')
+        self.start, _ = cabinet_day_datetime_bounds(cabinet_local_today() + timedelta(days=1))
+
+    def _abonner(self):
+        async def abonner():
+            return self.bus.abonner()
+        return self.loop.run_until_complete(abonner())
+
+    def _recevoir(self, q):
+        return self.loop.run_until_complete(asyncio.wait_for(q.get(), 1))
+
+    def test_diff_apres_commit(self):
+        q1, q2 = self._abonner(), self._abonner()
+        self.assertEqual(self.bus.etat_courant()['entrees'], [])
+        with self.captureOnCommitCallbacks() as callbacks:
+            rdv = Rendez_vous.objects.create(titre='RDV', description='', date=self.start, utilisateur=self.user)
+        with self.assertNumQueries(1):  # un seul instantané pour les deux écrans
+            for callback in callbacks:
+                callback()
+        for q in (q1, q2):
+            message = self._recevoir(q)
+            self.assertEqual(message['type'], 'diff')
+            self.assertEqual([e['id'] for e in message['maj']], [rdv.pk])
+            self.assertEqual(message['retires'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rdv.status = 'done'
+            rdv.save()
+        self.assertEqual(self._recevoir(q1)['retires'], [rdv.pk])
+
+    def test_sans_abonne_aucun_calcul(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Rendez_vous.objects.create(titre='RDV', description='', date=self.start, utilisateur=self.user)
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+
+
+class FileAttenteSansAsgiTests(TestCase):
+    """Sous WSGI (client de test) : pas de flux SSE ouvert, les écrans interrogent l'état de la file."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('patient', 'patient@example.com')
+        self.client.force_login(self.user)
+
+    @override_settings(RDV_FLUX_TEMPS_REEL=True)
+    def test_sondage_au_lieu_du_flux(self):
+        page = self.client.get(reverse('file_attente'))
+        self.assertContains(page, 'data-sondage-url="%s"' % reverse('file_attente_etat'))
+        self.assertNotContains(page, 'data-flux-url')
+        self.assertEqual(self.client.get(reverse('file_attente_flux')).status_code, 204)
+
+    def test_etat_conditionnel(self):
+        start, _ = cabinet_day_datetime_bounds(cabinet_local_today() + timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            rdv = Rendez_vous.objects.create(titre='RDV', description='', date=start, utilisateur=self.user)
+        reponse = self.client.get(reverse('file_attente_etat'))
+        self.assertEqual(reponse.json()['type'], 'init')
+        self.assertEqual([e['id'] for e in reponse.json()['entrees']], [rdv.pk])
+        with self.assertNumQueries(2):  # session et utilisateur : la file n'est pas relue
+            self.assertEqual(
+                self.client.get(reverse('file_attente_etat'), HTTP_IF_NONE_MATCH=reponse['ETag']).status_code, 304
+            )
+
+
+class AppelerProchainConcurrencyTests(TransactionTestCase):
+    """Plusieurs agents qui appellent en même temps n'obtiennent jamais le même patient."""
+
+    AGENTS = 12
+    PATIENTS = 8
+
+    def setUp(self):
+        user = User.objects.create_user('patient', 'patient@example.com')
+        start, _ = cabinet_day_datetime_bounds(cabinet_local_today())
+        for i in range(self.PATIENTS):
+            Rendez_vous.objects.create(
+                titre=f'RDV {i}', description='', date=start + timedelta(minutes=i), utilisateur=user,
+            )
+
+    def test_appels_concurrents_sans_doublon(self):
+        appeles = []
+        depart = threading.Barrier(self.AGENTS)
+
+        def agent():
+            try:
+                depart.wait()
+                while True:
+                    try:
+                        rdv = Rendez_vous.objects.appeler_prochain()
+                    except (OperationalError, FileDisputee):
+                        continue  # base verrouillée (SQLite) ou candidats pris par d'autres : on réessaie
+                    if rdv is None:
+                        return
+                    appeles.append(rdv.pk)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=agent) for _ in range(self.AGENTS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(appeles), self.PATIENTS)
+        self.assertEqual(len(set(appeles)), self.PATIENTS)
+        self.assertFalse(Rendez_vous.objects.filter(status='pending').exists())
+        self.assertEqual(Rendez_vous.objects.filter(status='confirmed').count(), self.PATIENTS)
+
+
+class AppelerProchainTests(TestCase):
+    """Candidat lu sans verrou ; un patient pris entre la lecture et l'UPDATE fait passer au suivant."""
+
+    def setUp(self):
+        user = User.objects.create_user('patient', 'patient@example.com')
+        start, _ = cabinet_day_datetime_bounds(cabinet_local_today())
+        self.rdvs = [
+            Rendez_vous.objects.create(titre=f'RDV {i}', description='', date=start + timedelta(minutes=i), utilisateur=user)
+            for i in range(3)
+        ]
+
+    def _pris_par_un_autre_agent(self, fois):
+        """update_rendez_vous précédé, `fois` fois, de l'appel du même patient par un autre agent."""
+        from . import models
+
+        reel = models.update_rendez_vous
+        appels = []
+
+        def update(queryset, **fields):
+            appels.append(queryset)
+            if len(appels) <= fois:
+                reel(Rendez_vous.objects.filter(pk__in=queryset.values('pk')), status='confirmed')
+            return reel(queryset, **fields)
+        return mock.patch.object(models, 'update_rendez_vous', side_effect=update)
+
+    def test_candidat_pris_entre_temps(self):
+        with self._pris_par_un_autre_agent(1):
+            rdv = Rendez_vous.objects.appeler_prochain()
+        self.assertEqual(rdv.pk, self.rdvs[1].pk)
+
+    def test_tentatives_epuisees(self):
+        with self._pris_par_un_autre_agent(2), self.assertRaises(FileDisputee):
+            Rendez_vous.objects.appeler_prochain(tentatives=2)
+        self.assertEqual(Rendez_vous.objects.filter(status='pending').count(), 1)
+
+    def test_lecture_sans_verrou(self):
+        # Backend avec SKIP LOCKED (MySQL 8, PostgreSQL) : la sélection du candidat ne verrouille rien
+        features = connection.features
+        with mock.patch.object(features, 'has_select_for_update', True), \
+                mock.patch.object(features, 'has_select_for_update_skip_locked', True), \
+                mock.patch('rdv.models.update_rendez_vous', return_value=1), \
+                CaptureQueriesContext(connection) as capture:
+            rdv = Rendez_vous.objects.appeler_prochain()
+        self.assertEqual(rdv.pk, self.rdvs[0].pk)
+        self.assertEqual(len(capture), 1)
+        self.assertNotIn('FOR UPDATE', capture[0]['sql'])
+
+
+class StatistiqueJourTests(TestCase):
+    """Les compteurs journaliers suivent chaque écriture et redonnent le rapport historique."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('patient', 'patient@example.com')
+        self.service = Service.objects.create(nom='Consultation')
+        self.start, _ = cabinet_day_datetime_bounds(cabinet_local_today())
+
+    def _rapport_brut(self):
+        from django.db.models import Count
+        qs = Rendez_vous.objects.all()
+        by_status = qs.values('status').annotate(count=Count('id')).order_by('status')
+        return {
+            'total': qs.count(),
+            'urgent': qs.filter(priority='urgent').count(),
+            'by_status': list(by_status),
+        }
+
+    def test_rapport_suit_les_ecritures(self):
+        from .models import Statistique, update_rendez_vous
+        a = Rendez_vous.objects.create(titre='A', description='', date=self.start, utilisateur=self.user)
+        b = Rendez_vous.objects.create(
+            titre='B', description='', date=self.start + timedelta(days=1), utilisateur=self.user,
+            priority='urgent', service=self.service,
+        )
+        c = Rendez_vous.objects.create(titre='C', description='', date=self.start + timedelta(days=2), utilisateur=self.user)
+        a.status = 'done'
+        a.save()
+        b.date = self.start + timedelta(days=5)
+        b.save()
+        update_rendez_vous(Rendez_vous.objects.filter(pk=c.pk), status='cancelled', priority='urgent')
+        Rendez_vous.objects.get(pk=a.pk).delete()
+        self.assertEqual(Statistique.generer_rapport(), self._rapport_brut())
+
+        debut = cabinet_local_today() + timedelta(days=3)
+        rapport = Statistique.generer_rapport(debut, debut + timedelta(days=3))
+        self.assertEqual((rapport['total'], rapport['urgent']), (1, 1))
+
+    def test_recalculer_statistiques(self):
+        from .models import Statistique, StatistiqueJour, recalculer_statistiques
+        for i in range(3):
+            Rendez_vous.objects.create(titre='R', description='', date=self.start + timedelta(hours=i), utilisateur=self.user)
+        StatistiqueJour.objects.all().delete()
+        recalculer_statistiques()
+        self.assertEqual(Statistique.generer_rapport(), self._rapport_brut())
+
+
+@override_settings(RDV_CAPACITE_CRENEAU=1)
+class ExportRdvTests(TestCase):
+    """Export en flux (vue staff et commande) : filtres, formats, et une requête par lot."""
+
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', 'staff@example.com', is_staff=True)
+        self.user = User.objects.create_user('patient', 'patient@example.com')
+        today = cabinet_local_today()
+        self.lundi = today + timedelta(days=7 - today.weekday())
+        start, _ = cabinet_day_datetime_bounds(self.lundi)
+        creer = lambda heures, **kw: Rendez_vous.objects.create(
+            titre='RDV', description='', date=start + timedelta(hours=heures), utilisateur=self.user, **kw
+        )
+        self.rdv = [creer(8), creer(9, status='done'), creer(10), creer(24 + 8, status='done')]
+        annule = creer(11)
+        annule.status = 'cancelled'
+        annule.save()
+        self.rdv.append(annule)
+
+    def test_csv_en_flux_filtre_par_jour_et_statut(self):
+        import csv
+        import io
+        from django.http import StreamingHttpResponse
+
+        self.client.force_login(self.staff)
+        reponse = self.client.get(reverse('rdv_export'), {
+            'debut': self.lundi.isoformat(), 'fin': self.lundi.isoformat(), 'status': ['pending', 'done'],
+        })
+        self.assertIsInstance(reponse, StreamingHttpResponse)
+        self.assertEqual(reponse['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('rendez-vous.csv', reponse['Content-Disposition'])
+        lignes = list(csv.DictReader(io.StringIO(b''.join(reponse.streaming_content).decode())))
+        self.assertEqual([int(l['id']) for l in lignes], [r.pk for r in self.rdv[:3]])
+        self.assertEqual(lignes[0]['utilisateur'], 'patient')
+
+    def test_jsonl(self):
+        import json
+
+        self.client.force_login(self.staff)
+        reponse = self.client.get(reverse('rdv_export'), {'format': 'jsonl', 'status': 'done'})
+        self.assertEqual(reponse['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lignes = [json.loads(l) for l in b''.join(reponse.streaming_content).decode().splitlines()]
+        self.assertEqual([l['id'] for l in lignes], [self.rdv[1].pk, self.rdv[3].pk])
+        self.assertEqual(lignes[0]['status'], 'done')
+
+    def test_reserve_au_staff(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('rdv_export')).status_code, 302)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('rdv_export'), {'format': 'xml'}).status_code, 400)
+
+    def test_une_requete_par_lot(self):
+        from .export import rdv_a_exporter
+
+        with mock.patch('rdv.export.TAILLE_LOT', 2):
+            with self.assertNumQueries(3):  # 2 + 2 + 1 lignes
+                lignes = list(rdv_a_exporter())
+            with self.assertNumQueries(2):  # lot plein, puis lot vide
+                self.assertEqual(len(list(rdv_a_exporter(status='pending'))), 2)
+        self.assertEqual([l[0] for l in lignes], sorted(r.pk for r in self.rdv))
+
+    def test_commande(self):
+        import io
+        import json
+        import os
+        import tempfile
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as tmp:
+            chemin = os.path.join(tmp, 'rdv.jsonl')
+            stderr = io.StringIO()
+            call_command('exporter_rdv', format='jsonl', output=chemin, status=['cancelled'], stderr=stderr)
+            with open(chemin, encoding='utf-8') as f:
+                lignes = [json.loads(l) for l in f]
+        self.assertEqual([l['id'] for l in lignes], [self.rdv[4].pk])
+        self.assertIn('1 rendez-vous', stderr.getvalue())
+
+
+class RapportDetailleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('patient', 'patient@example.com')
+        self.service = Service.objects.create(nom='Détartrage')
+
+    @override_settings(RDV_CAPACITE_CRENEAU=3)
+    def test_capacite_par_creneau(self):
+        from .models import Statistique
+
+        today = cabinet_local_today()
+        lundi = today - timedelta(days=today.weekday() + 7)
+        start, _ = cabinet_day_datetime_bounds(lundi)
+        for _ in range(3):
+            Rendez_vous.objects.create(titre='A', description='', date=start + timedelta(hours=8), utilisateur=self.user)
+        rapport = Statistique.rapport_detaille(lundi, lundi)
+        jour = rapport['par_jour'][0]
+        self.assertEqual((jour['actifs'], jour['capacite']), (3, 33))
+        self.assertEqual(jour['occupation'], round(3 / 33, 4))
+
+    @override_settings(RDV_CAPACITE_CRENEAU=1)
+    def test_rapport_nombre_de_requetes_fixe(self):
+        from django.utils import timezone
+        from .models import JourFermeture, Statistique
+
+        today = cabinet_local_today()
+        lundi = today - timedelta(days=today.weekday() + 7)
+        start, _ = cabinet_day_datetime_bounds(lundi)
+        Rendez_vous.objects.create(titre='A', description='', date=start + timedelta(hours=8), utilisateur=self.user)
+        Rendez_vous.objects.create(
+            titre='B', description='', date=start + timedelta(hours=9), utilisateur=self.user,
+            service=self.service, status='done',
+        )
+        annule = Rendez_vous.objects.create(titre='C', description='', date=start + timedelta(hours=10), utilisateur=self.user)
+        annule.status = 'cancelled'
+        annule.save()
+        Rendez_vous.objects.filter(pk=annule.pk).update(annule_le=annule.date - timedelta(hours=30))
+        JourFermeture.objects.create(date=lundi + timedelta(days=1))
+
+        semaine_type()  # grille compilée une fois par version d'horaires, hors du rapport
+        with self.assertNumQueries(5):
+            rapport = Statistique.rapport_detaille(today - timedelta(days=364), today)
+        self.assertEqual(len(rapport['par_jour']), 365)
+        jour = next(j for j in rapport['par_jour'] if j['jour'] == lundi.isoformat())
+        self.assertEqual((jour['total'], jour['actifs'], jour['annules'], jour['absences']), (3, 2, 1, 1))
+        self.assertEqual(jour['capacite'], 11)
+        fermeture = next(j for j in rapport['par_jour'] if j['jour'] == (lundi + timedelta(days=1)).isoformat())
+        self.assertEqual(fermeture['capacite'], 0)
+        self.assertEqual(rapport['delais_annulation']['1j_3j'], 1)
+        self.assertEqual(rapport['absences'], 1)
+        services = {s['service']: s['total'] for s in rapport['par_service']}
+        self.assertEqual(services, {'Sans service': 2, 'Détartrage': 1})
+        self.assertLessEqual(timezone.now() - annule.annule_le, timedelta(minutes=1))
+
+
+@override_settings(RDV_CAPACITE_CRENEAU=1)
+class ImportRdvTests(TestCase):
+    """Import en lots : les lignes valides passent, les conflits sont rapportés, les compteurs suivent."""
+
+    def test_import_et_rapport_de_conflits(self):
+        import csv
+        import io
+        import os
+        import tempfile
+        from datetime import datetime, time
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import Statistique
+
+        user = User.objects.create_user('patient', 'patient@example.com')
+        Service.objects.create(nom='Consultation')
+        today = cabinet_local_today()
+        lundi = today + timedelta(days=7 - today.weekday())
+        instant = lambda h, m: timezone.make_aware(datetime.combine(lundi, time(h, m)))
+        creneau = lambda h, m: instant(h, m).isoformat()
+        Rendez_vous.objects.create(titre='Existant', description='', date=instant(8, 50), utilisateur=user)
+
+        lignes = [
+            {'date': creneau(8, 0), 'utilisateur': 'patient@example.com', 'service': 'consultation'},
+            {'date': creneau(8, 0), 'utilisateur': 'patient'},  # doublon dans le fichier
+            {'date': creneau(8, 50), 'utilisateur': 'patient'},  # déjà réservé en base
+            {'date': creneau(9, 40), 'utilisateur': 'inconnu'},
+            {'date': creneau(9, 41), 'utilisateur': 'patient'},  # hors grille
+            {'date': creneau(9, 41), 'utilisateur': 'patient', 'status': 'cancelled'},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            chemin = os.path.join(tmp, 'agenda.csv')
+            rapport = os.path.join(tmp, 'conflits.csv')
+            with open(chemin, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=['date', 'utilisateur', 'service', 'status'])
+                writer.writeheader()
+                writer.writerows(lignes)
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('import_rdv', chemin, lot=2, rapport=rapport, stdout=io.StringIO())
+            with open(rapport, encoding='utf-8') as f:
+                motifs = {int(r['ligne']): r['motif'] for r in csv.DictReader(f)}
+
+        self.assertEqual(motifs, {
+            3: 'créneau complet',
+            4: 'créneau complet',
+            5: 'utilisateur / patient inconnu',
+            6: 'hors grille officielle',
+            7: 'hors grille officielle',
+        })
+        self.assertEqual(Rendez_vous.objects.count(), 2)
+        self.assertTrue(Rendez_vous.objects.filter(titre='Rendez-vous', service__nom='Consultation').exists())
+        self.assertEqual(Statistique.generer_rapport()['total'], 2)
+
+    @override_settings(RDV_CAPACITE_CRENEAU=2)
+    def test_repli_ligne_a_ligne_libere_les_places_non_inserees(self):
+        import io
+        import json
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from django.db import IntegrityError
+
+        User.objects.create_user('patient', 'patient@example.com')
+        today = cabinet_local_today()
+        lundi = today + timedelta(days=7 - today.weekday())
+        creneau = (cabinet_day_datetime_bounds(lundi)[0] + timedelta(hours=8)).isoformat()
+        save = Rendez_vous.save
+
+        def save_perdu(rdv, *args, **kwargs):
+            if rdv.titre == 'Perdu':
+                raise IntegrityError('poste pris entre-temps')
+            return save(rdv, *args, **kwargs)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            chemin = os.path.join(tmp, 'agenda.jsonl')
+            with open(chemin, 'w', encoding='utf-8') as f:
+                for titre in ('Perdu', 'Garde', 'Suivant'):
+                    f.write(json.dumps({'date': creneau, 'utilisateur': 'patient', 'titre': titre}) + '\n')
+            with mock.patch.object(Rendez_vous.objects, 'bulk_create', side_effect=IntegrityError), \
+                    mock.patch.object(Rendez_vous, 'save', autospec=True, side_effect=save_perdu):
+                sortie = io.StringIO()
+                call_command('import_rdv', chemin, lot=2, rapport=os.path.join(tmp, 'conflits.csv'), stdout=sortie)
+        # Le poste réservé en mémoire pour « Perdu » ne doit pas bloquer « Suivant » au lot suivant
+        self.assertEqual(sorted(Rendez_vous.objects.values_list('titre', flat=True)), ['Garde', 'Suivant'])
+        self.assertIn('1 ligne(s) refusée(s)', sortie.getvalue())
+
+
+class GrilleHorairesTests(TestCase):
+    """La grille vient des horaires cabinet ; elle est compilée une fois puis recompilée à l'enregistrement."""
+
+    def test_grille_compilee_depuis_horaires(self):
+        from datetime import time
+        from .models import HoraireCabinet
+
+        semaine = semaine_type()
+        matin = (time(8, 0), time(8, 50), time(9, 40), time(10, 30), time(11, 20), time(12, 10))
+        apres = (time(14, 0), time(14, 50), time(15, 40), time(16, 30), time(17, 20))
+        self.assertEqual(semaine, (matin + apres,) * 4 + (matin, (), ()))
+        with self.assertNumQueries(0):
+            semaine_type()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            HoraireCabinet.objects.create(jour=5, heure_ouverture=time(9, 0), heure_fermeture=time(11, 0))
+        self.assertEqual(semaine_type()[5], (time(9, 0), time(9, 50)))
+        self.assertEqual(semaine_type(pas=35)[5], (time(9, 0), time(9, 35), time(10, 10)))
+
+
+@override_settings(RDV_CAPACITE_CRENEAU=1)
+class OccupationCabinetRequetesTests(TestCase):
+    """Fermetures et RDV de tout l'horizon chargés en bloc : nombre de requêtes fixe, quelle que soit sa longueur."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import JourFermeture
+
+        cache.clear()
+        self.addCleanup(cache.clear)  # jours mis en cache sans invalidation (aucun on_commit ici)
+        semaine_type()
+        user = User.objects.create_user('patient', 'patient@example.com')
+        today = cabinet_local_today()
+        self.lundi = today + timedelta(days=7 - today.weekday())
+        self.slot = cabinet_day_datetime_bounds(self.lundi)[0] + timedelta(hours=8)
+        for semaine in range(8):
+            debut = cabinet_day_datetime_bounds(self.lundi + timedelta(weeks=semaine))[0]
+            Rendez_vous.objects.create(titre='R', description='', date=debut + timedelta(hours=8), utilisateur=user)
+        JourFermeture.objects.create(date=self.lundi + timedelta(days=1))
+
+    def _vider_cache(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        semaine_type()
+
+    def test_deux_requetes_quel_que_soit_l_horizon(self):
+        from .forms import OccupationCabinet
+
+        for jours in (1, 7, 90):
+            self._vider_cache()
+            with self.assertNumQueries(2):  # fermetures + GROUP BY des RDV non annulés
+                occupation = OccupationCabinet(self.lundi, self.lundi + timedelta(days=jours - 1))
+            self.assertTrue(occupation.est_occupe(self.slot))
+            self.assertFalse(occupation.est_occupe(self.slot + timedelta(minutes=50)))
+        self.assertTrue(occupation.est_ferme(self.lundi + timedelta(days=1)))
+
+    def test_pages_de_reservation(self):
+        from .forms import get_creneaux_disponibles, get_creneaux_for_date, get_creneaux_table_semaine
+
+        for fonction in (get_creneaux_disponibles, get_creneaux_table_semaine, lambda: get_creneaux_for_date(self.lundi)):
+            self._vider_cache()
+            with self.assertNumQueries(2):
+                fonction()
+        creneaux = [c['value'] for c in get_creneaux_for_date(self.lundi)]
+        self.assertNotIn(self.slot.isoformat(), creneaux)
+        self.assertIn((self.slot + timedelta(minutes=50)).isoformat(), creneaux)
+        self.assertEqual(get_creneaux_for_date(self.lundi + timedelta(days=1)), [])
+
+
+@override_settings(RDV_CAPACITE_CRENEAU=1)
+class CacheCreneauxTests(TestCase):
+    """Instantané d'occupation en 2 requêtes, cache versionné par jour et formulaire paresseux."""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        semaine_type()
+        self.user = User.objects.create_user('patient', 'patient@example.com')
+        today = cabinet_local_today()
+        self.lundi = today + timedelta(days=7 - today.weekday())
+        self.mardi = self.lundi + timedelta(days=1)
+        self.slot = cabinet_day_datetime_bounds(self.lundi)[0] + timedelta(hours=8)
+
+    def _occupation(self):
+        from .forms import OccupationCabinet
+
+        return OccupationCabinet(self.lundi, self.mardi)
+
+    def test_instantane_horizon_en_deux_requetes(self):
+        from .forms import HORIZON_RESERVATION_JOURS, OccupationCabinet
+
+        fin = cabinet_local_today() + timedelta(days=HORIZON_RESERVATION_JOURS - 1)
+        with self.assertNumQueries(2):
+            OccupationCabinet(cabinet_local_today(), fin)
+        with self.assertNumQueries(0):
+            OccupationCabinet(cabinet_local_today(), fin)
+
+    def test_formulaire_paresseux(self):
+        from .forms import RendezVousForm
+
+        with self.assertNumQueries(0):
+            form = RendezVousForm()
+        # Le help_text n'est calculé qu'à l'affichage : une seule tranche de l'horizon sondée
+        with self.assertNumQueries(2):
+            self.assertEqual(form['date'].help_text, '')
+        with self.assertNumQueries(0):
+            self.assertTrue(form.a_creneau_disponible)
+
+    def test_formulaire_soumis_sans_sonde(self):
+        from .forms import RendezVousForm
+
+        donnees = {'titre': 'Contrôle', 'description': 'x', 'priority': 'normal'}
+        with self.assertNumQueries(0):
+            form = RendezVousForm(data=donnees)
+            self.assertFalse(form.is_valid())  # créneau manquant : ni sonde ni occupation
+        self.assertIn('date', form.errors)
+        with self.assertNumQueries(2):  # occupation du seul jour choisi, dans clean()
+            form = RendezVousForm(data={**donnees, 'date': self.slot.isoformat()})
+            self.assertTrue(form.is_valid())
+        with self.assertNumQueries(2):  # sonde à l'affichage du help_text
+            self.assertEqual(form['date'].help_text, '')
+        with self.assertNumQueries(0):
+            self.assertEqual(form['date'].help_text, '')
+        rdv = Rendez_vous.objects.create(titre='R', description='', date=self.slot, utilisateur=self.user)
+        with self.assertNumQueries(0):  # modification : pas de help_text
+            self.assertEqual(RendezVousForm(instance=rdv, exclude_rdv_pk=rdv.pk)['date'].help_text, '')
+
+    def test_invalidation_reservation_et_annulation(self):
+        self.assertEqual(self._occupation().places_restantes(self.slot), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            rdv = Rendez_vous.objects.create(titre='R', description='', date=self.slot, utilisateur=self.user)
+        self.assertEqual(self._occupation().places_restantes(self.slot), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            rdv.status = 'cancelled'
+            rdv.save()
+        self.assertEqual(self._occupation().places_restantes(self.slot), 1)
+        with self.assertNumQueries(0):
+            self._occupation()
+
+    def test_invalidation_fermeture(self):
+        from .models import JourFermeture
+
+        self.assertFalse(self._occupation().est_ferme(self.lundi))
+        with self.captureOnCommitCallbacks(execute=True):
+            fermeture = JourFermeture.objects.create(date=self.lundi)
+        self.assertTrue(self._occupation().est_ferme(self.lundi))
+
+        # Fermeture déplacée (relue en base comme dans l'admin) : l'ancien jour rouvre
+        fermeture = JourFermeture.objects.get(pk=fermeture.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            fermeture.date = self.mardi
+            fermeture.save()
+        occupation = self._occupation()
+        self.assertEqual((occupation.est_ferme(self.lundi), occupation.est_ferme(self.mardi)), (False, True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fermeture.delete()
+        self.assertFalse(self._occupation().est_ferme(self.mardi))
+
+
+class CachePartageCheckTests(TestCase):
+    """rdv.W001 : cache propre au processus signalé, sauf processus unique déclaré."""
+
+    def test_locmem_plusieurs_processus(self):
+        from .checks import verifier_cache_partage
+
+        with self.settings(RDV_PROCESSUS_UNIQUE=False):
+            self.assertEqual([(e.id, e.is_serious()) for e in verifier_cache_partage(None)], [('rdv.W001', False)])
+        with self.settings(RDV_PROCESSUS_UNIQUE=True):
+            self.assertEqual(verifier_cache_partage(None), [])
+
+
+@override_settings(RDV_CAPACITE_CRENEAU=2)
+class CapaciteCreneauTests(TestCase):
+    """Plusieurs fauteuils par créneau : postes attribués, plafond par service, places restantes."""
+
+    def test_postes_et_places_restantes(self):
+        from django.db import IntegrityError, transaction
+        from .forms import OccupationCabinet, get_creneaux_table_semaine
+
+        user = User.objects.create_user('patient', 'patient@example.com')
+        radio = Service.objects.create(nom='Radiologie', capacite=1)
+        today = cabinet_local_today()
+        lundi = today + timedelta(days=7 - today.weekday())
+        slot = cabinet_day_datetime_bounds(lundi)[0] + timedelta(hours=8)
+
+        def reserver(**kwargs):
+            with self.captureOnCommitCallbacks(execute=True):
+                return Rendez_vous.objects.create(titre='R', description='', date=slot, utilisateur=user, **kwargs)
+
+        a = reserver(service=radio)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            reserver(service=radio)
+        b = reserver()
+        self.assertEqual((a.poste, b.poste), (1, 2))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            reserver()
+        semaine_type()
+        with self.assertNumQueries(2):
+            self.assertEqual(OccupationCabinet(lundi, lundi).places_restantes(slot), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            b.status = 'cancelled'
+            b.save()
+        self.assertEqual(OccupationCabinet(lundi, lundi).places_restantes(slot), 1)
+        self.assertEqual(OccupationCabinet(lundi, lundi, service=radio).places_restantes(slot), 0)
+        self.assertEqual(OccupationCabinet(lundi, lundi, exclude_rdv_pk=a.pk).places_restantes(slot), 2)
+
+        table = get_creneaux_table_semaine(extra_dates=[lundi])
+        col = [d['date_iso'] for d in table['days']].index(lundi.isoformat())
+        cellule = next(r['cells'][col] for r in table['rows'] if r['time'] == '08:00')
+        self.assertEqual((cellule['available'], cellule['restantes']), (True, 1))
+
+
+@override_settings(RDV_CAPACITE_CRENEAU=1)
+class ContrainteCreneauTests(TestCase):
+    """Index uniques sur les RDV actifs, reprise de save_reservation et réactivation des RDV annulés."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('patient', 'patient@example.com')
+        today = cabinet_local_today()
+        lundi = today + timedelta(days=7 - today.weekday())
+        self.slot = cabinet_day_datetime_bounds(lundi)[0] + timedelta(hours=8)
+
+    def _rdv(self, **kwargs):
+        return Rendez_vous(titre='R', description='', date=self.slot, utilisateur=self.user, **kwargs)
+
+    def test_index_unique_sur_les_rdv_actifs(self):
+        from django.db import IntegrityError, transaction
+
+        # bulk_create contourne save() : seul l'index unique protège le créneau
+        Rendez_vous.objects.bulk_create([self._rdv(status='cancelled'), self._rdv(status='pending')])
+        self.assertEqual(Rendez_vous.objects.filter(date=self.slot).count(), 2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Rendez_vous.objects.bulk_create([self._rdv(status='confirmed')])
+
+    def test_save_reservation_reessaie_puis_refuse(self):
+        from django.db import IntegrityError
+        from .forms import RendezVousForm
+
+        data = {'titre': 'R', 'description': 'Contrôle', 'priority': 'normal', 'date': self.slot.isoformat()}
+        save = Rendez_vous.save
+        appels = []
+
+        def conflit_puis_save(rdv, *args, **kwargs):
+            appels.append(rdv)
+            if len(appels) == 1:
+                raise IntegrityError('poste pris entre-temps')
+            return save(rdv, *args, **kwargs)
+
+        form = RendezVousForm(data=data)
+        self.assertTrue(form.is_valid(), form.errors)
+        with mock.patch.object(Rendez_vous, 'save', autospec=True, side_effect=conflit_puis_save):
+            rdv = form.save_reservation(utilisateur=self.user)
+        self.assertEqual(len(appels), 2)
+        self.assertIsNotNone(rdv.pk)
+        rdv.delete()
+
+        form = RendezVousForm(data=data)
+        self.assertTrue(form.is_valid(), form.errors)
+        with mock.patch.object(Rendez_vous, 'save', autospec=True, side_effect=IntegrityError) as save_mock:
+            self.assertIsNone(form.save_reservation(tentatives=3, utilisateur=self.user))
+        self.assertEqual(save_mock.call_count, 3)
+        self.assertEqual(form.errors['date'], ['Ce créneau n’est plus disponible.'])
+
+    def test_reactivation_sur_un_poste_libre(self):
+        from .admin import make_confirmed
+        from .models import update_rendez_vous
+
+        with self.captureOnCommitCallbacks(execute=True):
+            annule = Rendez_vous.objects.create(titre='A', description='', date=self.slot, utilisateur=self.user)
+            annule.status = 'cancelled'
+            annule.save()
+            actif = Rendez_vous.objects.create(titre='B', description='', date=self.slot, utilisateur=self.user)
+        self.assertEqual((annule.poste, actif.poste), (1, 1))
+
+        # Créneau complet : l'action admin ne plante pas, le RDV reste annulé et est signalé
+        modeladmin = mock.Mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_confirmed(modeladmin, None, Rendez_vous.objects.filter(pk__in=[annule.pk, actif.pk]))
+        self.assertEqual(modeladmin.message_user.call_args_list[0].args[1], '1 rendez-vous marqués comme "confirmed"')
+        self.assertIn(str(annule.pk), modeladmin.message_user.call_args_list[1].args[1])
+        annule.refresh_from_db()
+        self.assertEqual(annule.status, 'cancelled')
+
+        with self.settings(RDV_CAPACITE_CRENEAU=2), self.captureOnCommitCallbacks(execute=True):
+            refuses = []
+            self.assertEqual(update_rendez_vous(Rendez_vous.objects.filter(pk=annule.pk), refuses=refuses, status='pending'), 1)
+        annule.refresh_from_db()
+        self.assertEqual((annule.status, annule.poste, annule.annule_le, refuses), ('pending', 2, None, []))
+
+
+@override_settings(RDV_CAPACITE_CRENEAU=1)
+class ChevauchementTests(TestCase):
+    """Un RDV occupe [date, date + durée du service) : services longs et horaires hors grille bloquent."""
+
+    def test_duree_du_service_et_horaire_hors_grille(self):
+        from django.core.exceptions import ValidationError
+        from .forms import OccupationCabinet, RendezVousForm
+
+        user = User.objects.create_user('patient', 'patient@example.com')
+        long = Service.objects.create(nom='Chirurgie', duree_minutes=90)
+        today = cabinet_local_today()
+        lundi = today + timedelta(days=7 - today.weekday())
+        debut_jour = cabinet_day_datetime_bounds(lundi)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            Rendez_vous.objects.create(titre='A', description='', date=debut_jour + timedelta(hours=8), utilisateur=user, service=long)
+            Rendez_vous.objects.create(titre='B', description='', date=debut_jour + timedelta(hours=14, minutes=20), utilisateur=user)
+
+        libres = [t.strftime('%H:%M') for t, _ in OccupationCabinet(lundi, lundi).creneaux_libres(lundi)]
+        self.assertEqual(libres, ['09:40', '10:30', '11:20', '12:10', '15:40', '16:30', '17:20'])
+
+        form = RendezVousForm(data={
+            'titre': 'C', 'description': '', 'priority': 'normal',
+            'date': (debut_jour + timedelta(hours=8, minutes=50)).isoformat(),
+        })
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['date'], ['Ce créneau n’est plus disponible.'])
+
+        hors_grille = Rendez_vous(titre='D', description='', date=debut_jour + timedelta(hours=9), utilisateur=user)
+        with self.assertRaises(ValidationError):
+            hors_grille.full_clean()
+
+
+class ProchainsCreneauxTests(TestCase):
+    """Le parcours s'arrête dès que n créneaux sont trouvés : une seule tranche chargée pour n petit."""
+
+    def test_arret_des_n_creneaux(self):
+        from .forms import next_free_slots
+        from .models import JourFermeture
+
+        today = cabinet_local_today()
+        lundi = today + timedelta(days=7 - today.weekday())
+        with self.captureOnCommitCallbacks(execute=True):
+            JourFermeture.objects.create(date=lundi)
+        apres = cabinet_day_datetime_bounds(lundi)[0]
+        semaine_type()
+        with self.assertNumQueries(2):
+            slots = next_free_slots(after=apres, n=3)
+        mardi = lundi + timedelta(days=1)
+        self.assertEqual([s.date() for _, s in slots], [mardi] * 3)
+        self.assertEqual([t.strftime('%H:%M') for t, _ in slots], ['08:00', '08:50', '09:40'])
+
+    def test_api(self):
+        user = User.objects.create_user('patient', 'patient@example.com')
+        self.client.force_login(user)
+        url = reverse('rdv_prochains_creneaux_api')
+        reponse = self.client.get(url, {'n': 4})
+        self.assertEqual(len(reponse.json()['creneaux']), 4)
+        self.assertEqual(self.client.get(url, {'service': '999'}).status_code, 400)
+
+
+@override_settings(RDV_CAPACITE_CRENEAU=1)
+class DisponibilitesApiTests(TestCase):
+    """Plusieurs jours en une passe, masques de bits, et 304 tant que les jours n'ont pas changé."""
+
+    def test_masques_et_etag(self):
+        from .models import JourFermeture
+
+        user = User.objects.create_user('patient', 'patient@example.com')
+        self.client.force_login(user)
+        today = cabinet_local_today()
+        lundi = today + timedelta(days=7 - today.weekday())
+        with self.captureOnCommitCallbacks(execute=True):
+            Rendez_vous.objects.create(
+                titre='A', description='', date=cabinet_day_datetime_bounds(lundi)[0] + timedelta(hours=8), utilisateur=user
+            )
+        url = reverse('rdv_disponibilites_api')
+        params = {'debut': lundi.isoformat(), 'fin': (lundi + timedelta(days=6)).isoformat()}
+
+        semaine_type()
+        with self.assertNumQueries(2 + 2):  # session/utilisateur + fermetures et GROUP BY des RDV
+            reponse = self.client.get(url, params)
+        donnees = reponse.json()
+        self.assertEqual(len(donnees['grille']), 11)
+        self.assertEqual(donnees['jours'][lundi.isoformat()], [2 ** 11 - 1, 2 ** 11 - 2])
+        self.assertEqual(donnees['jours'][(lundi + timedelta(days=4)).isoformat()][0], 2 ** 6 - 1)
+        self.assertEqual(donnees['jours'][(lundi + timedelta(days=5)).isoformat()], [0, 0])
+
+        with self.assertNumQueries(2):
+            reponse = self.client.get(url, params, HTTP_IF_NONE_MATCH=reponse['ETag'])
+        self.assertEqual(reponse.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            JourFermeture.objects.create(date=lundi + timedelta(days=1))
+        reponse = self.client.get(url, params, HTTP_IF_NONE_MATCH=reponse['ETag'])
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()['jours'][(lundi + timedelta(days=1)).isoformat()], [0, 0])
+        self.assertEqual(self.client.get(url, {'debut': lundi.isoformat(), 'fin': '2099-01-01'}).status_code, 400)
+
+
+class GetConditionnelTests(TestCase):
+    """304 tant que les marqueurs n'ont pas bougé ; accueil anonyme servi depuis le cache."""
+
+    def test_file_attente_revalidee(self):
+        user = User.objects.create_user('patient', 'patient@example.com')
+        self.client.force_login(user)
+        url = reverse('file_attente')
+        premiere = self.client.get(url)
+        self.assertEqual(premiere.status_code, 200)
+        with self.assertNumQueries(2):  # session + utilisateur, ni file ni gabarit
+            reponse = self.client.get(url, HTTP_IF_NONE_MATCH=premiere['ETag'])
+        self.assertEqual(reponse.status_code, 304)
+        # Position du patient connecté : jamais dans un cache partagé
+        self.assertEqual(set(reponse['Cache-Control'].split(', ')), {'private', 'no-cache'})
+
+        # Même état de file pour tous : revalidé, mais pas réservé au navigateur
+        etat = self.client.get(reverse('file_attente_etat'))
+        self.assertEqual(etat['Cache-Control'], 'no-cache')
+        self.assertIn('Cookie', etat['Vary'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Rendez_vous.objects.create(titre='A', description='', date=timezone_now() + timedelta(days=1), utilisateur=user)
+        reponse = self.client.get(url, HTTP_IF_NONE_MATCH=premiere['ETag'])
+        self.assertEqual(reponse.status_code, 200)
+        self.assertNotEqual(reponse['ETag'], premiere['ETag'])
+
+    def test_accueil_anonyme_en_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            service = Service.objects.create(nom='Blanchiment')
+        url = reverse('accueil')
+        self.assertContains(self.client.get(url), 'Blanchiment')
+        with self.assertNumQueries(0):
+            reponse = self.client.get(url)
+        self.assertContains(reponse, 'Blanchiment')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            service.nom = 'Orthodontie'
+            service.save()
+        self.assertContains(self.client.get(url), 'Orthodontie')
+
+
+class PrincipalTests(TestCase):
+    """Rôle et noms résolus en une requête jointe, puis relus en session jusqu'au prochain changement de profil."""
+
+    def _requetes_profil(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            reponse = self.client.get(url)
+        return reponse, [q['sql'] for q in ctx.captured_queries if 'rdv_utilisateur' in q['sql'] or 'rdv_patient' in q['sql']]
+
+    def test_une_requete_puis_session(self):
+        user = User.objects.create_user('patient', 'patient@example.com')
+        self.client.force_login(user)
+        reponse, requetes = self._requetes_profil(reverse('extranet'))
+        self.assertEqual(len(requetes), 1)
+        self.assertContains(reponse, 'Bienvenue, patient')
+
+        reponse, requetes = self._requetes_profil(reverse('rdv_list'))
+        self.assertEqual(requetes, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.patient_profile.nom = 'Amina'
+            user.patient_profile.save()
+        reponse, requetes = self._requetes_profil(reverse('extranet'))
+        self.assertEqual(len(requetes), 1)
+        self.assertContains(reponse, 'Bienvenue, Amina')
+
+
+class EmailBackendTests(TestCase):
+    """Connexion par email : recherche indexée insensible à la casse, un seul hachage par tentative."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('amina', email='Amina@Example.com', password='motdepasse-1')
+
+    def _hachages(self, identifiants):
+        from django.contrib.auth.hashers import get_hasher
+
+        hasher = type(get_hasher())
+        with mock.patch.object(hasher, 'encode', autospec=True, side_effect=hasher.encode) as encode:
+            reponse = self.client.post(reverse('login'), identifiants)
+        return reponse, encode.call_count
+
+    def test_email_normalise_synchronise(self):
+        self.assertEqual(self.user.profile.email_normalise, 'amina@example.com')
+        self.user.email = 'nouvelle@example.com'
+        self.user.save()
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.email_normalise, 'nouvelle@example.com')
+
+    def test_connexion_email_insensible_casse(self):
+        reponse, hachages = self._hachages({'email': ' AMINA@example.COM ', 'password': 'motdepasse-1'})
+        self.assertRedirects(reponse, reverse('extranet'), fetch_redirect_response=False)
+        self.assertEqual(hachages, 1)
+
+    def test_connexion_par_username(self):
+        reponse, _ = self._hachages({'email': 'amina', 'password': 'motdepasse-1'})
+        self.assertRedirects(reponse, reverse('extranet'), fetch_redirect_response=False)
+
+    def test_echecs_un_seul_hachage(self):
+        for identifiants in (
+            {'email': 'amina@example.com', 'password': 'faux'},
+            {'email': 'inconnu@example.com', 'password': 'faux'},
+        ):
+            reponse, hachages = self._hachages(identifiants)
+            self.assertEqual(reponse.status_code, 200)
+            self.assertEqual(hachages, 1)
+            self.assertNotIn('_auth_user_id', self.client.session)
+
+
+class ProvisionnementTests(TestCase):
+    """save(update_fields) sans champ de profil : pas de requête de signal ; création en masse en lots."""
+
+    def test_last_login_sans_requete_de_profil(self):
+        user = User.objects.create_user('amina', email='amina@example.com')
+        user.last_login = timezone_now()
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+        user.email = 'Autre@Example.com'
+        user.save(update_fields=['email'])
+        self.assertEqual(Utilisateur.objects.get(user=user).email_normalise, 'autre@example.com')
+
+    def test_provisionner_comptes_par_lots(self):
+        from .models import Compte, Patient
+        from .provisionnement import provisionner_comptes
+
+        User.objects.create_user('existant@example.com', email='Existant@example.com')
+        comptes = [{'email': f'patient{i}@example.com', 'first_name': 'P', 'last_name': str(i)} for i in range(30)]
+        comptes += [
+            {'email': 'EXISTANT@example.com'},
+            {'email': 'Patient29@example.com', 'username': 'p29'},  # même email dans le lot
+            {'username': 'agent1', 'role': 'agent', 'nom': 'Agent Un'},
+            {'username': 'x', 'role': 'chef'},
+        ]
+        with self.assertNumQueries(3 * 7):  # 3 lots : savepoint ×2, 1 SELECT, 4 INSERT
+            bilan = provisionner_comptes(comptes, lot=12)
+        self.assertEqual(bilan.crees, 31)
+        self.assertEqual(sorted(m for _, m in bilan.ignores), ['compte existant', 'en double dans le fichier', 'rôle invalide'])
+        self.assertEqual(Patient.objects.filter(user__username__startswith='patient').count(), 30)
+        self.assertEqual(Compte.objects.filter(patient__nom='P 7').count(), 1)
+        agent = Utilisateur.objects.get(user__username='agent1')
+        self.assertEqual((agent.role, agent.nom), ('agent', 'Agent Un'))
+        self.assertFalse(Patient.objects.filter(user=agent.user).exists())
+        self.assertFalse(agent.user.has_usable_password())
+        # Sans mot de passe : invitation aux comptes qui ont un email (pas à l'agent)
+        self.assertEqual((bilan.invites, len(mail.outbox)), (30, 30))
+        self.assertIn('/mot-de-passe/', mail.outbox[0].body)
+
+    def test_mot_de_passe_initial_a_changer(self):
+        from .provisionnement import provisionner_comptes
+
+        bilan = provisionner_comptes(
+            [{'username': 'a1', 'email': 'a1@example.com'}, {'username': 'a2', 'email': 'a2@example.com'}],
+            mot_de_passe='Bienvenue-2026',
+        )
+        self.assertEqual((bilan.crees, bilan.invites), (2, 0))
+        a1, a2 = User.objects.filter(username__in=['a1', 'a2']).order_by('username')
+        self.assertTrue(a1.check_password('Bienvenue-2026'))
+        self.assertNotEqual(a1.password, a2.password)  # un sel par compte
+        self.assertTrue(a1.profile.mot_de_passe_a_changer)
+
+        self.client.force_login(a1)
+        self.assertRedirects(self.client.get(reverse('rdv_list')), reverse('mot_de_passe_changer'))
+        reponse = self.client.post(reverse('mot_de_passe_changer'), {
+            'old_password': 'Bienvenue-2026', 'new_password1': 'Sourire-Blanc-91', 'new_password2': 'Sourire-Blanc-91',
+        })
+        self.assertRedirects(reponse, reverse('extranet'))
+        self.assertFalse(Utilisateur.objects.get(user=a1).mot_de_passe_a_changer)
+        self.assertEqual(self.client.get(reverse('rdv_list')).status_code, 200)
+
+    def test_invitation_definit_le_mot_de_passe(self):
+        from .provisionnement import provisionner_comptes
+
+        provisionner_comptes([{'email': 'fatou@example.com'}])
+        lien = next(ligne for ligne in mail.outbox[0].body.splitlines() if '/mot-de-passe/' in ligne)
+        chemin = lien[lien.index('/mot-de-passe/'):]
+        reponse = self.client.post(chemin, {'new_password1': 'Sourire-Blanc-91', 'new_password2': 'Sourire-Blanc-91'})
+        self.assertRedirects(reponse, reverse('login'), fetch_redirect_response=False)
+        self.assertTrue(User.objects.get(username='fatou@example.com').check_password('Sourire-Blanc-91'))
+        # Jeton à usage unique : le mot de passe a changé
+        self.assertRedirects(self.client.get(chemin), reverse('login'), fetch_redirect_response=False)
+
+
+@override_settings(RDV_METRIQUES=True)
+class MetriquesTests(TestCase):
+    """Middleware de mesure par vue et exposition Prometheus réservée au staff / aux IP autorisées."""
+
+    def setUp(self):
+        from . import metriques
+
+        metriques.reinitialiser()
+        self.user = User.objects.create_user('amina', password='motdepasse-1')
+
+    @override_settings(RDV_METRIQUES_IPS=[])
+    def test_exposition(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('rdv_creneaux_api'), {'date': cabinet_local_today().isoformat()})
+        self.assertEqual(self.client.get(reverse('metriques')).status_code, 403)
+
+        self.user.is_staff = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['is_staff'])  # périme le principal gardé en session
+        reponse = self.client.get(reverse('metriques'))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse['Content-Type'].startswith('text/plain; version=0.0.4'))
+        texte = reponse.content.decode()
+        self.assertIn('rdv_http_requests_total{vue="rdv_creneaux_api",methode="GET",statut="200"} 1', texte)
+        self.assertIn('rdv_http_request_duration_seconds_count{vue="rdv_creneaux_api"} 1', texte)
+        self.assertIn('rdv_db_queries_bucket{vue="rdv_creneaux_api",le="+Inf"} 1', texte)
+        self.assertIn('rdv_operation_duration_seconds_count{operation="creneaux.jour"} 1', texte)
+
+    @override_settings(RDV_METRIQUES_IPS=['127.0.0.1'])
+    def test_collecteur_autorise_par_ip(self):
+        self.assertEqual(self.client.get(reverse('metriques')).status_code, 200)
+
+    def test_histogramme_cumulatif(self):
+        from .metriques import Famille
+
+        famille = Famille('t', 'test', 'histogram', ('vue',), (1, 5))
+        for mesure in (0.5, 1, 3, 9):
+            famille.observer(('v',), mesure)
+        self.assertEqual(famille.exposer()[2:], [
+            't_bucket{vue="v",le="1"} 2',
+            't_bucket{vue="v",le="5"} 3',
+            't_bucket{vue="v",le="+Inf"} 4',
+            't_sum{vue="v"} 13.5',
+            't_count{vue="v"} 4',
+        ])
+
+
+class JeuDeDonneesTests(TestCase):
+    """seed_load : volumes demandés, créneaux de la grille, jours fermés évités, compteurs reconstruits."""
+
+    def test_generer(self):
+        from .jeu_de_donnees import Volumes, generer
+        from .models import JourFermeture, Statistique
+
+        bilan = generer(Volumes(utilisateurs=20, services=3, fermetures=5, rdv=200, jours_passes=30, jours_futurs=30))
+        self.assertEqual((bilan['utilisateurs'], bilan['services'], bilan['fermetures']), (20, 3, 5))
+        self.assertEqual(bilan['rdv'] + bilan['refuses'], 200)
+        self.assertEqual(Statistique.generer_rapport()['total'], bilan['rdv'])
+        from zoneinfo import ZoneInfo
+        from django.conf import settings
+
+        fermes = set(JourFermeture.objects.values_list('date', flat=True))
+        semaine = semaine_type()
+        for date, status in Rendez_vous.objects.values_list('date', 'status'):
+            locale = date.astimezone(ZoneInfo(settings.TIME_ZONE))
+            self.assertIn(locale.time(), semaine[locale.weekday()])
+            if status != 'cancelled':
+                self.assertNotIn(locale.date(), fermes)
+        # Relancer avec le même préfixe réutilise les comptes déjà créés
+        self.assertEqual(generer(Volumes(utilisateurs=20, rdv=0))['utilisateurs'], 0)
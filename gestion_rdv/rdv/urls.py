@@ -6,6 +6,8 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('signup/', views.signup_view, name='signup'),
     path('logout/', views.logout_view, name='logout'),
+    path('mot-de-passe/', views.mot_de_passe_changer, name='mot_de_passe_changer'),
+    path('mot-de-passe/<uidb64>/<token>/', views.mot_de_passe_definir, name='mot_de_passe_definir'),
     path('agent/dashboard/', views.agent_dashboard, name='agent_dashboard'),
     path('agent/file-dattente/', views.agent_file_attente_view, name='agent_file_attente'),
     path('agent/rdv/<int:pk>/valider/', views.rdv_valider, name='rdv_valider'),
@@ -14,10 +16,17 @@ urlpatterns = [
     path('extranet/', views.extranet, name='extranet'),
     path('mes-rendez-vous/', views.rdv_list, name='rdv_list'),
     path('file-dattente/', views.file_attente_view, name='file_attente'),
+    path('file-dattente/flux/', views.file_attente_flux, name='file_attente_flux'),
+    path('file-dattente/etat/', views.file_attente_etat, name='file_attente_etat'),
     path('rdv/create/', views.rdv_create, name='rdv_create'),
     path('rdv/<int:pk>/annuler/', views.rdv_patient_annuler, name='rdv_patient_annuler'),
     path('rdv/<int:pk>/modifier/', views.rdv_patient_modifier, name='rdv_patient_modifier'),
     path('rdv/creneaux/', views.rdv_creneaux_api, name='rdv_creneaux_api'),
+    path('rdv/creneaux/disponibilites/', views.rdv_disponibilites_api, name='rdv_disponibilites_api'),
+    path('rdv/creneaux/prochains/', views.rdv_prochains_creneaux_api, name='rdv_prochains_creneaux_api'),
     path('rdv/next/', views.rdv_next, name='rdv_next'),
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('statistiques/rapport/', views.admin_rapport_api, name='admin_rapport_api'),
+    path('statistiques/export/', views.rdv_export, name='rdv_export'),
+    path('metrics', views.metriques_view, name='metriques'),
 ]
@@ -1,81 +1,83 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST, require_GET
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Utilisateur, Statistique, Service
+from .models import Utilisateur, Statistique, Service, normaliser_email
 from .forms import (
     RendezVousForm,
     get_creneaux_for_date,
+    next_free_slots,
+    disponibilites_dates,
+    repere_disponibilites,
+    DISPONIBILITES_MAX_JOURS,
+    JOURS_NOMS,
     get_creneaux_table_semaine,
     patient_peut_modifier_ou_annuler,
     cabinet_local_today,
     cabinet_day_datetime_bounds,
 )
-from .models import Rendez_vous, FileAttente
+from .models import Rendez_vous, FileAttente, FileDisputee
+from . import marqueurs
+from .marqueurs import conditionnel, reponse_conditionnelle
+from .principal import CLE_MOT_DE_PASSE_A_CHANGER, get_principal
 from django.contrib.admin.views.decorators import staff_member_required
 from django.db.models import Count
 from django.utils import timezone
 from django.conf import settings as dj_settings
 from zoneinfo import ZoneInfo
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 
-def _is_agent(user):
-	profile = getattr(user, 'profile', None)
-	return profile and profile.role == 'agent' or getattr(user, 'is_staff', False)
+def _is_agent(request):
+	return get_principal(request).est_agent
 
 
 def _queue_ordered():
-	"""File d'attente : tous les RDV pending triés (urgent d'abord, puis date, created_at)."""
-	qs = Rendez_vous.objects.filter(status='pending')
-	return sorted(qs, key=lambda r: (0 if r.priority == 'urgent' else 1, r.date, r.created_at))
+	"""File d'attente : RDV pending triés en SQL (urgent d'abord, puis date, created_at), avec position_file."""
+	return Rendez_vous.objects.with_queue_position()
 
 
-def _patient_display_name(user):
-	"""Nom d'affichage pour un patient (sans email)."""
-	try:
-		nom = (getattr(user.patient_profile, 'nom', None) or '').strip()
-		if nom:
-			return nom
-	except Exception:
-		pass
-	try:
-		nom = (getattr(user.profile, 'nom', None) or '').strip()
-		if nom:
-			return nom
-	except Exception:
-		pass
-	if user.first_name or user.last_name:
-		return (user.get_full_name() or '').strip()
-	return 'Patient'
+# Page d'accueil des visiteurs anonymes gardée en cache (clé = version des services)
+ACCUEIL_CACHE_TIMEOUT = getattr(dj_settings, 'ACCUEIL_CACHE_TIMEOUT', 3600)
 
 
+@conditionnel(marqueurs.SERVICES)
 def accueil(request):
 	"""Page d'accueil publique : cabinet dentaire (khdma dyalna). Connexion en haut à droite."""
-	services = Service.objects.all()[:8]
-	return render(request, 'rdv/accueil.html', {'services': services})
+	if request.user.is_authenticated or len(messages.get_messages(request)):
+		return render(request, 'rdv/accueil.html', {'services': Service.objects.all()[:8]})
+	# Même page pour tous les visiteurs : rendue une fois par version des services
+	cle = f"rdv:accueil:{marqueurs.lire(marqueurs.SERVICES)[0]}"
+	contenu = cache.get(cle)
+	if contenu is None:
+		response = render(request, 'rdv/accueil.html', {'services': Service.objects.all()[:8]})
+		cache.set(cle, response.content, ACCUEIL_CACHE_TIMEOUT)
+		return response
+	return HttpResponse(contenu)
 
 
 @login_required
 def agent_dashboard(request):
 	"""Agent: RDV du jour, appeler prochain, valider/annuler."""
-	if not _is_agent(request.user):
+	if not _is_agent(request):
 		return redirect('extranet')
 
 	today = cabinet_local_today()
 	start_day, end_day = cabinet_day_datetime_bounds(today)
-	rdv_du_jour = (
-		Rendez_vous.objects.filter(date__gte=start_day, date__lt=end_day)
+	rdv_du_jour = list(
+		Rendez_vous.objects.with_patient_name()
+		.filter(date__gte=start_day, date__lt=end_day)
 		.exclude(status='cancelled')
 		.order_by('date')
 	)
 	prochain = Rendez_vous.objects.next_in_queue_agent_global()
 	en_attente_count = Rendez_vous.objects.filter(status='pending').count()
 
-	rdv_du_jour_with_names = [{'rdv': r, 'patient_name': _patient_display_name(r.utilisateur) or r.utilisateur.username} for r in rdv_du_jour]
-	prochain_name = _patient_display_name(prochain.utilisateur) if prochain else None
+	rdv_du_jour_with_names = [{'rdv': r, 'patient_name': r.patient_nom} for r in rdv_du_jour]
+	prochain_name = prochain.patient_nom if prochain else None
 	tz_cab = ZoneInfo(str(dj_settings.TIME_ZONE))
 	prochain_date_cabinet = (
 		timezone.localtime(prochain.date, tz_cab).date() if prochain else None
@@ -89,7 +91,7 @@ def agent_dashboard(request):
 		'rdv_du_jour_list': rdv_du_jour,
 		'prochain': prochain,
 		'prochain_name': prochain_name,
-		'count_rdv_jour': rdv_du_jour.count(),
+		'count_rdv_jour': len(rdv_du_jour),
 		'en_attente_count': en_attente_count,
 		'date_jour_label': today.strftime('%d/%m/%Y'),
 		'prochain_pas_aujourdhui': prochain_pas_aujourdhui,
@@ -101,12 +103,14 @@ def agent_dashboard(request):
 @require_POST
 def agent_appeler_prochain(request):
 	"""Appel du prochain ticket: afficher et marquer confirmé."""
-	if not _is_agent(request.user):
+	if not _is_agent(request):
 		return redirect('extranet')
-	next_obj = Rendez_vous.objects.next_in_queue_agent_global()
+	try:
+		next_obj = Rendez_vous.objects.appeler_prochain()
+	except FileDisputee:
+		messages.warning(request, 'Les patients en tête de file viennent d’être appelés par d’autres agents : réessayez.')
+		return redirect('agent_dashboard')
 	if next_obj:
-		next_obj.status = 'confirmed'
-		next_obj.save()
 		messages.success(request, f'Ticket appelé: {next_obj.titre}')
 	return redirect('agent_dashboard')
 
@@ -115,7 +119,7 @@ def agent_appeler_prochain(request):
 @require_POST
 def rdv_valider(request, pk):
 	"""Valider un RDV (marquer comme done = passé chez le médecin)."""
-	if not _is_agent(request.user):
+	if not _is_agent(request):
 		return redirect('extranet')
 	rdv = get_object_or_404(Rendez_vous, pk=pk)
 	rdv.status = 'done'
@@ -132,7 +136,7 @@ def rdv_valider(request, pk):
 @require_POST
 def rdv_annuler(request, pk):
 	"""Annuler un RDV."""
-	if not _is_agent(request.user):
+	if not _is_agent(request):
 		return redirect('extranet')
 	rdv = get_object_or_404(Rendez_vous, pk=pk)
 	rdv.status = 'cancelled'
@@ -145,29 +149,15 @@ def login_view(request):
 	if request.method == 'POST':
 		email = request.POST.get('email')
 		password = request.POST.get('password')
-		# authenticate by username or email
-		from django.contrib.auth.models import User
-		username = None
-		try:
-			user = User.objects.get(email=email)
-			username = user.username
-		except User.DoesNotExist:
-			# maybe the user used their email as username
-			username = email
-
-		# Try authenticate using resolved username
-		user = authenticate(request, username=username, password=password)
-		if user is None and username != email:
-			# fallback: try authenticating with the raw email as username
-			user = authenticate(request, username=email, password=password)
+		# Une recherche indexée par email (ou username) et un seul hachage : voir rdv.backends
+		user = authenticate(request, email=email, password=password)
 
 		if user is not None:
 			login(request, user)
-			profile = getattr(user, 'profile', None)
-			role = profile.role if profile else 'user'
-			if role == 'admin' or getattr(user, 'is_staff', False):
+			principal = get_principal(request)
+			if principal.est_admin or principal.is_staff:
 				return redirect('/admin/')  # Django Admin dashboard
-			if role == 'agent':
+			if principal.role == 'agent':
 				return redirect('agent_dashboard')
 			return redirect('extranet')
 		messages.error(request, 'Identifiants invalides. Si vous n\'avez pas de compte, créez-en un.')
@@ -179,43 +169,251 @@ def logout_view(request):
 	return redirect('accueil')
 
 
+def _mot_de_passe_choisi(request, user):
+	"""Le mot de passe est désormais celui de l'utilisateur : plus de changement imposé."""
+	Utilisateur.objects.filter(user=user, mot_de_passe_a_changer=True).update(mot_de_passe_a_changer=False)
+	request.session.pop(CLE_MOT_DE_PASSE_A_CHANGER, None)
+
+
+@login_required
+def mot_de_passe_changer(request):
+	"""Changement de mot de passe ; imposé (PrincipalMiddleware) après un mot de passe initial fixé par le cabinet."""
+	from django.contrib.auth import update_session_auth_hash
+	from django.contrib.auth.forms import PasswordChangeForm
+
+	form = PasswordChangeForm(request.user, request.POST or None)
+	if request.method == 'POST' and form.is_valid():
+		user = form.save()
+		update_session_auth_hash(request, user)
+		_mot_de_passe_choisi(request, user)
+		messages.success(request, 'Mot de passe modifié.')
+		return redirect('extranet')
+	return render(request, 'rdv/mot_de_passe.html', {
+		'form': form,
+		'titre': 'Changer le mot de passe',
+		'impose': CLE_MOT_DE_PASSE_A_CHANGER in request.session,
+	})
+
+
+def mot_de_passe_definir(request, uidb64, token):
+	"""Lien d'invitation (rdv.provisionnement) ou de réinitialisation : choix du mot de passe."""
+	from django.contrib.auth.forms import SetPasswordForm
+	from django.contrib.auth.tokens import default_token_generator
+	from django.contrib.auth.models import User
+	from django.utils.http import urlsafe_base64_decode
+
+	try:
+		user = User.objects.get(pk=urlsafe_base64_decode(uidb64).decode())
+	except (ValueError, User.DoesNotExist):
+		user = None
+	if user is None or not default_token_generator.check_token(user, token):
+		messages.error(request, 'Ce lien n\'est plus valide. Demandez une nouvelle invitation au cabinet.')
+		return redirect('login')
+	form = SetPasswordForm(user, request.POST or None)
+	if request.method == 'POST' and form.is_valid():
+		form.save()
+		_mot_de_passe_choisi(request, user)
+		messages.success(request, 'Mot de passe enregistré : vous pouvez vous connecter.')
+		return redirect('login')
+	return render(request, 'rdv/mot_de_passe.html', {'form': form, 'titre': 'Choisir votre mot de passe'})
+
+
 @login_required
 def extranet(request):
-	profile = getattr(request.user, 'profile', None)
-	role = profile.role if profile else 'user'
-	display = ''
+	principal = get_principal(request)
+	return render(request, 'rdv/extranet.html', {'role': principal.role or 'user'})
+
+
+def _rdv_list_curseur(rdv):
+	return f"{rdv.date.isoformat()}|{rdv.pk}"
+
+
+def _rdv_list_page(qs, request):
+	"""
+	Page de `qs` triée par (date, id) décroissants, en pagination par clé (seek) :
+	`?apres=<date iso>|<id>` reprend juste après la dernière ligne de la page précédente.
+	"""
+	from datetime import datetime as dt_module
+	from django.db.models import Q
+
 	try:
-		display = (getattr(request.user.patient_profile, 'nom', None) or '').strip()
-	except Exception:
+		taille = int(request.GET.get('taille') or dj_settings.RDV_LIST_PAGE_SIZE)
+	except ValueError:
+		taille = dj_settings.RDV_LIST_PAGE_SIZE
+	taille = max(1, min(taille, dj_settings.RDV_LIST_PAGE_SIZE_MAX))
+
+	# Filtres : une valeur inconnue est ignorée, comme une taille ou un curseur invalides
+	for champ, choix in (('status', Rendez_vous.STATUS_CHOICES), ('priority', Rendez_vous.PRIORITY_CHOICES)):
+		valeur = request.GET.get(champ)
+		if valeur in {code for code, _ in choix}:
+			qs = qs.filter(**{champ: valeur})
+	try:
+		qs = qs.filter(service_id=int(request.GET['service']))
+	except (KeyError, ValueError):
 		pass
-	if not display and profile and getattr(profile, 'nom', None):
-		display = (profile.nom or '').strip()
-	if not display:
-		display = (request.user.get_full_name() or '').strip()
-	return render(request, 'rdv/extranet.html', {'role': role, 'user_display_name': display})
+
+	apres = request.GET.get('apres', '')
+	if apres:
+		try:
+			date_iso, pk = apres.rsplit('|', 1)
+			date_curseur = dt_module.fromisoformat(date_iso)
+			pk = int(pk)
+		except ValueError:
+			pass
+		else:
+			qs = qs.filter(Q(date__lt=date_curseur) | Q(date=date_curseur, pk__lt=pk))
+
+	rows = list(qs.order_by('-date', '-pk')[:taille + 1])
+	suivant = _rdv_list_curseur(rows[taille - 1]) if len(rows) > taille else None
+	return rows[:taille], suivant
 
 
 @login_required
 def rdv_list(request):
-	profile = getattr(request.user, 'profile', None)
-	if profile and profile.role == 'admin':
-		items = Rendez_vous.objects.all().order_by('-date')
-		item_rows = [{'rdv': r, 'peut_gerer': False} for r in items]
+	from django.db.models import BooleanField, Case, Value, When
+	from .forms import DELAI_PATIENT_MODIFICATION_HEURES
+
+	qs = Rendez_vous.objects.select_related('service')
+	if get_principal(request).est_admin:
+		qs = qs.annotate(peut_gerer=Value(False, output_field=BooleanField()))
 	else:
-		items = Rendez_vous.objects.filter(utilisateur=request.user).order_by('-date')
-		item_rows = [{'rdv': r, 'peut_gerer': patient_peut_modifier_ou_annuler(r)} for r in items]
-	return render(request, 'rdv/list.html', {'items': items, 'item_rows': item_rows})
+		# Même règle que patient_peut_modifier_ou_annuler(), évaluée en SQL
+		limite = timezone.now() + timedelta(hours=DELAI_PATIENT_MODIFICATION_HEURES)
+		qs = qs.filter(utilisateur=request.user).annotate(
+			peut_gerer=Case(
+				When(status__in=('pending', 'confirmed'), date__gt=limite, then=Value(True)),
+				default=Value(False),
+				output_field=BooleanField(),
+			)
+		)
+	# Position en file des RDV pending calculée dans la même requête, pas un COUNT par RDV
+	items, suivant = _rdv_list_page(Rendez_vous.objects.with_position_file(qs), request)
+
+	if request.GET.get('format') == 'json':
+		return JsonResponse({
+			'items': [
+				{
+					'id': r.pk,
+					'titre': r.titre,
+					'date': r.date.isoformat(),
+					'status': r.status,
+					'priority': r.priority,
+					'service': r.service.nom if r.service else None,
+					'peut_gerer': r.peut_gerer,
+				}
+				for r in items
+			],
+			'next': suivant,
+		})
+
+	item_rows = [{'rdv': r, 'peut_gerer': r.peut_gerer} for r in items]
+	next_query = None
+	if suivant:
+		params = request.GET.copy()
+		params['apres'] = suivant
+		next_query = params.urlencode()
+	return render(request, 'rdv/list.html', {'items': items, 'item_rows': item_rows, 'next_query': next_query})
 
 
 @login_required
 @login_required
 @require_GET
 def rdv_creneaux_api(request):
-	"""Retourne les créneaux disponibles pour une date (GET ?date=YYYY-MM-DD)."""
-	date_str = request.GET.get('date', '')
-	if not date_str:
+	"""Retourne les créneaux disponibles pour une date (GET ?date=YYYY-MM-DD), avec ETag."""
+	try:
+		dte = datetime.strptime(request.GET.get('date', ''), '%Y-%m-%d').date()
+	except ValueError:
 		return JsonResponse({'creneaux': []})
-	creneaux = get_creneaux_for_date(date_str)
+	return reponse_conditionnelle(
+		request,
+		repere_disponibilites([dte]),
+		lambda: JsonResponse({'creneaux': get_creneaux_for_date(dte)}),
+	)
+
+
+def _dates_demandees(params):
+	"""Dates de ?dates=AAAA-MM-JJ,... ou de ?debut=&fin= (inclus) ; ValueError si invalide ou trop long."""
+	from datetime import date as date_cls
+
+	if params.get('dates'):
+		dates = {date_cls.fromisoformat(d.strip()) for d in params['dates'].split(',') if d.strip()}
+	else:
+		debut = date_cls.fromisoformat(params.get('debut', ''))
+		fin = date_cls.fromisoformat(params.get('fin', '')) if params.get('fin') else debut + timedelta(days=6)
+		if fin < debut or (fin - debut).days >= DISPONIBILITES_MAX_JOURS:
+			raise ValueError
+		dates = {debut + timedelta(days=i) for i in range((fin - debut).days + 1)}
+	if not dates or (max(dates) - min(dates)).days >= DISPONIBILITES_MAX_JOURS:
+		raise ValueError
+	return sorted(dates)
+
+
+@login_required
+@require_GET
+def rdv_disponibilites_api(request):
+	"""
+	Disponibilités de plusieurs jours en une requête (GET ?debut=&fin= ou ?dates=a,b,c, &service=).
+	Masques de bits par jour (voir forms.disponibilites_dates) ; ETag / Last-Modified suivent les
+	versions du cache des créneaux : une semaine inchangée revient en 304 sans requête SQL.
+	"""
+	try:
+		dates = _dates_demandees(request.GET)
+	except ValueError:
+		return JsonResponse(
+			{'erreur': f'Dates invalides (au plus {DISPONIBILITES_MAX_JOURS} jours).'}, status=400
+		)
+	service = None
+	service_id = request.GET.get('service', '')
+	if service_id:
+		if service_id.isdigit():
+			service = Service.objects.filter(pk=service_id).first()
+		if service is None:
+			return JsonResponse({'erreur': 'Service inconnu.'}, status=400)
+	return reponse_conditionnelle(
+		request,
+		repere_disponibilites(dates, service),
+		lambda: JsonResponse(disponibilites_dates(dates, service)),
+	)
+
+
+# Plafond de ?n= pour « prochains créneaux libres »
+PROCHAINS_CRENEAUX_MAX = 50
+
+
+@login_required
+@require_GET
+def rdv_prochains_creneaux_api(request):
+	"""
+	Prochains créneaux libres (GET ?n=5&service=<id>&apres=<iso>) : parcours paresseux de
+	l'horizon, arrêté dès que n créneaux sont trouvés.
+	"""
+	try:
+		n = min(max(int(request.GET.get('n', 5)), 1), PROCHAINS_CRENEAUX_MAX)
+	except ValueError:
+		return JsonResponse({'erreur': 'Paramètre n invalide.'}, status=400)
+	service = None
+	service_id = request.GET.get('service', '')
+	if service_id:
+		if service_id.isdigit():
+			service = Service.objects.filter(pk=service_id).first()
+		if service is None:
+			return JsonResponse({'erreur': 'Service inconnu.'}, status=400)
+	apres = None
+	if request.GET.get('apres'):
+		try:
+			apres = datetime.fromisoformat(request.GET['apres'].replace(' ', '+').replace('Z', '+00:00'))
+		except ValueError:
+			return JsonResponse({'erreur': 'Paramètre apres invalide (ISO 8601).'}, status=400)
+		if timezone.is_naive(apres):
+			apres = timezone.make_aware(apres)
+	creneaux = [
+		{
+			'value': slot_dt.isoformat(),
+			'date': slot_dt.date().isoformat(),
+			'label': f"{JOURS_NOMS[slot_dt.weekday()]} {slot_dt:%d/%m/%Y} à {t:%H:%M}",
+		}
+		for t, slot_dt in next_free_slots(service, apres, n)
+	]
 	return JsonResponse({'creneaux': creneaux})
 
 
@@ -223,10 +421,7 @@ def rdv_creneaux_api(request):
 def rdv_create(request):
 	if request.method == 'POST':
 		form = RendezVousForm(request.POST)
-		if form.is_valid():
-			rdv = form.save(commit=False)
-			rdv.utilisateur = request.user
-			rdv.save()
+		if form.is_valid() and form.save_reservation(utilisateur=request.user):
 			messages.success(request, 'Rendez-vous créé')
 			return redirect('rdv_list')
 	else:
@@ -248,8 +443,7 @@ def rdv_create(request):
 @login_required
 @require_POST
 def rdv_patient_annuler(request, pk):
-	profile = getattr(request.user, 'profile', None)
-	if profile and profile.role in ('agent', 'admin'):
+	if get_principal(request).est_personnel:
 		messages.error(request, 'Utilisez l’espace réception pour gérer les rendez-vous.')
 		return redirect('extranet')
 	rdv = get_object_or_404(Rendez_vous, pk=pk, utilisateur=request.user)
@@ -270,8 +464,7 @@ def rdv_patient_annuler(request, pk):
 def rdv_patient_modifier(request, pk):
 	from datetime import datetime as dt_module
 
-	profile = getattr(request.user, 'profile', None)
-	if profile and profile.role in ('agent', 'admin'):
+	if get_principal(request).est_personnel:
 		messages.error(request, 'Action réservée aux patients.')
 		return redirect('extranet')
 	rdv = get_object_or_404(Rendez_vous, pk=pk, utilisateur=request.user)
@@ -283,8 +476,7 @@ def rdv_patient_modifier(request, pk):
 		return redirect('rdv_list')
 	if request.method == 'POST':
 		form = RendezVousForm(request.POST, instance=rdv, exclude_rdv_pk=rdv.pk)
-		if form.is_valid():
-			form.save()
+		if form.is_valid() and form.save_reservation():
 			messages.success(request, 'Votre rendez-vous a été modifié.')
 			return redirect('rdv_list')
 	else:
@@ -319,24 +511,28 @@ def rdv_patient_modifier(request, pk):
 
 
 @login_required
+@conditionnel(marqueurs.RDV, marqueurs.PATIENTS, prive=True)
 def rdv_next(request):
 	"""Show next rendez-vous in queue (global for admin, per-user otherwise)."""
-	next_obj = Rendez_vous.objects.next_in_queue(user=request.user)
+	# Rôle déjà résolu : next_in_queue n'a pas à relire le profil (file globale sans profil ou admin)
+	principal = get_principal(request)
+	global_ = principal.role in (None, 'admin')
+	next_obj = Rendez_vous.objects.next_in_queue(user=None if global_ else request.user)
 	return render(request, 'rdv/next.html', {'next': next_obj})
 
 
 @login_required
+@conditionnel(marqueurs.RDV, marqueurs.PATIENTS, prive=True)
 def file_attente_view(request):
 	"""Page file d'attente : Patient numéro 1, 2, 3... avec position du patient connecté."""
 	queue = _queue_ordered()
 	queue_entries = []
-	for i, rdv in enumerate(queue, 1):
-		nom = _patient_display_name(rdv.utilisateur)
+	for rdv in queue:
 		is_me = rdv.utilisateur_id == request.user.id
 		queue_entries.append({
 			'rdv': rdv,
-			'position': i,
-			'label': 'Vous' if is_me else nom,
+			'position': rdv.position_file,
+			'label': 'Vous' if is_me else rdv.patient_nom,
 			'is_me': is_me,
 		})
 	return render(request, 'rdv/file_attente.html', {'queue_entries': queue_entries})
@@ -345,20 +541,70 @@ def file_attente_view(request):
 @login_required
 def agent_file_attente_view(request):
 	"""File d'attente pour l'agent : Patient numéro 1, 2, 3... + confirmer passage chez le médecin."""
-	if not _is_agent(request.user):
+	if not _is_agent(request):
 		return redirect('extranet')
 	queue = _queue_ordered()
 	queue_entries = []
-	for i, rdv in enumerate(queue, 1):
-		nom = _patient_display_name(rdv.utilisateur)
+	for rdv in queue:
 		queue_entries.append({
 			'rdv': rdv,
-			'position': i,
-			'label': nom,
+			'position': rdv.position_file,
+			'label': rdv.patient_nom,
 		})
 	return render(request, 'rdv/agent_file_attente.html', {'queue_entries': queue_entries})
 
 
+def _sse(message):
+	import json
+	return f"data: {json.dumps(message, ensure_ascii=False)}\n\n"
+
+
+@login_required
+async def file_attente_flux(request):
+	"""
+	Flux SSE de la file d'attente : état complet à la connexion puis diffs à chaque changement.
+	À servir via ASGI (backend/asgi.py) : la connexion reste ouverte. Sous WSGI, ou si
+	RDV_FLUX_TEMPS_REEL est coupé, répond 204 (EventSource cesse alors de se reconnecter).
+	"""
+	import asyncio
+	from asgiref.sync import sync_to_async
+	from .temps_reel import flux_disponible, get_bus
+
+	if not flux_disponible(request):
+		return HttpResponse(status=204)
+	bus = get_bus()
+
+	async def flux():
+		q = bus.abonner()
+		try:
+			yield 'retry: 5000\n\n'
+			yield _sse(await sync_to_async(bus.etat_courant)())
+			while True:
+				try:
+					message = await asyncio.wait_for(q.get(), timeout=25)
+				except asyncio.TimeoutError:
+					yield ': ping\n\n'
+					continue
+				yield _sse(message)
+		finally:
+			bus.desabonner(q)
+
+	response = StreamingHttpResponse(flux(), content_type='text/event-stream')
+	response['Cache-Control'] = 'no-cache'
+	response['X-Accel-Buffering'] = 'no'  # Nginx : ne pas bufferiser le flux
+	return response
+
+
+@login_required
+@require_GET
+@conditionnel(marqueurs.RDV, marqueurs.PATIENTS)
+def file_attente_etat(request):
+	"""État complet de la file (même format que le message 'init' du flux), pour les écrans sans SSE."""
+	from .temps_reel import instantane_file
+
+	return JsonResponse({'type': 'init', 'entrees': list(instantane_file().values())})
+
+
 @staff_member_required
 def admin_dashboard(request):
 	"""Admin dashboard - Statistique.generer_rapport, superviser RDV."""
@@ -380,6 +626,58 @@ def admin_dashboard(request):
 	return render(request, 'rdv/admin_dashboard.html', context)
 
 
+@staff_member_required
+@require_GET
+def admin_rapport_api(request):
+	"""Rapport détaillé (JSON) : ?debut=AAAA-MM-JJ&fin=AAAA-MM-JJ, par défaut les 365 derniers jours."""
+	from datetime import date
+
+	fin = cabinet_local_today()
+	debut = fin - timedelta(days=364)
+	try:
+		if request.GET.get('fin'):
+			fin = date.fromisoformat(request.GET['fin'])
+		if request.GET.get('debut'):
+			debut = date.fromisoformat(request.GET['debut'])
+	except ValueError:
+		return JsonResponse({'error': 'Dates attendues au format AAAA-MM-JJ.'}, status=400)
+	if debut > fin or (fin - debut).days > 3 * 366:
+		return JsonResponse({'error': 'Période invalide (3 ans maximum).'}, status=400)
+	return JsonResponse(Statistique.rapport_detaille(debut, fin))
+
+
+@staff_member_required
+@require_GET
+def rdv_export(request):
+	"""Export des RDV en flux : ?format=csv|jsonl&debut=AAAA-MM-JJ&fin=AAAA-MM-JJ&status=..."""
+	from datetime import date
+	from .export import FORMATS, lignes_export, rdv_a_exporter
+
+	format = request.GET.get('format', 'csv')
+	if format not in FORMATS:
+		return JsonResponse({'error': 'Format attendu : csv ou jsonl.'}, status=400)
+	try:
+		debut = date.fromisoformat(request.GET['debut']) if request.GET.get('debut') else None
+		fin = date.fromisoformat(request.GET['fin']) if request.GET.get('fin') else None
+	except ValueError:
+		return JsonResponse({'error': 'Dates attendues au format AAAA-MM-JJ.'}, status=400)
+	lignes = rdv_a_exporter(debut, fin, request.GET.getlist('status') or None)
+	content_type = 'text/csv; charset=utf-8' if format == 'csv' else 'application/x-ndjson; charset=utf-8'
+	response = StreamingHttpResponse(lignes_export(lignes, format), content_type=content_type)
+	response['Content-Disposition'] = f'attachment; filename="rendez-vous.{format}"'
+	return response
+
+
+@require_GET
+def metriques_view(request):
+	"""Métriques du processus au format texte Prometheus : staff, ou IP listée dans RDV_METRIQUES_IPS."""
+	from .metriques import exposer
+
+	if not get_principal(request).is_staff and request.META.get('REMOTE_ADDR') not in getattr(dj_settings, 'RDV_METRIQUES_IPS', ()):
+		return HttpResponse(status=403)
+	return HttpResponse(exposer(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def signup_view(request):
 	"""Simple signup to create a user with a role (admin/agent/user). Prénom et Nom pour le message Bienvenue."""
 	from django.contrib.auth.models import User
@@ -401,7 +699,7 @@ def signup_view(request):
 			messages.error(request, 'Les mots de passe ne correspondent pas')
 			return render(request, 'rdv/signup.html')
 
-		if User.objects.filter(email=email).exists():
+		if Utilisateur.objects.filter(email_normalise=normaliser_email(email)).exists() or User.objects.filter(username=email).exists():
 			messages.info(request, 'Un compte avec cet email existe déjà. Connectez-vous.')
 			return redirect('login')
 